@@ -20,6 +20,7 @@ import fiona  # type: ignore  # noqa: PGH003
 import requests
 
 from iceaddr.geo import in_iceland, valid_wgs84_coord
+from iceaddr.placenames import placename_rank
 
 ORNEFNI_DATA_FILE = "is_50v_ornefni_wgs_84.gpkg"
 ORNEFNI_DATA_URL = "https://atlas.lmi.is/heikir/downloadData/is_50v_ornefni_wgs_84_gpkg.zip"
@@ -82,7 +83,8 @@ def create_table(dbpath: str) -> sqlite3.Connection:
         nafn TEXT,
         flokkur TEXT,
         lat_wgs84 REAL,
-        long_wgs84 REAL
+        long_wgs84 REAL,
+        rank INTEGER
     );
     """
 
@@ -91,7 +93,8 @@ def create_table(dbpath: str) -> sqlite3.Connection:
 
         # Create indexes for common query patterns
         index_queries = [
-            "CREATE INDEX idx_ornefni_nafn ON ornefni(nafn);",
+            # Placenames with a given name, in order of precedence
+            "CREATE INDEX idx_ornefni_nafn_rank ON ornefni(nafn, rank);",
             "CREATE INDEX idx_ornefni_flokkur ON ornefni(flokkur);",
         ]
 
@@ -111,6 +114,17 @@ def create_table(dbpath: str) -> sqlite3.Connection:
         for query in rtree_queries:
             dbconn.cursor().execute(query)
 
+        # Create full-text index of placenames, with trigram tokenization
+        # for case-insensitive substring matching. The index refers to the
+        # ornefni table for its content rather than storing a copy of it.
+        dbconn.cursor().execute(
+            """
+            CREATE VIRTUAL TABLE ornefni_fts USING fts5(
+                nafn, content='ornefni', content_rowid='id', tokenize='trigram'
+            );
+            """
+        )
+
     except Exception:
         print("Unable to create table 'ornefni'")
         sys.exit()
@@ -130,6 +144,8 @@ def delete_table(dbpath: str) -> sqlite3.Connection:
     except Exception:  # noqa: S110
         pass
 
+    dbconn.cursor().execute("DROP TABLE IF EXISTS ornefni_fts")
+
     return dbconn
 
 
@@ -242,6 +258,19 @@ def add_placenames_from_is50v(dbc: sqlite3.Connection) -> None:
             dbc.commit()
 
 
+def add_ranks(dbc: sqlite3.Connection) -> None:
+    """Precompute the sort priority of each placename, so that lookups are
+    ordered by the database rather than by sorting all matches in Python."""
+    print("Ranking placenames")
+    dbc.row_factory = sqlite3.Row
+    rows = dbc.execute("SELECT id, nafn, flokkur, lat_wgs84, long_wgs84 FROM ornefni").fetchall()
+    dbc.row_factory = None
+    dbc.executemany(
+        "UPDATE ornefni SET rank=? WHERE id=?", [(placename_rank(dict(r)), r["id"]) for r in rows]
+    )
+    dbc.commit()
+
+
 def main() -> None:
     # Fetch placename data from remote URL
     fetch_ornefni_data()
@@ -257,6 +286,7 @@ def main() -> None:
 
     add_placename_additions(dbc)
     add_placenames_from_is50v(dbc)
+    add_ranks(dbc)
 
     print("Populating R-Tree index...")
     dbc.execute(
@@ -268,6 +298,10 @@ def main() -> None:
     )
     dbc.commit()
 
+    print("Populating full-text index...")
+    dbc.execute("INSERT INTO ornefni_fts (ornefni_fts) VALUES ('rebuild');")
+    dbc.commit()
+
     # Analyze the database to optimize index usage
     dbc.execute("ANALYZE;")
 
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark event loop lag under concurrent autocomplete requests.
+
+Runs N concurrent iceaddr_suggest() requests, once calling the blocking
+function directly from coroutines and once via iceaddr.aio, while a
+ticker task measures how late the event loop wakes it up.
+
+Usage:
+    python benchmarks/bench_aio.py [concurrent_requests]
+
+"""
+
+from typing import Any, Awaitable, Callable
+
+import asyncio
+import random
+import sys
+import time
+
+from iceaddr import aio, iceaddr_suggest
+
+PREFIXES = ["Öldu", "Lauga", "Hring", "Báru", "Hverfis", "Grundar", "Skóla", "Kirkju"]
+TICK = 0.001
+
+
+async def ticker(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - t0 - TICK)
+
+
+async def run(num: int, suggest: Callable[[str], Awaitable[Any]]) -> tuple[float, float]:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    tick_task = asyncio.create_task(ticker(lags, stop))
+    await asyncio.sleep(TICK * 2)
+
+    rnd = random.Random(1)
+    t0 = time.perf_counter()
+    await asyncio.gather(*[suggest(rnd.choice(PREFIXES)) for _ in range(num)])
+    elapsed = time.perf_counter() - t0
+
+    stop.set()
+    await tick_task
+    lags.sort()
+    return (elapsed, lags[int(len(lags) * 0.99)] if lags else 0.0)
+
+
+async def blocking_suggest(s: str) -> Any:
+    return iceaddr_suggest(s)
+
+
+def main() -> None:
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    for name, func in (("blocking", blocking_suggest), ("aio", aio.iceaddr_suggest)):
+        (elapsed, p99) = asyncio.run(run(num, func))
+        print(
+            f"{name:<9} {num} requests | total: {elapsed * 1000:8.1f} ms | "
+            f"p99 event loop lag: {p99 * 1000:8.2f} ms"
+        )
+    aio.shutdown()
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark batch reverse geocoding against a loop of single lookups.
+
+Compares nearest_addr_batch() with calling nearest_addr() once per point,
+for GPS-ping-like point sets around Reykjavík and across the country.
+
+Usage:
+    python benchmarks/bench_batch.py [num_points]
+
+"""
+
+import random
+import sys
+import time
+
+from iceaddr import nearest_addr, nearest_addr_batch
+
+# (lat, lon, spread in degrees)
+AREAS = {
+    "reykjavik": (64.13, -21.89, 0.05),
+    "iceland": (64.9, -18.6, 1.5),
+}
+
+
+def random_points(area: str, num: int) -> list[tuple[float, float]]:
+    (lat, lon, spread) = AREAS[area]
+    rnd = random.Random(1)
+    return [
+        (lat + rnd.uniform(-spread, spread) / 2, lon + rnd.uniform(-spread, spread))
+        for _ in range(num)
+    ]
+
+
+def bench(area: str, num: int) -> None:
+    points = random_points(area, num)
+
+    t0 = time.perf_counter()
+    loop_res = [nearest_addr(lat, lon) for lat, lon in points]
+    t_loop = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch_res = nearest_addr_batch(points)
+    t_batch = time.perf_counter() - t0
+
+    same = sum(a == b for a, b in zip(loop_res, batch_res))
+    print(
+        f"{area:<10} {num:>7} points | "
+        f"loop: {num / t_loop:>9.0f} pts/s | "
+        f"batch: {num / t_batch:>9.0f} pts/s | "
+        f"speedup: {t_loop / t_batch:5.1f}x | "
+        f"identical: {same}/{num}"
+    )
+
+
+def main() -> None:
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    # Warm up connection and page cache
+    nearest_addr(64.1, -21.9)
+    for area in AREAS:
+        bench(area, num)
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
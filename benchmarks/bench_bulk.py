@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark bulk geocoding of address strings.
+
+Builds a list of address strings from the database in a mix of formats,
+with a skewed distribution so that some addresses repeat, and compares
+looking them up one at a time with iceaddr_suggest() with the streaming
+bulk geocoder. Also reports the throughput of each chunk, to show
+that it stays steady throughout.
+
+Usage:
+    python benchmarks/bench_bulk.py [num_rows]
+
+"""
+
+import random
+import statistics
+import sys
+import time
+
+from iceaddr import iceaddr_suggest
+from iceaddr.bulk import DEFAULT_CHUNK_SIZE, BulkGeocoder
+from iceaddr.db import shared_db
+
+
+def addresses(n: int) -> list[str]:
+    q = "SELECT heiti_nf, heiti_tgf, husnr, bokst, postnr FROM stadfong WHERE husnr IS NOT NULL"
+    rows = shared_db.connection().execute(q).fetchall()
+    rnd = random.Random(1)
+    res = []
+    for _ in range(n):
+        # Zipf-like distribution over addresses
+        r = rows[min(int(rnd.paretovariate(1.2)) - 1, len(rows) - 1) * 7919 % len(rows)]
+        fmt = rnd.choice(
+            (
+                "{nf} {nr}{b}",
+                "{tgf} {nr}{b}, {pn}",
+                "{nf} {nr}, {pn}",
+                "{nf} {nr}",
+            )
+        )
+        res.append(fmt.format(nf=r[0], tgf=r[1], nr=r[2], b=r[3] or "", pn=r[4]))
+    return res
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    addrs = addresses(n)
+
+    # One at a time, on a sample, since it's slow
+    sample = addrs[: min(n, 10000)]
+    t0 = time.perf_counter()
+    for a in sample:
+        iceaddr_suggest(a, limit=1)
+    single = len(sample) / (time.perf_counter() - t0)
+
+    geocoder = BulkGeocoder()
+    rates: list[float] = []
+    it = iter(geocoder.geocode(addrs))
+    t0 = time.perf_counter()
+    t_chunk = t0
+    for i, _ in enumerate(it, start=1):
+        if i % DEFAULT_CHUNK_SIZE == 0:
+            now = time.perf_counter()
+            rates.append(DEFAULT_CHUNK_SIZE / (now - t_chunk))
+            t_chunk = now
+    bulk = n / (time.perf_counter() - t0)
+
+    print(f"iceaddr_suggest(): {single:9.0f} rows/sec")
+    print(f"Bulk geocoder:     {bulk:9.0f} rows/sec ({bulk / single:.1f}x)")
+    if len(rates) > 1:
+        print(
+            f"Per chunk:         min {min(rates):.0f}, median {statistics.median(rates):.0f}, "
+            f"max {max(rates):.0f} rows/sec"
+        )
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
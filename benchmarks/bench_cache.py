@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark the lookup result cache on a skewed query mix.
+
+Draws lookups from a Zipf-like distribution over street names, numbers
+and placenames, so that a small number of queries make up most of the
+traffic, and reports throughput with and without the cache, along with
+the cache counters.
+
+Usage:
+    python benchmarks/bench_cache.py [num_lookups] [max_entries]
+
+"""
+
+import random
+import sys
+import time
+
+from iceaddr import (
+    cache_stats,
+    disable_cache,
+    enable_cache,
+    iceaddr_lookup,
+    iceaddr_suggest,
+    placename_lookup,
+)
+from iceaddr.db import shared_db
+
+
+def queries(n: int) -> list[tuple[str, str, int]]:
+    cur = shared_db.connection().cursor()
+    streets = [r[0] for r in cur.execute("SELECT DISTINCT heiti_nf FROM stadfong LIMIT 2000")]
+    places = [r[0] for r in cur.execute("SELECT DISTINCT nafn FROM ornefni LIMIT 2000")]
+    rnd = random.Random(1)
+    # Zipf-like weights, most traffic goes to the first few names
+    sw = [1 / (i + 1) for i in range(len(streets))]
+    pw = [1 / (i + 1) for i in range(len(places))]
+    res = []
+    for _ in range(n):
+        kind = rnd.choice(("lookup", "suggest", "placename"))
+        name = rnd.choices(places, pw)[0] if kind == "placename" else rnd.choices(streets, sw)[0]
+        res.append((kind, name, rnd.randint(1, 20)))
+    return res
+
+
+def run(qs: list[tuple[str, str, int]]) -> float:
+    t0 = time.perf_counter()
+    for kind, name, num in qs:
+        if kind == "lookup":
+            iceaddr_lookup(name, number=num)
+        elif kind == "suggest":
+            iceaddr_suggest(f"{name} {num}")
+        else:
+            placename_lookup(name)
+    return len(qs) / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    max_entries = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    qs = queries(n)
+
+    disable_cache()
+    uncached = run(qs)
+    enable_cache(max_entries=max_entries)
+    cached = run(qs)
+
+    print(f"No cache: {uncached:9.0f} lookups/sec")
+    print(f"Cache:    {cached:9.0f} lookups/sec ({cached / uncached:.1f}x)")
+    print(cache_stats())
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark distance calculation for arrays of coordinates.
+
+Compares calling the scalar distance() function for each point with
+distance_many(), which uses NumPy if installed and otherwise a plain
+loop over arrays, for 10k to 1M points.
+
+Usage:
+    python benchmarks/bench_distance.py [max_points]
+
+"""
+
+import random
+import sys
+import time
+
+from iceaddr.geo import distance, distance_many, distance_matrix, np
+
+ORIGIN = (64.1466, -21.9426)
+
+
+def main() -> None:
+    max_points = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"Using NumPy: {np is not None}")
+
+    rnd = random.Random(1)
+    n = 10_000
+    while n <= max_points:
+        lats = [rnd.uniform(63.3, 66.6) for _ in range(n)]
+        lons = [rnd.uniform(-24.5, -13.5) for _ in range(n)]
+
+        t0 = time.perf_counter()
+        for lat, lon in zip(lats, lons):
+            distance(ORIGIN, (lat, lon))
+        t_scalar = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        distance_many(ORIGIN, lats, lons)
+        t_many = time.perf_counter() - t0
+
+        print(
+            f"{n:>9} points | distance(): {t_scalar * 1000:8.1f} ms | "
+            f"distance_many(): {t_many * 1000:8.1f} ms | speedup: {t_scalar / t_many:5.1f}x"
+        )
+        n *= 10
+
+    a = [(rnd.uniform(63.3, 66.6), rnd.uniform(-24.5, -13.5)) for _ in range(1000)]
+    t0 = time.perf_counter()
+    distance_matrix(a, a)
+    print(f"distance_matrix(): 1000 x 1000 in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark substring search of placenames and street names.
+
+Compares matching with "nafn LIKE '%...%'", which can't use an index
+and so scans the whole ornefni table, with finding candidates in the
+trigram full-text index, as done by placename_lookup(partial=True),
+and reports latency of the BM25-ranked placename_search() and
+iceaddr_search() functions.
+
+Usage:
+    python benchmarks/bench_fts.py [iterations]
+
+"""
+
+from typing import Any, Callable
+
+import sys
+import time
+
+from iceaddr import iceaddr_search, placename_lookup, placename_search
+from iceaddr.db import dict_rows, shared_db
+
+QUERIES = ["fell", "heiði", "Meðalfell", "vatn", "jökull", "ldugöt", "stræti", "kirkja"]
+
+
+def like_lookup(s: str) -> list[dict[str, Any]]:
+    cur = shared_db.connection().cursor()
+    return dict_rows(cur.execute("SELECT * FROM ornefni WHERE nafn LIKE ?", [f"%{s}%"]))
+
+
+def timed(func: Callable[[str], Any], iterations: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        for q in QUERIES:
+            func(q)
+    return (time.perf_counter() - t0) / (iterations * len(QUERIES)) * 1000
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    funcs: list[tuple[str, Callable[[str], Any]]] = [
+        ("LIKE '%...%' (full scan)", like_lookup),
+        ("placename_lookup(partial=True)", lambda s: placename_lookup(s, partial=True)),
+        ("placename_search()", placename_search),
+        ("iceaddr_search()", iceaddr_search),
+    ]
+    for name, func in funcs:
+        print(f"{name:<32} {timed(func, iterations):8.2f} ms/query")
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark typo-tolerant matching of street names.
+
+Compares finding street names within the max edit distance of misspelled
+search strings by computing the edit distance to every street name with
+looking them up in the symmetric delete index used by fuzzy lookups, and
+reports the size and build time of the index.
+
+Usage:
+    python benchmarks/bench_fuzzy.py [iterations]
+
+"""
+
+from typing import Any, Callable
+
+import sys
+import time
+
+from iceaddr.fuzzy import (
+    STREET_MAX_DISTANCE,
+    edit_distance,
+    fuzzy_index,
+    fuzzy_index_stats,
+    fuzzy_matches,
+)
+from iceaddr.text import fold
+
+QUERIES = ["Oldugata", "Laugavegr", "Hafnarfjordur", "Bankastraeti", "Skolavordustig", "Hringbrut"]
+
+
+def scan(s: str) -> list[str]:
+    q = fold(s)
+    idx = fuzzy_index("streets")
+    return [
+        name
+        for key, names in zip(idx.keys, idx.names)
+        if edit_distance(q, key, STREET_MAX_DISTANCE) <= STREET_MAX_DISTANCE
+        for name in names
+    ]
+
+
+def timed(func: Callable[[str], Any], iterations: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        for q in QUERIES:
+            func(q)
+    return (time.perf_counter() - t0) / (iterations * len(QUERIES)) * 1e6
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    fuzzy_index("streets")
+    stats = fuzzy_index_stats()["streets"]
+    print(
+        f"Index: {stats['names']} names, {stats['deletes']} deletes, "
+        f"{stats['memory_bytes'] / 1e6:.1f} MB, built in {stats['build_time']:.2f} s\n"
+    )
+
+    funcs: list[tuple[str, Callable[[str], Any]]] = [
+        ("Edit distance to all names", scan),
+        ("Symmetric delete index", lambda s: fuzzy_matches("streets", s)),
+    ]
+    for name, func in funcs:
+        print(f"{name:<28} {timed(func, iterations):10.1f} µs/query")
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
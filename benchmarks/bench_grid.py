@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark the precomputed nearest address grid at different cell sizes.
+
+For each cell size, builds the grid in a temporary copy of the database
+and reports its size and build time, along with the latency of single
+nearest address lookups using the grid, compared with regular nearest
+neighbor search. Query points are scattered around random addresses,
+like positions of vehicles on the road network.
+
+Usage:
+    python benchmarks/bench_grid.py [num_queries] [max_dist_km]
+
+"""
+
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from iceaddr import grid
+from iceaddr.addresses import postprocess_addr
+from iceaddr.db import shared_db
+from iceaddr.nearest import find_nearest
+
+CELL_SIZES = (0.004, 0.002, 0.001, 0.0005)
+
+
+def queries(n: int) -> list[tuple[float, float]]:
+    cur = shared_db.connection().cursor()
+    pts = list(cur.execute("SELECT lat_wgs84, long_wgs84 FROM stadfong"))
+    rnd = random.Random(1)
+    res = []
+    for _ in range(n):
+        (lat, lon) = rnd.choice(pts)
+        res.append((lat + rnd.uniform(-0.002, 0.002), lon + rnd.uniform(-0.004, 0.004)))
+    return res
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    max_dist = float(sys.argv[2]) if len(sys.argv) > 2 else grid.DEFAULT_GRID_MAX_DIST
+    qs = queries(n)
+
+    t0 = time.perf_counter()
+    for lat, lon in qs:
+        find_nearest(
+            lat, lon, "stadfong_rtree", "stadfong", "hnitnum", post_process=postprocess_addr
+        )
+    t_knn = (time.perf_counter() - t0) / n * 1e6
+    print(f"R-Tree nearest search: {t_knn:.1f} µs/lookup\n")
+
+    src = shared_db.connection()
+    print(
+        "Cell size  |    Cells | Cand./cell |     Size | Build time | Covered | µs/lookup | Speedup"
+    )
+    for cell_size in CELL_SIZES:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            conn = sqlite3.connect(Path(tmpdir) / "iceaddr.db", check_same_thread=False)
+            src.backup(conn)
+            stats = grid.build_grid(conn, cell_size=cell_size, max_dist=max_dist)
+
+            # Look up addresses in the copy with the grid
+            conn.row_factory = sqlite3.Row
+            shared_db.connection = lambda conn=conn: conn  # type: ignore[method-assign]
+            grid._cell_size = None
+
+            covered = sum(grid.grid_nearest(lat, lon) is not None for lat, lon in qs)
+            t0 = time.perf_counter()
+            for lat, lon in qs:
+                grid.grid_nearest(lat, lon, post_process=postprocess_addr)
+            t_grid = (time.perf_counter() - t0) / n * 1e6
+
+            del shared_db.connection
+            conn.close()
+
+        print(
+            f"{cell_size:<10} | {stats['cells']:8d} | {stats['candidates'] / stats['cells']:10.1f} | "
+            f"{stats['bytes'] / 1e6:5.1f} MB | {stats['build_time']:8.1f} s | "
+            f"{covered / n:6.1%} | {t_grid:9.1f} | {t_knn / t_grid:6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
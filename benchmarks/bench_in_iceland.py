@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark the in_iceland() point filter.
+
+Compares the legacy check, a distance of at most 800 km from the centre
+of Iceland, with the bounding box and EEZ polygon test, both for
+addresses on land and for random points in the North Atlantic, and
+reports how many of the random points the two checks disagree on.
+
+Usage:
+    python benchmarks/bench_in_iceland.py [num_points]
+
+"""
+
+from typing import Callable
+
+import random
+import sys
+import time
+
+from iceaddr.db import shared_db
+from iceaddr.geo import in_iceland, in_iceland_many, np
+
+Points = list[tuple[float, float]]
+
+
+def bench(func: Callable[[Points], list[bool]], points: Points) -> tuple[float, list[bool]]:
+    t0 = time.perf_counter()
+    res = func(points)
+    return (len(points) / (time.perf_counter() - t0), res)
+
+
+def legacy(points: Points) -> list[bool]:
+    return [in_iceland(p, km_radius=800.0) for p in points]
+
+
+def polygon(points: Points) -> list[bool]:
+    return [in_iceland(p) for p in points]
+
+
+def many(points: Points) -> list[bool]:
+    return list(in_iceland_many([p[0] for p in points], [p[1] for p in points]))
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    print(f"Using NumPy: {np is not None}")
+
+    q = "SELECT lat_wgs84, long_wgs84 FROM stadfong WHERE lat_wgs84 IS NOT NULL LIMIT ?"
+    land = [(r[0], r[1]) for r in shared_db.connection().execute(q, [n])]
+    rnd = random.Random(1)
+    sea = [(rnd.uniform(55.0, 75.0), rnd.uniform(-45.0, 5.0)) for _ in range(n)]
+
+    for name, points in (("land", land), ("atlantic", sea)):
+        (t_legacy, r_legacy) = bench(legacy, points)
+        (t_polygon, r_polygon) = bench(polygon, points)
+        (t_many, _) = bench(many, points)
+        diff = sum(a != b for a, b in zip(r_legacy, r_polygon))
+        print(
+            f"{name:<9} | radius: {t_legacy:9.0f} pts/s | polygon: {t_polygon:9.0f} pts/s | "
+            f"vectorized: {t_many:9.0f} pts/s | disagree: {diff}/{len(points)}"
+        )
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark using an in-memory copy of the database.
+
+Compares opening the database file directly with copying it into memory
+on first use, reporting startup time (until the first lookup returns),
+size of the in-memory copy, growth in peak resident memory, and warm
+query latency. Each mode runs in a fresh process.
+
+Usage:
+    python benchmarks/bench_in_memory.py [iterations]
+
+"""
+
+from typing import Any
+
+import json
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+
+def run(in_memory: bool, iterations: int) -> dict[str, Any]:
+    from iceaddr import iceaddr_lookup, nearest_addr
+    from iceaddr.db import shared_db
+
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    shared_db.configure(in_memory=in_memory)
+    t0 = time.perf_counter()
+    shared_db.warm_up()
+    iceaddr_lookup("Laugavegur", number=22)
+    startup = time.perf_counter() - t0
+    rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    rnd = random.Random(1)
+    timings: list[float] = []
+    for i in range(iterations):
+        t = time.perf_counter()
+        if i % 2:
+            iceaddr_lookup(rnd.choice(("Laugavegur", "Öldugata", "Hringbraut")), number=i % 40)
+        else:
+            nearest_addr(64.13 + rnd.uniform(-0.05, 0.05), -21.89 + rnd.uniform(-0.1, 0.1))
+        timings.append(time.perf_counter() - t)
+
+    return {
+        "startup": startup,
+        # ru_maxrss is in KiB on Linux
+        "rss_growth": (rss1 - rss0) * 1024,
+        "memory_bytes": shared_db.memory_stats().get("memory_bytes", 0),
+        "warm_mean": statistics.mean(timings),
+    }
+
+
+def main() -> None:
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        (in_memory, iterations) = json.loads(sys.argv[2])
+        print(json.dumps(run(in_memory, iterations)))
+        return
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    for name, in_memory in (("file", False), ("in-memory", True)):
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", json.dumps([in_memory, iterations])],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        r = json.loads(out.stdout)
+        print(
+            f"{name:<10} | startup: {r['startup'] * 1000:7.1f} ms | "
+            f"copy: {r['memory_bytes'] / 1e6:6.1f} MB | RSS growth: {r['rss_growth'] / 1e6:6.1f} MB | "
+            f"warm mean: {r['warm_mean'] * 1e6:6.1f} µs"
+        )
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark nearest address and placename lookup latency.
+
+Measures the k-nearest-neighbor search in dense areas (central
+Reykjavík), where the answer is found in the first search ring, and
+in the empty highlands, where the search has to grow far out.
+
+Usage:
+    python benchmarks/bench_nearest.py [iterations]
+
+"""
+
+import random
+import statistics
+import sys
+import time
+
+from iceaddr import nearest_addr, nearest_placenames
+
+# (lat, lon, spread in degrees)
+AREAS = {
+    "reykjavik": (64.1466, -21.9426, 0.02),
+    "highlands": (64.75, -18.0, 0.5),
+}
+
+
+def bench(func_name: str, area: str, limit: int, iterations: int) -> None:
+    func = nearest_addr if func_name == "addr" else nearest_placenames
+    (lat, lon, spread) = AREAS[area]
+    rnd = random.Random(1)
+    points = [
+        (lat + rnd.uniform(-spread, spread), lon + rnd.uniform(-spread, spread))
+        for _ in range(iterations)
+    ]
+
+    timings: list[float] = []
+    for plat, plon in points:
+        t0 = time.perf_counter()
+        func(plat, plon, limit=limit)
+        timings.append((time.perf_counter() - t0) * 1e6)
+
+    timings.sort()
+    print(
+        f"{func_name:<6} {area:<10} limit={limit:<3} | "
+        f"mean: {statistics.mean(timings):8.1f} µs | "
+        f"p50: {timings[len(timings) // 2]:8.1f} µs | "
+        f"p99: {timings[int(len(timings) * 0.99)]:8.1f} µs"
+    )
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    # Warm up connection and page cache
+    nearest_addr(64.1, -21.9)
+    nearest_placenames(64.1, -21.9)
+    for func_name in ("addr", "place"):
+        for area in AREAS:
+            for limit in (1, 10):
+                bench(func_name, area, limit, iterations)
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark paging through placename lookup results, and streaming them.
+
+Compares fetching all pages of a partial placename lookup matching
+thousands of placenames by skipping offset placenames, which steps
+through all of the skipped ones, with passing the last placename of the
+previous page as after. Also compares the peak memory use of fetching
+all matches as a list with iterating over placename_lookup_iter().
+
+Usage:
+    python benchmarks/bench_pagination.py [page size]
+
+"""
+
+from typing import Any, Callable
+
+import sys
+import time
+import tracemalloc
+
+from iceaddr import placename_lookup, placename_lookup_iter
+
+QUERY = "ey"
+
+
+def offset_pages(page_size: int) -> int:
+    (num, page) = (0, placename_lookup(QUERY, partial=True, limit=page_size))
+    while page:
+        num += 1
+        page = placename_lookup(QUERY, partial=True, limit=page_size, offset=num * page_size)
+    return num
+
+
+def keyset_pages(page_size: int) -> int:
+    (num, page) = (0, placename_lookup(QUERY, partial=True, limit=page_size))
+    while page:
+        num += 1
+        page = placename_lookup(QUERY, partial=True, limit=page_size, after=page[-1])
+    return num
+
+
+def peak_memory(func: Callable[[], Any]) -> float:
+    tracemalloc.start()
+    func()
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def main() -> None:
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    num = len(placename_lookup(QUERY, partial=True))
+    print(f'{num} placenames containing "{QUERY}", {page_size} per page\n')
+
+    for name, func in (("limit/offset", offset_pages), ("after (keyset)", keyset_pages)):
+        t0 = time.perf_counter()
+        pages = func(page_size)
+        ms = (time.perf_counter() - t0) / pages * 1000
+        print(f"{name:<24} {ms:8.2f} ms/page")
+
+    print()
+    funcs: list[tuple[str, Callable[[], Any]]] = [
+        ("placename_lookup()", lambda: sum(1 for _ in placename_lookup(QUERY, partial=True))),
+        (
+            "placename_lookup_iter()",
+            lambda: sum(1 for _ in placename_lookup_iter(QUERY, partial=True)),
+        ),
+    ]
+    for name, func in funcs:
+        print(f"{name:<24} {peak_memory(func):8.3f} MB peak")
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark ordering placename lookups by precedence, for common names
+shared by many placenames.
+
+Compares fetching all placenames with a name and sorting them with
+placename_rank() in Python, as done before the rank column was added, with
+placename_lookup(), which has the database order them by the precomputed
+rank column, with and without a limit.
+
+Usage:
+    python benchmarks/bench_placenames.py [iterations]
+
+"""
+
+from typing import Any, Callable
+
+import sys
+import time
+
+from iceaddr import placename_lookup
+from iceaddr.db import dict_rows, shared_db
+from iceaddr.placenames import placename_rank
+
+QUERIES = ["Bakki", "Hóll", "Fell", "Nes", "Hraun", "Holt"]
+
+
+def python_sort(s: str) -> list[dict[str, Any]]:
+    cur = shared_db.connection().cursor()
+    matches = dict_rows(cur.execute("SELECT * FROM ornefni WHERE nafn=?", [s]))
+    matches.sort(key=placename_rank)
+    return matches
+
+
+def timed(func: Callable[[str], Any], iterations: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        for q in QUERIES:
+            func(q)
+    return (time.perf_counter() - t0) / (iterations * len(QUERIES)) * 1000
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    num = sum(len(placename_lookup(q)) for q in QUERIES) / len(QUERIES)
+    print(f"{num:.0f} placenames per name on average\n")
+
+    funcs: list[tuple[str, Callable[[str], Any]]] = [
+        ("Sorted by placename_rank()", python_sort),
+        ("ORDER BY rank", placename_lookup),
+        ("ORDER BY rank LIMIT 5", lambda s: placename_lookup(s, limit=5)),
+    ]
+    for name, func in funcs:
+        print(f"{name:<28} {timed(func, iterations):8.3f} ms/lookup")
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
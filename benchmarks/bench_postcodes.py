@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark partial placename lookups of postcodes, keystroke by
+keystroke, as done by iceaddr_suggest() for the placename after a comma.
+
+Compares the previous scan of all names with str.startswith() with
+bisecting the sorted name index, and with the cached lookups done by
+postcodes_for_placename(partial=True).
+
+Usage:
+    python benchmarks/bench_postcodes.py [iterations]
+
+"""
+
+from typing import Any, Callable
+
+import sys
+import time
+
+from iceaddr import POSTCODES, postcodes_for_placename
+from iceaddr.postcodes import _name_index
+from iceaddr.text import fold
+
+WORDS = ["Reykjavík", "Kópavogi", "Hafnarfirði", "Akureyri", "Egilsstöðum", "Selfossi"]
+PREFIXES = [w[:i] for w in WORDS for i in range(1, len(w) + 1)]
+
+NAMES: dict[str, list[int]] = {}
+for code, data in POSTCODES.items():
+    for k in ("stadur_nf", "stadur_tgf"):
+        NAMES.setdefault(data[k].lower(), []).append(code)
+
+
+def scan(prefix: str) -> list[int]:
+    s = prefix.lower()
+    return sorted({c for name, codes in NAMES.items() if name.startswith(s) for c in codes})
+
+
+def timed(func: Callable[[str], Any], iterations: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        for p in PREFIXES:
+            func(p)
+    return (time.perf_counter() - t0) / (iterations * len(PREFIXES)) * 1e6
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    idx = _name_index("placename")
+    funcs: list[tuple[str, Callable[[str], Any]]] = [
+        ("startswith() scan", scan),
+        ("Bisect index (uncached)", lambda s: idx.prefix(fold(s))),
+        ("postcodes_for_placename()", lambda s: postcodes_for_placename(s, partial=True)),
+    ]
+    for name, func in funcs:
+        print(f"{name:<28} {timed(func, iterations):8.2f} µs/lookup")
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
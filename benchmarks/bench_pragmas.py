@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark SQLite connection settings of the shared database.
+
+For each setting, measures cold start (opening a connection, applying
+the settings and running the first lookup) and warm query latency for
+a mix of address lookups, suggestions and nearest-neighbor searches.
+Cold start is measured in a fresh process each time, though the
+database file will usually still be in the OS page cache.
+
+Usage:
+    python benchmarks/bench_pragmas.py [iterations]
+
+"""
+
+from typing import Any
+
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+SETTINGS: dict[str, dict[str, Any]] = {
+    "defaults": {},
+    "mmap 256 MB": {"mmap_size": 256 * 1024 * 1024},
+    "cache 64 MB": {"cache_size": -64 * 1024},
+    "immutable": {"immutable": True},
+    "temp_store memory": {"temp_store": "memory"},
+    "query_only": {"query_only": True},
+    "all": {
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "immutable": True,
+        "temp_store": "memory",
+        "query_only": True,
+    },
+}
+
+
+def run(settings: dict[str, Any], iterations: int) -> dict[str, float]:
+    """Run in a fresh process: time first lookup, then warm lookups."""
+    t0 = time.perf_counter()
+    from iceaddr import iceaddr_lookup, iceaddr_suggest, nearest_addr
+    from iceaddr.db import shared_db
+
+    shared_db.configure(**settings)
+    t1 = time.perf_counter()
+    iceaddr_lookup("Laugavegur", number=22)
+    cold = time.perf_counter() - t1
+
+    rnd = random.Random(1)
+    timings: list[float] = []
+    for i in range(iterations):
+        t = time.perf_counter()
+        if i % 3 == 0:
+            iceaddr_lookup(rnd.choice(("Laugavegur", "Öldugata", "Hringbraut")), number=i % 40)
+        elif i % 3 == 1:
+            iceaddr_suggest(rnd.choice(("Öldug", "Laugav", "Hafnarstr")))
+        else:
+            nearest_addr(64.13 + rnd.uniform(-0.05, 0.05), -21.89 + rnd.uniform(-0.1, 0.1))
+        timings.append(time.perf_counter() - t)
+
+    return {
+        "import": t1 - t0,
+        "cold": cold,
+        "warm_mean": statistics.mean(timings),
+        "warm_p99": sorted(timings)[int(len(timings) * 0.99)],
+    }
+
+
+def main() -> None:
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        (settings, iterations) = json.loads(sys.argv[2])
+        print(json.dumps(run(settings, iterations)))
+        return
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    for name, settings in SETTINGS.items():
+        out = subprocess.run(
+            [sys.executable, __file__, "--child", json.dumps([settings, iterations])],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        r = json.loads(out.stdout)
+        print(
+            f"{name:<18} | cold: {r['cold'] * 1000:6.2f} ms | "
+            f"warm mean: {r['warm_mean'] * 1e6:7.1f} µs | warm p99: {r['warm_p99'] * 1e6:7.1f} µs"
+        )
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
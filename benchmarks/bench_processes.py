@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark scaling of multiprocess batch reverse geocoding.
+
+Runs nearest_addr_batch() and nearest_placenames_batch() on the same
+set of points spread across Iceland with 1 to N worker processes,
+and reports throughput and speedup over a single process.
+
+Usage:
+    python benchmarks/bench_processes.py [num_points] [max_processes]
+
+"""
+
+import os
+import random
+import sys
+import time
+
+from iceaddr import nearest_addr_batch, nearest_placenames_batch
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    max_procs = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+
+    rnd = random.Random(1)
+    points = [(rnd.uniform(63.4, 66.5), rnd.uniform(-24.0, -13.6)) for _ in range(n)]
+
+    # 1, 2, 4, ... up to and including max_procs
+    counts = sorted(
+        {2**i for i in range(max_procs.bit_length()) if 2**i <= max_procs} | {max_procs}
+    )
+
+    for name, func in (("addr", nearest_addr_batch), ("place", nearest_placenames_batch)):
+        base = 0.0
+        for procs in counts:
+            t0 = time.perf_counter()
+            func(points, processes=procs)
+            rate = n / (time.perf_counter() - t0)
+            base = base or rate
+            print(
+                f"{name:<6} processes={procs:<3} | {rate:9.0f} pts/s | speedup: {rate / base:4.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
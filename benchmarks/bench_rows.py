@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+
+Micro-benchmark the per-row cost of turning database rows into dicts.
+
+Compares the previous row factory, which built a dict for every row and
+was then copied again by callers, with sqlite3.Row rows converted to
+dicts once, using column names read once per query.
+
+Usage:
+    python benchmarks/bench_rows.py [iterations]
+
+"""
+
+from typing import Any, Callable
+
+import sqlite3
+import sys
+import time
+
+from iceaddr.db import dict_rows, shared_db
+
+QUERIES = {
+    "street (limit 50)": ("SELECT * FROM stadfong WHERE heiti_nf=? LIMIT 50", ["Öldugata"]),
+    "scan (limit 10000)": ("SELECT * FROM stadfong LIMIT 10000", []),
+}
+
+
+def legacy_factory(c: sqlite3.Cursor, r: tuple[Any, ...]) -> dict[str, Any]:
+    return dict(zip([col[0] for col in c.description], r))
+
+
+def legacy(conn: sqlite3.Connection, q: str, args: list[str]) -> list[dict[str, Any]]:
+    # Dict per row from row factory, then copied by the caller
+    return [dict(row) for row in conn.cursor().execute(q, args)]
+
+
+def current(conn: sqlite3.Connection, q: str, args: list[str]) -> list[dict[str, Any]]:
+    return dict_rows(conn.cursor().execute(q, args))
+
+
+def bench(
+    func: Callable[[sqlite3.Connection, str, list[str]], list[dict[str, Any]]],
+    conn: sqlite3.Connection,
+    q: str,
+    args: list[str],
+    iterations: int,
+) -> float:
+    """Return time per row in nanoseconds."""
+    nrows = 0
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        nrows += len(func(conn, q, args))
+    return (time.perf_counter() - t0) / max(nrows, 1) * 1e9
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    conn = shared_db.connection()
+
+    legacy_conn = sqlite3.connect(":memory:")
+    legacy_conn.execute(
+        "ATTACH DATABASE ? AS db", [conn.execute("PRAGMA database_list").fetchone()[2]]
+    )
+    legacy_conn.row_factory = legacy_factory
+
+    for name, (q, args) in QUERIES.items():
+        t_legacy = bench(legacy, legacy_conn, q, args, iterations)
+        t_current = bench(current, conn, q, args, iterations)
+        print(
+            f"{name:<20} | before: {t_legacy:7.0f} ns/row | after: {t_current:7.0f} ns/row | "
+            f"speedup: {t_legacy / t_current:4.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
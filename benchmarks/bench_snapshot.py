@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark cold start using the binary snapshot instead of SQLite.
+
+Each run starts a new Python process, which imports iceaddr and makes
+a first address lookup, placename lookup and nearest address lookup,
+either using the SQLite database or a snapshot created from it. Reports
+the median time from the start of the process to the first answers,
+the peak resident set size (RSS) of the process and its anonymous RSS,
+i.e. private memory, not counting pages of mapped files.
+
+Usage:
+    python benchmarks/bench_snapshot.py [runs]
+
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from iceaddr.db import shared_db
+from iceaddr.snapshot import write_snapshot
+
+CHILD = """
+import json, resource, sys, time
+t0 = time.perf_counter()
+if sys.argv[1] == "sqlite":
+    import iceaddr as api
+else:
+    from iceaddr.snapshot import open_snapshot
+    api = open_snapshot(sys.argv[2])
+t_open = time.perf_counter()
+api.iceaddr_lookup("Öldugata", 4, postcode=101)
+t_addr = time.perf_counter()
+api.placename_lookup("Meðalfellsvatn")
+t_pn = time.perf_counter()
+api.nearest_addr(64.148446, -21.944933)
+t_nearest = time.perf_counter()
+try:
+    # Peak RSS of this process, in kB. Unlike ru_maxrss, this doesn't
+    # include the RSS of the parent process when it was forked.
+    with open("/proc/self/status") as f:
+        status = dict(line.split(":", 1) for line in f)
+    rss = int(status["VmHWM"].split()[0])
+    anon = int(status["RssAnon"].split()[0])
+except OSError:
+    rss = anon = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "open": t_open - t0,
+    "addr": t_addr - t0,
+    "placename": t_pn - t0,
+    "nearest": t_nearest - t0,
+    "rss": rss,
+    "anon": anon,
+}))
+"""
+
+
+def run(args: list[str]) -> dict[str, float]:
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, *args], capture_output=True, check=True, text=True
+    )
+    return json.loads(out.stdout)
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = str(Path(tmpdir) / "iceaddr.snapshot")
+        write_snapshot(shared_db.connection(), path)
+        print(f"Snapshot size: {os.stat(path).st_size / 1e6:.1f} MB\n")
+
+        print(
+            "           |  Import/open | First lookup | + placename |  + nearest "
+            "| Peak RSS | Anon RSS"
+        )
+        for name, args in (("SQLite", ["sqlite"]), ("Snapshot", ["snapshot", path])):
+            res = [run(args) for _ in range(runs)]
+            (t_open, t_addr, t_pn, t_nearest) = (
+                statistics.median(r[k] for r in res) * 1000
+                for k in ("open", "addr", "placename", "nearest")
+            )
+            (rss, anon) = (statistics.median(r[k] for r in res) / 1024 for k in ("rss", "anon"))
+            print(
+                f"{name:<10} | {t_open:9.1f} ms | {t_addr:9.1f} ms | {t_pn:8.1f} ms | "
+                f"{t_nearest:7.1f} ms | {rss:5.1f} MB | {anon:5.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
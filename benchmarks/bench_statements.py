@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark statement preparation overhead of queries with variable-length
+lists of values, e.g. the postcodes of a placename or the candidate IDs
+of a nearest address search.
+
+Compares building "IN (?,?,...)" with one placeholder per value, which
+gives a distinct SQL string for each list length, so statements are
+re-prepared whenever the length changes, with binding the whole list as
+a single JSON array through json_each(), where the SQL never changes.
+Also reports time per query spent only preparing statements.
+
+Usage:
+    python benchmarks/bench_statements.py [num_queries]
+
+"""
+
+from typing import Any, Callable
+
+import random
+import sqlite3
+import sys
+import time
+
+from iceaddr.db import json_list, shared_db
+
+LEGACY_Q = "SELECT * FROM stadfong WHERE hnitnum IN ({})"
+STATIC_Q = "SELECT * FROM stadfong WHERE hnitnum IN (SELECT value FROM json_each(?))"
+
+
+def legacy(conn: sqlite3.Connection, ids: list[int]) -> list[Any]:
+    return conn.execute(LEGACY_Q.format(",".join(["?"] * len(ids))), ids).fetchall()
+
+
+def static(conn: sqlite3.Connection, ids: list[int]) -> list[Any]:
+    return conn.execute(STATIC_Q, (json_list(ids),)).fetchall()
+
+
+def id_lists(n: int) -> list[list[int]]:
+    cur = shared_db.connection().cursor()
+    ids = [r[0] for r in cur.execute("SELECT hnitnum FROM stadfong LIMIT 50000")]
+    rnd = random.Random(1)
+    # Candidate counts vary from query to query, as in find_nearest()
+    return [rnd.sample(ids, rnd.randint(1, 300)) for _ in range(n)]
+
+
+def run(
+    func: Callable[[sqlite3.Connection, list[int]], list[Any]], lists: list[list[int]]
+) -> float:
+    conn = shared_db.connection()
+    t0 = time.perf_counter()
+    for ids in lists:
+        func(conn, ids)
+    return (time.perf_counter() - t0) / len(lists) * 1e6
+
+
+def prepare_only(lists: list[list[int]]) -> tuple[float, float]:
+    """Time spent preparing statements only, counting each distinct SQL
+    string once, i.e. the best case of an unbounded statement cache.
+    EXPLAIN prepares a statement without running the query."""
+    conn = shared_db.connection()
+    timings = []
+    for sql in (
+        [LEGACY_Q.format(",".join(["?"] * len(ids))) for ids in lists],
+        [STATIC_Q] * len(lists),
+    ):
+        prepared: set[str] = set()
+        t0 = time.perf_counter()
+        for q in sql:
+            if q not in prepared:
+                conn.execute("EXPLAIN " + q, [0] * q.count("?"))
+                prepared.add(q)
+        timings.append((time.perf_counter() - t0) / len(lists) * 1e6)
+    return (timings[0], timings[1])
+
+
+def main() -> None:
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    lists = id_lists(n)
+
+    # Warm up page cache
+    run(static, lists[:100])
+
+    t_legacy = run(legacy, lists)
+    t_static = run(static, lists)
+    (p_legacy, p_static) = prepare_only(lists)
+
+    print(f"{n} queries, 1-300 IDs each\n")
+    print(f"IN (?,?,...):      {t_legacy:8.1f} µs/query, of which preparing: {p_legacy:6.1f} µs")
+    print(f"IN (json_each(?)): {t_static:8.1f} µs/query, of which preparing: {p_static:6.1f} µs")
+    print(f"Speedup: {t_legacy / t_static:.2f}x")
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
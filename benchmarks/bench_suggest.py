@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark autocompletion latency of iceaddr_suggest(), keystroke by
+keystroke, as a user types a street name.
+
+Compares the previous single-token query, which matched street names
+with "heiti_nf LIKE ? OR heiti_tgf LIKE ?", with the in-memory street
+name prefix index.
+
+Usage:
+    python benchmarks/bench_suggest.py [iterations]
+
+"""
+
+from typing import Any
+
+import sys
+import time
+
+from iceaddr import iceaddr_suggest
+from iceaddr.db import dict_rows, shared_db
+from iceaddr.streets import street_index
+
+WORDS = ["Öldugata", "Laugavegur", "Hafnarstræti", "Kirkjubraut"]
+
+
+def legacy_suggest(prefix: str, limit: int = 50) -> list[dict[str, Any]]:
+    q = """
+        SELECT * FROM stadfong WHERE (heiti_nf LIKE ? OR heiti_tgf LIKE ?)
+        ORDER BY postnr ASC, husnr ASC, bokst ASC LIMIT ?
+    """
+    cur = shared_db.connection().cursor()
+    return dict_rows(cur.execute(q, [prefix + "%", prefix + "%", limit]))
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    t0 = time.perf_counter()
+    street_index()
+    print(f"Index build time: {(time.perf_counter() - t0) * 1000:.1f} ms\n")
+
+    for word in WORDS:
+        # Suggestions are only made from 3 characters onwards
+        prefixes = [word[:i] for i in range(3, len(word) + 1)]
+        timings = []
+        for func in (legacy_suggest, iceaddr_suggest):
+            t0 = time.perf_counter()
+            for _ in range(iterations):
+                for p in prefixes:
+                    func(p)
+            timings.append((time.perf_counter() - t0) / (iterations * len(prefixes)) * 1e6)
+
+        (t_legacy, t_current) = timings
+        print(
+            f"{word:<14} | before: {t_legacy:8.0f} µs/keystroke | "
+            f"after: {t_current:8.0f} µs/keystroke | speedup: {t_legacy / t_current:5.1f}x"
+        )
+
+    t0 = time.perf_counter()
+    n = 0
+    for _ in range(iterations):
+        for word in WORDS:
+            for i in range(3, len(word) + 1):
+                street_index().suggest(word[:i])
+                n += 1
+    print(f"\nStreet name candidates only: {(time.perf_counter() - t0) / n * 1e6:.1f} µs/keystroke")
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+
+Benchmark lookup throughput from multiple threads.
+
+Runs a mix of iceaddr_lookup() and nearest_addr() calls from N threads,
+first with a single shared database connection and then with one
+connection per thread, and reports the throughput for each.
+
+Usage:
+    python benchmarks/bench_threads.py [max_threads] [calls_per_thread]
+
+"""
+
+import random
+import sys
+import threading
+import time
+
+from iceaddr import iceaddr_lookup, nearest_addr
+from iceaddr.db import shared_db
+
+STREETS = ["Laugavegur", "Öldugata", "Hringbraut", "Bárugata", "Hverfisgata", "Grundarstígur"]
+
+
+def worker(calls: int, seed: int) -> None:
+    rnd = random.Random(seed)
+    for i in range(calls):
+        if i % 2:
+            iceaddr_lookup(rnd.choice(STREETS), number=rnd.randint(1, 50))
+        else:
+            nearest_addr(64.13 + rnd.uniform(-0.03, 0.03), -21.89 + rnd.uniform(-0.06, 0.06))
+
+
+def bench(num_threads: int, calls: int) -> float:
+    threads = [threading.Thread(target=worker, args=(calls, i)) for i in range(num_threads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return num_threads * calls / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    max_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    num = 1
+    while num <= max_threads:
+        results: list[float] = []
+        for pool_size in (1, num):
+            shared_db.configure(pool_size=pool_size)
+            worker(10, 0)  # Warm up
+            results.append(bench(num, calls))
+        print(
+            f"{num:>3} threads | shared connection: {results[0]:8.0f} calls/s | "
+            f"connection per thread: {results[1]:8.0f} calls/s"
+        )
+        num *= 2
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
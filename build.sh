@@ -1,8 +1,9 @@
 #!/bin/bash
 #
-# Build the database and add placename data
+# Build the database, add placename data and create snapshot
 
 set -o errexit   # Exit when a command fails
 
 python build_db.py
 python add_placename_data.py
+python build_snapshot.py
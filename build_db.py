@@ -10,21 +10,28 @@ From data compiled by Registers Iceland (CC-BY):
 
 """
 
-from typing import Any, Iterator
+from typing import Any, Iterable, Iterator, Optional, Sequence, TextIO
 
+import argparse
 import csv
 import datetime
+import json
 import os
 import sqlite3
 import sys
+import time
 from builtins import input
-from io import BytesIO, TextIOWrapper
+from contextlib import contextmanager
+from io import TextIOWrapper
+from itertools import islice
+from multiprocessing import Pool
 from pathlib import Path
 from urllib.request import urlopen
 
 import humanize
 
 from iceaddr.geo import in_iceland
+from iceaddr.grid import DEFAULT_GRID_CELL_SIZE, DEFAULT_GRID_MAX_DIST, GRID_TABLE, build_grid
 from iceaddr.postcodes import POSTCODES
 
 POSTCODE_SET = frozenset(POSTCODES.keys())
@@ -37,6 +44,9 @@ DSV_FILENAME = "Stadfangaskra.csv"
 
 DEFAULT_DBNAME = "iceaddr.db"
 
+# Number of rows sanitized by a worker and inserted at a time
+CHUNK_SIZE = 20000
+
 COLS = [
     "hnitnum",
     "svfnr",
@@ -59,6 +69,13 @@ def create_db(path: str) -> sqlite3.Connection:
     """Create stadfong database table."""
     dbconn = sqlite3.connect(path)
 
+    # The database is created from scratch, so there is nothing to
+    # recover if the build fails and no need for a rollback journal
+    dbconn.execute("PRAGMA journal_mode=OFF;")
+    dbconn.execute("PRAGMA synchronous=OFF;")
+    dbconn.execute("PRAGMA temp_store=MEMORY;")
+    dbconn.execute("PRAGMA cache_size=-262144;")
+
     create_table_sql = """
     CREATE TABLE stadfong (
         hnitnum INTEGER UNIQUE PRIMARY KEY NOT NULL,
@@ -80,19 +97,6 @@ def create_db(path: str) -> sqlite3.Connection:
 
     dbconn.cursor().execute(create_table_sql)
 
-    # Create indexes for common query patterns
-    index_queries = [
-        "CREATE INDEX idx_stadfong_heiti_nf ON stadfong(heiti_nf);",
-        "CREATE INDEX idx_stadfong_heiti_tgf ON stadfong(heiti_tgf);",
-        "CREATE INDEX idx_stadfong_postnr ON stadfong(postnr);",
-        "CREATE INDEX idx_stadfong_heiti_husnr ON stadfong(heiti_nf, husnr);",
-        "CREATE INDEX idx_stadfong_heiti_husnr_bokst ON stadfong(heiti_nf, husnr, bokst);",
-        "CREATE INDEX idx_stadfong_serheiti ON stadfong(serheiti);",
-    ]
-
-    for query in index_queries:
-        dbconn.cursor().execute(query)
-
     # Create R-Tree virtual table for spatial indexing
     rtree_queries = [
         """
@@ -107,6 +111,12 @@ def create_db(path: str) -> sqlite3.Connection:
     for query in rtree_queries:
         dbconn.cursor().execute(query)
 
+    # Create full-text index of street names and special names, with
+    # trigram tokenization for case-insensitive substring matching
+    dbconn.cursor().execute(
+        "CREATE VIRTUAL TABLE stadfong_fts USING fts5(name, tokenize='trigram');"
+    )
+
     # Create metadata table
     metadata_table_sql = """
     CREATE TABLE metadata (
@@ -119,22 +129,54 @@ def create_db(path: str) -> sqlite3.Connection:
     return dbconn
 
 
-def read_rows(dsv_file: TextIOWrapper, delimiter: str = ",") -> Iterator[dict[Any, Any]]:
+def create_indexes(conn: sqlite3.Connection) -> None:
+    """Create indexes for common query patterns. This is done after
+    the addresses have been inserted, which is much faster than
+    updating the indexes row by row."""
+    index_queries = [
+        "CREATE INDEX idx_stadfong_heiti_nf ON stadfong(heiti_nf);",
+        "CREATE INDEX idx_stadfong_heiti_tgf ON stadfong(heiti_tgf);",
+        "CREATE INDEX idx_stadfong_postnr ON stadfong(postnr);",
+        "CREATE INDEX idx_stadfong_heiti_husnr ON stadfong(heiti_nf, husnr);",
+        "CREATE INDEX idx_stadfong_heiti_husnr_bokst ON stadfong(heiti_nf, husnr, bokst);",
+        "CREATE INDEX idx_stadfong_serheiti ON stadfong(serheiti);",
+    ]
+
+    for query in index_queries:
+        conn.cursor().execute(query)
+
+
+def read_chunks(dsv_file: TextIO, delimiter: str = ",") -> Iterator[list[dict[Any, Any]]]:
+    """Read rows from DSV file in chunks of CHUNK_SIZE rows."""
     reader = csv.DictReader(dsv_file, delimiter=delimiter)
-    for row in reader:
-        yield row
+    while chunk := list(islice(reader, CHUNK_SIZE)):
+        yield chunk
 
 
 def insert_metadata(conn: sqlite3.Connection) -> None:
     """Insert metadata into the metadata table."""
     timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
-    conn.cursor().execute(
+    conn.cursor().executemany(
         "INSERT INTO metadata (key, value) VALUES (?, ?)",
-        ("date_created", timestamp),
+        [("date_created", timestamp), ("data_version", "1")],
+    )
+
+
+def update_metadata(conn: sqlite3.Connection) -> int:
+    """Record an update of the address data in the metadata table.
+    Returns the new data version."""
+    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    r = conn.execute("SELECT value FROM metadata WHERE key='data_version'").fetchone()
+    version = int(r[0]) + 1 if r else 2
+    conn.cursor().executemany(
+        "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+        [("date_updated", timestamp), ("data_version", str(version))],
     )
+    return version
 
 
-def insert_address_entry(e: dict[Any, Any], conn: sqlite3.Connection) -> None:
+def sanitize_address_entry(e: dict[Any, Any]) -> Optional[list[Any]]:
+    """Return column values of address entry, or None if it is invalid."""
     # The stadfong datafile is quite dirty so we need to
     # sanitise values before inserting into the database
 
@@ -145,7 +187,7 @@ def insert_address_entry(e: dict[Any, Any], conn: sqlite3.Connection) -> None:
     e["LAT_WGS84"] = e["N_HNIT_WGS84"].replace(",", ".")
     e["LONG_WGS84"] = e["E_HNIT_WGS84"].replace(",", ".")
 
-    to_int = ["BYGGD", "HEINUM", "HNITNUM", "HUSNR", "LANDNR", "POSTNR"]
+    to_int = ["BYGGD", "HEINUM", "HNITNUM", "HUSNR", "LANDNR", "POSTNR", "SVFNR"]
     to_float = ["LAT_WGS84", "LONG_WGS84"]
 
     for k in to_int:
@@ -168,29 +210,288 @@ def insert_address_entry(e: dict[Any, Any], conn: sqlite3.Connection) -> None:
                 print("Failed to convert '" + k + "' to float, setting to null")
                 e[k] = None
 
+    if e["POSTNR"] not in POSTCODE_SET:
+        return None
+    if e["LAT_WGS84"] is None or e["LONG_WGS84"] is None:
+        return None
+    if not in_iceland((e["LAT_WGS84"], e["LONG_WGS84"])):
+        return None
+    return [e[c.upper()] for c in COLS]
+
+
+def sanitize_chunk(chunk: list[dict[Any, Any]]) -> tuple[list[list[Any]], int]:
+    """Sanitize chunk of address entries. Returns column values of the
+    valid entries and the number of invalid entries skipped."""
+    rows = [sanitize_address_entry(e) for e in chunk]
+    valid = [r for r in rows if r is not None]
+    return (valid, len(rows) - len(valid))
+
+
+def sanitized_chunks(
+    chunks: Iterator[list[dict[Any, Any]]], workers: int
+) -> Iterator[tuple[list[list[Any]], int]]:
+    """Sanitize chunks of address entries in a pool of worker processes,
+    yielding them in order as they come in."""
+    pool = Pool(workers) if workers > 1 else None
     try:
-        assert in_iceland((e["LAT_WGS84"], e["LONG_WGS84"]))
-        assert e["POSTNR"] in POSTCODE_SET
-        qargs = [e[c.upper()] for c in COLS]
-        # print(qargs)
-        c = conn.cursor()
-        c.execute("INSERT INTO stadfong VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", qargs)
-    except Exception as exc:
-        print(exc)
+        yield from pool.imap(sanitize_chunk, chunks) if pool else map(sanitize_chunk, chunks)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+
+def insert_addresses(
+    chunks: Iterator[list[dict[Any, Any]]], conn: sqlite3.Connection, workers: int
+) -> tuple[int, int]:
+    """Insert chunks of address entries as they are sanitized, in a single
+    transaction. Returns the number of entries inserted and skipped."""
+    (cnt, skipped) = (0, 0)
+    for rows, nskipped in sanitized_chunks(chunks, workers):
+        # Entries with the same hnitnum as an earlier entry are skipped
+        changes = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO stadfong VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows
+        )
+        inserted = conn.total_changes - changes
+        cnt += inserted
+        skipped += nskipped + len(rows) - inserted
+        print("\tInserting: %d\r" % cnt, end="")
+        sys.stdout.flush()
+    conn.commit()
+    print("\tInserting: %d" % cnt)
+    return (cnt, skipped)
+
+
+def has_table(conn: sqlite3.Connection, name: str) -> bool:
+    """Check whether the database has a table of the given name."""
+    q = "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'view') AND name = ?"
+    return conn.execute(q, (name,)).fetchone() is not None
+
+
+# Indexes of street and special names in address column values
+NAME_COLS = [COLS.index(c) for c in ("heiti_nf", "heiti_tgf", "serheiti")]
+
+
+def _names(rows: Iterable[Sequence[Any]]) -> set[str]:
+    return {r[i] for r in rows for i in NAME_COLS if r[i]}
+
+
+def _existing_names(conn: sqlite3.Connection, names: set[str]) -> set[str]:
+    """Those of the given names which are the street or special name of some address."""
+    return {
+        name
+        for name in names
+        if conn.execute(
+            """
+            SELECT 1 WHERE EXISTS (SELECT 1 FROM stadfong WHERE heiti_nf = ?1)
+            OR EXISTS (SELECT 1 FROM stadfong WHERE heiti_tgf = ?1)
+            OR EXISTS (SELECT 1 FROM stadfong WHERE serheiti = ?1)
+            """,
+            (name,),
+        ).fetchone()
+    }
+
+
+def update_addresses(
+    chunks: Iterator[list[dict[Any, Any]]], conn: sqlite3.Connection, workers: int
+) -> dict[str, int]:
+    """Update the stadfong table, its R-Tree index and full-text index of
+    names to match the given address entries, comparing them with the
+    existing addresses by hnitnum. Only new, changed and removed addresses
+    are written, in a single transaction. Returns the number of entries
+    inserted, updated, deleted, unchanged and skipped."""
+    cols = ", ".join(COLS)
+    existing = {r[0]: r for r in conn.execute(f"SELECT {cols} FROM stadfong")}
+
+    (changed, old_rows) = ([], [])
+    seen: set[int] = set()
+    stats = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "skipped": 0}
+    for rows, nskipped in sanitized_chunks(chunks, workers):
+        stats["skipped"] += nskipped
+        for r in rows:
+            pid = r[0]
+            if pid in seen:
+                # Same hnitnum as an earlier entry
+                stats["skipped"] += 1
+                continue
+            seen.add(pid)
+            old = existing.get(pid)
+            if old is None:
+                changed.append(r)
+                stats["inserted"] += 1
+            elif tuple(r) != old:
+                changed.append(r)
+                old_rows.append(old)
+                stats["updated"] += 1
+            else:
+                stats["unchanged"] += 1
+    deleted = [r for pid, r in existing.items() if pid not in seen]
+    old_rows.extend(deleted)
+    stats["deleted"] = len(deleted)
+
+    # Names not in the full-text index before the update
+    new_names = _names(changed)
+    new_names -= _existing_names(conn, new_names)
+
+    conn.executemany("DELETE FROM stadfong WHERE hnitnum = ?", [(r[0],) for r in deleted])
+    conn.executemany("DELETE FROM stadfong_rtree WHERE id = ?", [(r[0],) for r in deleted])
+    conn.executemany(
+        "INSERT OR REPLACE INTO stadfong VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)", changed
+    )
+    (lat, lon) = (COLS.index("lat_wgs84"), COLS.index("long_wgs84"))
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO stadfong_rtree (id, min_long, max_long, min_lat, max_lat)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [(r[0], r[lon], r[lon], r[lat], r[lat]) for r in changed],
+    )
+
+    if not has_table(conn, "stadfong_fts"):
+        return stats
+
+    # Add new names to the full-text index and remove names no longer in use
+    old_names = _names(old_rows)
+    old_names -= _existing_names(conn, old_names)
+    conn.execute(
+        "DELETE FROM stadfong_fts WHERE name IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted(old_names)),),
+    )
+    conn.executemany("INSERT INTO stadfong_fts (name) VALUES (?)", [(n,) for n in new_names])
+
+    return stats
+
+
+@contextmanager
+def stage(name: str, timings: dict[str, float]) -> Iterator[None]:
+    """Print name of build stage and record how long it takes."""
+    print(f"{name}...")
+    sys.stdout.flush()
+    t0 = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - t0
+    print(f"\t{timings[name]:.2f} s")
+
+
+def print_timings(timings: dict[str, float], t0: float) -> None:
+    for name, secs in timings.items():
+        print(f"\t{name:<32} {secs:6.2f} s")
+    print(f"\t{'Total':<32} {time.perf_counter() - t0:6.2f} s")
+
+
+def create_grid(
+    conn: sqlite3.Connection, cell_size: float, max_dist: float, commit: bool = True
+) -> None:
+    """Create nearest address grid and print its size."""
+    stats = build_grid(conn, cell_size=cell_size, max_dist=max_dist, commit=commit)
+    print(
+        "\t%d cells, %.1f candidates per cell, %s"
+        % (
+            stats["cells"],
+            stats["candidates"] / max(1, stats["cells"]),
+            humanize.naturalsize(stats["bytes"]),
+        )
+    )
+
+
+def update_db(f: TextIO, db_path: str, args: argparse.Namespace) -> dict[str, float]:
+    """Update addresses in an existing database from DSV file, leaving
+    other data, such as placenames, as is. Returns stage timings."""
+    timings: dict[str, float] = {}
+    # Unlike a new database, an existing one must survive a failed update,
+    # so the rollback journal is kept
+    dbconn = sqlite3.connect(db_path)
+
+    with stage("Updating addresses", timings), f:
+        stats = update_addresses(read_chunks(f), dbconn, args.workers)
+        print(
+            "\t%(inserted)d inserted, %(updated)d updated, %(deleted)d deleted, "
+            "%(unchanged)d unchanged, %(skipped)d skipped" % stats
+        )
+        changes = stats["inserted"] + stats["updated"] + stats["deleted"]
+        if changes:
+            version = update_metadata(dbconn)
+            print("\tData version %d" % version)
+
+    # Grid cells hold the addresses nearest to each of them, which changed
+    # addresses can affect far away in sparsely populated areas, so the
+    # grid is recreated rather than updated. This is done in the same
+    # transaction as the address changes, so that readers never see a grid
+    # listing deleted addresses, even if recreating it fails.
+    if args.grid or (changes and has_table(dbconn, GRID_TABLE)):
+        meta = dict(dbconn.execute("SELECT key, value FROM metadata").fetchall())
+        if args.grid:
+            (cell_size, max_dist) = (args.grid_cell_size, args.grid_max_dist)
+        else:
+            cell_size = float(meta.get("grid_cell_size", DEFAULT_GRID_CELL_SIZE))
+            max_dist = float(meta.get("grid_max_dist", DEFAULT_GRID_MAX_DIST))
+        with stage("Recreating nearest address grid", timings):
+            create_grid(dbconn, cell_size, max_dist, commit=False)
+    dbconn.commit()
+
+    if changes:
+        with stage("Analyzing", timings):
+            dbconn.execute("ANALYZE;")
+            dbconn.commit()
+    dbconn.close()
+
+    print("Updated database with %d changes" % changes)
+    return timings
 
 
 def main() -> None:
+    parser = argparse.ArgumentParser(description="Create iceaddr address database")
     # Optional args to specify input and output files
-    stadfong_path = sys.argv[1] if len(sys.argv) > 1 else DSV_FILENAME
-    db_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_DBNAME
+    parser.add_argument("stadfong_path", nargs="?", default=DSV_FILENAME)
+    parser.add_argument("db_path", nargs="?", default=DEFAULT_DBNAME)
+    parser.add_argument(
+        "--grid",
+        action="store_true",
+        help="also create precomputed grid for fast nearest address lookups",
+    )
+    parser.add_argument(
+        "--grid-cell-size",
+        type=float,
+        default=DEFAULT_GRID_CELL_SIZE,
+        help=f"grid cell size in degrees of latitude (default: {DEFAULT_GRID_CELL_SIZE})",
+    )
+    parser.add_argument(
+        "--grid-max-dist",
+        type=float,
+        default=DEFAULT_GRID_MAX_DIST,
+        help="leave out grid cells further than this from any address, "
+        f"in km (default: {DEFAULT_GRID_MAX_DIST})",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of processes sanitizing address entries (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--update",
+        action="store_true",
+        help="update addresses in an existing database instead of creating a new one",
+    )
+    args = parser.parse_args()
+    (stadfong_path, db_path) = (args.stadfong_path, args.db_path)
 
     if stadfong_path == DSV_FILENAME and not Path(stadfong_path).is_file():
         print("Fetching remote file %s" % STADFONG_REMOTE_URL)
-        resp = urlopen(STADFONG_REMOTE_URL)
-        f = TextIOWrapper(BytesIO(resp.read()), "utf-8")
+        # Parse the file as it is downloaded
+        f: TextIO = TextIOWrapper(urlopen(STADFONG_REMOTE_URL), "utf-8")
     else:
         f = open(stadfong_path, "r")
 
+    if args.update:
+        if not Path(db_path).is_file():
+            print(f"{db_path} not found")
+            sys.exit(1)
+        t0 = time.perf_counter()
+        print_timings(update_db(f, db_path, args), t0)
+        return
+
     # Delete previous db file
     if Path(db_path).is_file():
         if input(f"{db_path} exists, overwrite? (y/n): ").lower().startswith("y"):
@@ -199,45 +500,61 @@ def main() -> None:
             print("Aborting")
             sys.exit()
 
+    timings: dict[str, float] = {}
+    t0 = time.perf_counter()
+
     # Create new database file
     dbconn = create_db(db_path)
 
-    # Commit addresses to DB in chunks of 1000 rows
-    cnt = 0
-    for r in read_rows(f):
-        insert_address_entry(r, dbconn)
-        cnt += 1
-        if cnt % 1000 == 0:
-            dbconn.commit()
-            print("\tInserting: %d\r" % cnt, end="")
-            sys.stdout.flush()
+    with stage("Inserting addresses", timings), f:
+        (cnt, skipped) = insert_addresses(read_chunks(f), dbconn, args.workers)
+        if skipped:
+            print("\tSkipped %d invalid entries" % skipped)
+
+    with stage("Creating indexes", timings):
+        create_indexes(dbconn)
+        dbconn.commit()
+
+    with stage("Populating R-Tree index", timings):
+        dbconn.execute(
+            """
+            INSERT INTO stadfong_rtree (id, min_long, max_long, min_lat, max_lat)
+            SELECT hnitnum, long_wgs84, long_wgs84, lat_wgs84, lat_wgs84 FROM stadfong
+            WHERE lat_wgs84 IS NOT NULL AND long_wgs84 IS NOT NULL;
+            """
+        )
+        dbconn.commit()
+
+    with stage("Populating full-text index", timings):
+        dbconn.execute(
+            """
+            INSERT INTO stadfong_fts (name)
+            SELECT heiti_nf FROM stadfong WHERE heiti_nf != ''
+            UNION SELECT heiti_tgf FROM stadfong WHERE heiti_tgf != ''
+            UNION SELECT serheiti FROM stadfong WHERE serheiti != '';
+            """
+        )
+        dbconn.commit()
+
+    with stage("Inserting metadata", timings):
+        insert_metadata(dbconn)
+        dbconn.commit()
+
+    if args.grid:
+        with stage("Creating nearest address grid", timings):
+            create_grid(dbconn, args.grid_cell_size, args.grid_max_dist)
 
-    dbconn.commit()
-
-    print("\tInserting: %d\r" % cnt)
-    sys.stdout.flush()
-
-    print("\tPopulating R-Tree index...")
-    dbconn.execute(
-        """
-        INSERT INTO stadfong_rtree (id, min_long, max_long, min_lat, max_lat)
-        SELECT hnitnum, long_wgs84, long_wgs84, lat_wgs84, lat_wgs84 FROM stadfong
-        WHERE lat_wgs84 IS NOT NULL AND long_wgs84 IS NOT NULL;
-        """
-    )
-    dbconn.commit()
-
-    print("\tInserting metadata...")
-    insert_metadata(dbconn)
-    dbconn.commit()
+    # After data import, analyze the database to optimize index usage
+    with stage("Analyzing", timings):
+        dbconn.execute("ANALYZE;")
+        dbconn.commit()
+    dbconn.close()
 
     bytesize: int = os.stat(db_path).st_size
     human_size = humanize.naturalsize(bytesize)
 
-    # After data import, analyze the database to optimize index usage
-    dbconn.execute("ANALYZE;")
-
     print("Created database with %d entries (%s)" % (cnt, human_size))
+    print_timings(timings, t0)
 
 
 if __name__ == "__main__":
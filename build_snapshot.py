@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+
+Create compact binary snapshot of the iceaddr database, for fast cold
+start in short-lived processes, see src/iceaddr/snapshot.py.
+
+Run after build_db.py and add_placename_data.py.
+
+"""
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+import humanize
+
+from iceaddr.snapshot import SNAPSHOT_FILENAME, write_snapshot
+
+DEFAULT_DBNAME = "iceaddr.db"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create iceaddr snapshot file")
+    parser.add_argument("db_path", nargs="?", default=DEFAULT_DBNAME)
+    parser.add_argument("snapshot_path", nargs="?", default=SNAPSHOT_FILENAME)
+    args = parser.parse_args()
+
+    if not Path(args.db_path).is_file():
+        print(f"{args.db_path} not found")
+        sys.exit(1)
+
+    print(f"Creating snapshot of {args.db_path}...")
+    conn = sqlite3.connect(args.db_path)
+    stats = write_snapshot(conn, args.snapshot_path)
+    conn.close()
+
+    print(
+        "Created snapshot with %d addresses, %d placenames, %d strings (%s) in %.2f s"
+        % (
+            stats["addresses"],
+            stats["placenames"],
+            stats["strings"],
+            humanize.naturalsize(stats["bytes"]),
+            stats["build_time"],
+        )
+    )
+
+
+if __name__ == "__main__":
+    """Command line invocation."""
+    main()
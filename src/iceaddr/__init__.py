@@ -5,48 +5,159 @@ iceaddr: Look up information about Icelandic streets, addresses,
 
 Copyright (c) 2018-2025 Sveinbjorn Thordarson.
 
+Submodules are imported lazily, when a name exported from them is first
+used, so that e.g. importing distance() doesn't open the database or
+load postcode data.
+
 """
 
-import importlib.metadata
+from typing import TYPE_CHECKING, Any
+
+from importlib import import_module
 
 __author__ = "Sveinbjorn Thordarson"
 __copyright__ = "(C) 2018-2025 Sveinbjorn Thordarson"
-__version__ = importlib.metadata.version("iceaddr")
-
-from .addresses import iceaddr_lookup, iceaddr_suggest, nearest_addr, nearest_addr_with_dist
-from .geo import distance, in_iceland
-from .meta import iceaddr_metadata
-from .municipalities import (
-    MUNICIPALITIES,
-    municipality_for_municipality_code,
-    municipality_code_for_municipality,
-)
-from .placenames import placename_lookup, nearest_placenames, nearest_placenames_with_dist
-from .postcodes import (
-    POSTCODES,
-    postcode_lookup,
-    postcodes_for_region,
-    region_for_postcode,
-    postcodes_for_placename,
-)
+
+if TYPE_CHECKING:
+    from .addresses import (
+        iceaddr_lookup,
+        iceaddr_lookup_iter,
+        iceaddr_search,
+        iceaddr_suggest,
+        iceaddr_suggest_iter,
+        nearest_addr,
+        nearest_addr_with_dist,
+        nearest_addr_batch,
+        nearest_addr_batch_with_dist,
+    )
+    from .bulk import geocode, geocode_csv
+    from .cache import enable_cache, disable_cache, clear_cache, cache_stats
+    from .geo import distance, distance_many, distance_matrix, in_iceland, in_iceland_many
+    from .meta import iceaddr_metadata
+    from .nearest import set_nearest_engine
+    from .municipalities import (
+        MUNICIPALITIES,
+        municipality_for_municipality_code,
+        municipality_code_for_municipality,
+    )
+    from .placenames import (
+        placename_lookup,
+        placename_lookup_iter,
+        placename_search,
+        nearest_placenames,
+        nearest_placenames_with_dist,
+        nearest_placenames_batch,
+        nearest_placenames_batch_with_dist,
+    )
+    from .streets import street_name_suggest
+    from .postcodes import (
+        POSTCODES,
+        postcode_lookup,
+        postcodes_for_region,
+        region_for_postcode,
+        postcodes_for_placename,
+    )
+
+    __version__: str
+
+# Exported name => submodule it is defined in
+_EXPORTS = {
+    "iceaddr_lookup": "addresses",
+    "iceaddr_lookup_iter": "addresses",
+    "iceaddr_search": "addresses",
+    "iceaddr_suggest": "addresses",
+    "iceaddr_suggest_iter": "addresses",
+    "nearest_addr": "addresses",
+    "nearest_addr_with_dist": "addresses",
+    "nearest_addr_batch": "addresses",
+    "nearest_addr_batch_with_dist": "addresses",
+    "set_nearest_engine": "nearest",
+    "distance": "geo",
+    "distance_many": "geo",
+    "distance_matrix": "geo",
+    "in_iceland": "geo",
+    "in_iceland_many": "geo",
+    "iceaddr_metadata": "meta",
+    "MUNICIPALITIES": "municipalities",
+    "municipality_for_municipality_code": "municipalities",
+    "municipality_code_for_municipality": "municipalities",
+    "placename_lookup": "placenames",
+    "placename_lookup_iter": "placenames",
+    "placename_search": "placenames",
+    "nearest_placenames": "placenames",
+    "nearest_placenames_with_dist": "placenames",
+    "nearest_placenames_batch": "placenames",
+    "nearest_placenames_batch_with_dist": "placenames",
+    "POSTCODES": "postcodes",
+    "postcode_lookup": "postcodes",
+    "postcodes_for_region": "postcodes",
+    "region_for_postcode": "postcodes",
+    "postcodes_for_placename": "postcodes",
+    "street_name_suggest": "streets",
+    "geocode": "bulk",
+    "geocode_csv": "bulk",
+    "enable_cache": "cache",
+    "disable_cache": "cache",
+    "clear_cache": "cache",
+    "cache_stats": "cache",
+}
 
 __all__ = [
     "iceaddr_lookup",
+    "iceaddr_lookup_iter",
+    "iceaddr_search",
     "iceaddr_suggest",
+    "iceaddr_suggest_iter",
     "nearest_addr",
     "nearest_addr_with_dist",
+    "nearest_addr_batch",
+    "nearest_addr_batch_with_dist",
+    "set_nearest_engine",
     "distance",
+    "distance_many",
+    "distance_matrix",
     "in_iceland",
+    "in_iceland_many",
     "iceaddr_metadata",
     "MUNICIPALITIES",
     "municipality_for_municipality_code",
     "municipality_code_for_municipality",
     "placename_lookup",
+    "placename_lookup_iter",
+    "placename_search",
     "nearest_placenames",
     "nearest_placenames_with_dist",
+    "nearest_placenames_batch",
+    "nearest_placenames_batch_with_dist",
     "POSTCODES",
     "postcode_lookup",
     "postcodes_for_region",
     "region_for_postcode",
     "postcodes_for_placename",
+    "street_name_suggest",
+    "geocode",
+    "geocode_csv",
+    "enable_cache",
+    "disable_cache",
+    "clear_cache",
+    "cache_stats",
 ]
+
+
+def __getattr__(name: str) -> Any:
+    """Import exported names from their submodules on first use."""
+    if name == "__version__":
+        # Looking up the installed version scans installed distributions
+        from importlib.metadata import version
+
+        value: Any = version("iceaddr")
+    elif name in _EXPORTS:
+        value = getattr(import_module(f".{_EXPORTS[name]}", __name__), name)
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__) | {"__version__"})
@@ -0,0 +1,78 @@
+"""
+
+iceaddr: Look up information about Icelandic streets, addresses,
+         placenames, landmarks, locations and postcodes.
+
+Copyright (c) 2018-2025 Sveinbjorn Thordarson.
+
+Command line interface, e.g.
+
+    python -m iceaddr geocode addresses.csv geocoded.csv --column address
+
+"""
+
+from typing import Optional, Sequence
+
+import argparse
+import sys
+
+from .bulk import DEFAULT_CHUNK_SIZE, geocode_csv
+
+
+def _geocode(args: argparse.Namespace) -> int:
+    infile = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    outfile = (
+        sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    )
+    try:
+        stats = geocode_csv(
+            infile,
+            outfile,
+            column=args.column,
+            delimiter=args.delimiter,
+            chunk_size=args.chunk_size,
+        )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if infile is not sys.stdin:
+            infile.close()
+        if outfile is not sys.stdout:
+            outfile.close()
+
+    print(
+        f"Geocoded {stats['rows']} rows ({stats['matched']} matched) in "
+        f"{stats['elapsed']:.1f} s, {stats['rows_per_sec']:.0f} rows/sec",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m iceaddr", description="iceaddr tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser(
+        "geocode", help="geocode the addresses in a CSV file, writing results to a new CSV file"
+    )
+    p.add_argument("input", help="input CSV file, with a header row, or - for stdin")
+    p.add_argument("output", help="output CSV file, or - for stdout")
+    p.add_argument(
+        "-c", "--column", default="address", help="name of address column (default: address)"
+    )
+    p.add_argument("-d", "--delimiter", default=",", help="CSV delimiter (default: ,)")
+    p.add_argument(
+        "--chunk-size",
+        type=int,
+        default=DEFAULT_CHUNK_SIZE,
+        help=f"number of rows processed at a time (default: {DEFAULT_CHUNK_SIZE})",
+    )
+    p.set_defaults(func=_geocode)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
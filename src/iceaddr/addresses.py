@@ -11,15 +11,31 @@ This file contains code related to Icelandic address lookup.
 
 from __future__ import annotations
 
-from typing import Any, Optional
+from typing import Any, Iterable, Iterator, Optional, Sequence
 
 import re
-
-from .db import shared_db
+import sqlite3
+from itertools import chain
+
+from .cache import cached_by
+from .db import (
+    FTS_MIN_LEN,
+    fts_phrase,
+    iter_dict_rows,
+    json_list,
+    page_args,
+    row_to_dict,
+    search_key,
+    shared_db,
+)
+from .fuzzy import fuzzy_matches
 from .geo import valid_wgs84_coord
+from .grid import grid_nearest
 from .municipalities import MUNICIPALITIES
-from .nearest import find_nearest
+from .nearest import find_nearest, find_nearest_batch
 from .postcodes import POSTCODES, postcodes_for_placename
+from .streets import street_index
+from .text import fold
 
 
 def _add_postcode_info(addr: dict[str, Any]) -> dict[str, Any]:
@@ -38,50 +54,101 @@ def _add_municipality_info(addr: dict[str, Any]) -> dict[str, Any]:
     return addr
 
 
-def _postprocess_addr(addr: dict[str, Any]) -> dict[str, Any]:
+def postprocess_addr(addr: dict[str, Any]) -> dict[str, Any]:
     """Add postcode and municipality info to address."""
     return _add_municipality_info(_add_postcode_info(addr))
 
 
-def _run_addr_query(q: str, qargs: list[str]) -> list[dict[str, Any]]:
-    """Run address query, w. additional postcode data added post hoc."""
+def _run_addr_query(q: str, qargs: list[Any]) -> Iterator[dict[str, Any]]:
+    """Run address query, w. additional postcode data added post hoc,
+    streaming addresses from the cursor as they are iterated over."""
     db_conn = shared_db.connection()
-    res = db_conn.cursor().execute(q, qargs)
-    return [_add_municipality_info(_add_postcode_info(dict(row))) for row in res]
-
-
-def _cap_first(s: str) -> str:
+    res = iter_dict_rows(db_conn.cursor().execute(q, qargs))
+    return (_add_municipality_info(_add_postcode_info(row)) for row in res)
+
+
+# Order of address lookup results. Ordering by postcode may in fact be a
+# reasonable proxy for delivering by order of match likelihood since the
+# lowest postcodes are generally more densely populated. NULLs are
+# replaced and ties broken by hnitnum, so that addresses can be compared
+# with the address a page of results should follow (see _sort_key).
+_LOOKUP_ORDER = (
+    "coalesce(vidsk, '') != '', coalesce(postnr, -1), coalesce(husnr, -1), "
+    "coalesce(bokst, ''), hnitnum"
+)
+# Order of suggestions, which don't put addresses with a suffix last
+_SUGGEST_ORDER = "coalesce(postnr, -1), coalesce(husnr, -1), coalesce(bokst, ''), hnitnum"
+
+
+def _sort_key(addr: dict[str, Any], order: str) -> list[Any]:
+    """Values of the given order expressions for an address."""
+    key = [
+        -1 if addr.get("postnr") is None else addr["postnr"],
+        -1 if addr.get("husnr") is None else addr["husnr"],
+        addr.get("bokst") or "",
+        addr["hnitnum"],
+    ]
+    if order == _LOOKUP_ORDER:
+        key.insert(0, int(bool(addr.get("vidsk"))))
+    return key
+
+
+def _order_and_page(
+    q: str,
+    qargs: list[Any],
+    order: str,
+    limit: Optional[int],
+    offset: int,
+    after: Optional[dict[str, Any]],
+) -> tuple[str, list[Any]]:
+    """Add ORDER BY and LIMIT clauses to address query, and keep only
+    addresses following the address after, if given."""
+    if after is not None:
+        key = _sort_key(after, order)
+        q += f" AND ({order}) > ({', '.join('?' * len(key))})"
+        qargs = qargs + key
+    return (f"{q} ORDER BY {order} LIMIT ? OFFSET ?", qargs + page_args(limit, offset))
+
+
+def cap_first(s: str) -> str:
     """Returns string with first character capitalized. Why this isn't in
     the Python stdlib is beyond me. The capitalize() function annoyingly
     lowercases the rest of the string."""
     return s[:1].upper() + s[1:] if s else s
 
 
-def iceaddr_lookup(
-    street_name: str,
-    number: Optional[int] = None,
-    letter: Optional[str] = None,
-    postcode: Optional[int] = None,
-    placename: Optional[str] = None,
-    limit: int = 50,
-) -> list[dict[str, Any]]:
-    """Look up all addresses matching criterion"""
+def _normalize_street(s: str) -> str:
+    """Be forgiving, strip and capitalize street name.
+    All street names in DB are capitalized."""
+    return cap_first(s.strip())
 
-    # Be forgiving, strip and capitalize street name. All street names in DB are capitalized.
-    street_name = _cap_first(street_name.strip())
 
-    pc = [postcode] if postcode else []
+def _normalize_placename(s: str) -> str:
+    """Placename as matched against postcode names, which ignores
+    case and diacritics, for use in cache keys."""
+    return fold(s.strip())
 
-    # Look up postcodes for placename if no postcode is provided
-    if placename and not postcode:
-        pc = postcodes_for_placename(placename.strip())
+
+def _lookup_addrs(
+    street_names: list[str],
+    number: Optional[int],
+    letter: Optional[str],
+    postcodes: list[int],
+    limit: Optional[int],
+    offset: int = 0,
+    after: Optional[dict[str, Any]] = None,
+) -> Iterator[dict[str, Any]]:
+    """Look up addresses on any of the given streets."""
     q = "SELECT * FROM stadfong WHERE"
-    name_fields = ["heiti_nf=?", "heiti_tgf=?"]
+    name_fields = [
+        "heiti_nf IN (SELECT value FROM json_each(?))",
+        "heiti_tgf IN (SELECT value FROM json_each(?))",
+    ]
     if not number:
         # Add lookup for churches and places of interest like Harpa
-        name_fields.append("serheiti=?")
+        name_fields.append("serheiti IN (SELECT value FROM json_each(?))")
     q += "({})".format(" OR ".join(name_fields))
-    sqlargs = [street_name] * len(name_fields)
+    sqlargs: list[Any] = [json_list(street_names)] * len(name_fields)
 
     if number:
         q += " AND (husnr=? OR substr(vidsk, 0, instr(vidsk, '-')) = ?)"
@@ -91,44 +158,101 @@ def iceaddr_lookup(
             q += " AND bokst LIKE ? COLLATE NOCASE"
             sqlargs.append(letter)
 
-    if pc:
-        qp = " OR ".join([" postnr=?" for _ in pc])
-        sqlargs.extend([str(x) for x in pc])
-        q += " AND (%s) " % qp
+    if postcodes:
+        # Bind postcodes as a single JSON array, so that the SQL is
+        # the same regardless of their number, and is prepared once
+        q += " AND postnr IN (SELECT value FROM json_each(?))"
+        sqlargs.append(json_list(int(x) for x in postcodes))
 
-    # Ordering by postcode may in fact be a reasonable proxy
-    # for delivering by order of match likelihood since the
-    # lowest postcodes are generally more densely populated
-    q += " ORDER BY vidsk != '', postnr ASC, husnr ASC, bokst ASC LIMIT ?"
-    sqlargs.append(str(limit))
+    return _run_addr_query(*_order_and_page(q, sqlargs, _LOOKUP_ORDER, limit, offset, after))
 
-    return _run_addr_query(q, sqlargs)
 
+def iceaddr_lookup_iter(
+    street_name: str,
+    number: Optional[int] = None,
+    letter: Optional[str] = None,
+    postcode: Optional[int] = None,
+    placename: Optional[str] = None,
+    limit: Optional[int] = None,
+    fuzzy: bool = False,
+    offset: int = 0,
+    after: Optional[dict[str, Any]] = None,
+) -> Iterator[dict[str, Any]]:
+    """Same as iceaddr_lookup(), but streams addresses from the database
+    cursor as they are iterated over, rather than fetching all of them
+    into a list, and returns all matches by default."""
+    page_args(limit, offset)
+
+    street_name = _normalize_street(street_name)
 
-MIN_SEARCH_STR_LEN = 3
+    pc = [postcode] if postcode else []
+
+    # Look up postcodes for placename if no postcode is provided
+    if placename and not postcode:
+        pc = postcodes_for_placename(placename.strip())
+        if not pc and fuzzy:
+            names = fuzzy_matches("postcodes", placename)
+            pc = sorted({c for n in names for c in postcodes_for_placename(n)})
+
+    res = _lookup_addrs([street_name], number, letter, pc, limit, offset, after)
+    if not fuzzy:
+        return res
+    first = next(res, None)
+    if first is not None:
+        return chain([first], res)
+    # An empty page following the last match is no reason to match fuzzily
+    paged = offset or after is not None or limit == 0
+    if paged and next(_lookup_addrs([street_name], number, letter, pc, 1), None) is not None:
+        return iter(())
+    names = fuzzy_matches("streets", street_name)
+    if not names:
+        return iter(())
+    return _lookup_addrs(names, number, letter, pc, limit, offset, after)
+
+
+@cached_by(street_name=_normalize_street, placename=_normalize_placename)
+def iceaddr_lookup(
+    street_name: str,
+    number: Optional[int] = None,
+    letter: Optional[str] = None,
+    postcode: Optional[int] = None,
+    placename: Optional[str] = None,
+    limit: int = 50,
+    fuzzy: bool = False,
+    offset: int = 0,
+    after: Optional[dict[str, Any]] = None,
+) -> list[dict[str, Any]]:
+    """Look up all addresses matching criterion. If fuzzy is True and there
+    is no exact match, street names and placenames with typos or without
+    Icelandic characters also match, e.g. "Oldugata" or "Laugavegr".
+
+    Results can be paged through by passing the last address of the
+    previous page as after, or by skipping offset addresses, as with
+    placename_lookup()."""
+    return list(
+        iceaddr_lookup_iter(
+            street_name, number, letter, postcode, placename, limit, fuzzy, offset, after
+        )
+    )
 
 
-def iceaddr_suggest(search_str: str, limit: int = 50) -> list[dict[str, Any]]:
-    """Parse search string and fetch matching addresses.
-    Made to handle partial and full text queries in
-    the following formats:
+MIN_SEARCH_STR_LEN = 3
 
-    Öldug
-    Öldugata
-    Öldugata 4
-    Öldugata 4, 101
-    Öldugata 4, Reykjavík
-    Öldugata 4, 101 Reykjavík
-    """
+# Max number of matching streets whose addresses are
+# fetched when suggesting from a partial street name
+MAX_SUGGEST_STREETS = 100
 
-    search_str = _cap_first(search_str.strip())
-    if not search_str or len(search_str) < MIN_SEARCH_STR_LEN:
-        return []
 
+def parse_search_str(search_str: str) -> tuple[list[str], str]:
+    """Split address search string into street address and place components.
+    The street address is split into street name, house number and trailing
+    letter, e.g. "Öldugata 4b, 101 Reykjavík" => (["Öldugata", "4", "b"], "101").
+    Only the first word of the place component is kept. Returns an empty
+    street address if there's nothing to search for."""
     items = [s.strip().split() for s in search_str.split(",")]
 
-    if not [a for a in items if len(a)]:
-        return []  # Nothing to search for
+    if not [a for a in items if len(a)] or not items[0]:
+        return ([], "")
 
     # Street name component
     addr = items[0]
@@ -144,13 +268,52 @@ def iceaddr_suggest(search_str: str, limit: int = 50) -> list[dict[str, Any]]:
     else:
         addr = [" ".join(addr)]
 
+    place = items[1][0].strip() if len(items) > 1 and items[1] else ""
+    return (addr, place)
+
+
+def postcodes_for_place(place: str) -> list[int]:
+    """Postcodes for the place component of a search string,
+    either a postcode or a (partial) placename."""
+    if re.match(r"\d\d\d$", place):
+        return [int(place)]
+    return postcodes_for_placename(place, partial=True)
+
+
+def iceaddr_suggest_iter(
+    search_str: str,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    after: Optional[dict[str, Any]] = None,
+) -> Iterator[dict[str, Any]]:
+    """Same as iceaddr_suggest(), but streams addresses from the database
+    cursor as they are iterated over, rather than fetching all of them
+    into a list, and returns all matches by default."""
+    page_args(limit, offset)
+
+    search_str = _normalize_street(search_str)
+    if not search_str or len(search_str) < MIN_SEARCH_STR_LEN:
+        return iter(())
+
+    (addr, place) = parse_search_str(search_str)
+    if not addr:
+        return iter(())  # Nothing to search for
+
     q = "SELECT * FROM stadfong WHERE "
-    qargs: list[str] = []
+    qargs: list[Any] = []
 
     street_name = addr[0]
     if len(addr) == 1:  # "Ölduga"
-        q += " (heiti_nf LIKE ? OR heiti_tgf LIKE ?) "
-        qargs.extend([street_name + "%", street_name + "%"])
+        # Find street names starting with the search string in the prefix
+        # index, and fetch addresses for the top ranked streets only
+        names = street_index().top_matches(street_name, MAX_SUGGEST_STREETS)
+        if not names:
+            return iter(())
+        q += (
+            " (heiti_nf IN (SELECT value FROM json_each(?))"
+            " OR heiti_tgf IN (SELECT value FROM json_each(?))) "
+        )
+        qargs.extend([json_list(names)] * 2)
     elif len(addr) >= 2:  # noqa: PLR2004 "Öldugötu 4"
         # Street name
         q += " (heiti_nf=? OR heiti_tgf=?) "
@@ -171,28 +334,101 @@ def iceaddr_suggest(search_str: str, limit: int = 50) -> list[dict[str, Any]]:
             qargs.append(addr[2])
 
     # Placename component (postcode or placename)
-    if len(items) > 1 and items[1]:
-        pns = items[1]
-        postcodes: list[str] = []
-
-        # Is it a postcode?
-        if re.match(r"\d\d\d$", pns[0]):
-            postcodes.append(pns[0])
-        else:
-            # Try to look up placename
-            pc = postcodes_for_placename(pns[0].strip(), partial=True)
-            if pc:
-                postcodes.extend([str(x) for x in pc])
+    if place:
+        postcodes = postcodes_for_place(place)
 
         if postcodes:
-            qp = " OR ".join([" postnr=? " for _ in postcodes])
-            q += " AND (%s) " % qp
-            qargs.extend(postcodes)
+            q += " AND postnr IN (SELECT value FROM json_each(?)) "
+            qargs.append(json_list(postcodes))
+
+    return _run_addr_query(*_order_and_page(q, qargs, _SUGGEST_ORDER, limit, offset, after))
+
+
+@cached_by(search_str=_normalize_street)
+def iceaddr_suggest(
+    search_str: str,
+    limit: int = 50,
+    offset: int = 0,
+    after: Optional[dict[str, Any]] = None,
+) -> list[dict[str, Any]]:
+    """Parse search string and fetch matching addresses.
+    Made to handle partial and full text queries in
+    the following formats:
+
+    Öldug
+    Öldugata
+    Öldugata 4
+    Öldugata 4, 101
+    Öldugata 4, Reykjavík
+    Öldugata 4, 101 Reykjavík
+
+    Results can be paged through with after or offset, as with
+    placename_lookup().
+    """
+    return list(iceaddr_suggest_iter(search_str, limit, offset, after))
+
+
+def _search_street_names(query: str) -> list[str]:
+    """Street names and special names (e.g. of churches or landmarks)
+    containing the query string, most relevant first. Ranked by BM25
+    if the database has a full-text index, otherwise by length."""
+    cur = shared_db.connection().cursor()
+    if len(query) >= FTS_MIN_LEN:
+        q = "SELECT name FROM stadfong_fts WHERE stadfong_fts MATCH ? ORDER BY rank LIMIT ?"
+        try:
+            return [r[0] for r in cur.execute(q, [fts_phrase(query), MAX_SUGGEST_STREETS])]
+        except sqlite3.OperationalError:
+            pass  # No full-text index in database
+
+    like = f"%{query}%"
+    q = """
+        SELECT heiti_nf FROM stadfong WHERE heiti_nf LIKE ?
+        UNION SELECT heiti_tgf FROM stadfong WHERE heiti_tgf LIKE ?
+        UNION SELECT serheiti FROM stadfong WHERE serheiti LIKE ?
+    """
+    names = sorted((r[0] for r in cur.execute(q, [like] * 3)), key=lambda n: (len(n), n))
+    return names[:MAX_SUGGEST_STREETS]
+
+
+@cached_by(query=search_key)
+def iceaddr_search(query: str, limit: int = 50) -> list[dict[str, Any]]:
+    """Search for addresses whose street name, in nominative or dative case,
+    or special name (e.g. "Harpa") contains the query string, ignoring case.
+    Addresses on the most relevant streets come first, by BM25 ranking of
+    their names, and are otherwise in the same order as iceaddr_lookup().
+    A negative limit means no limit."""
+    query = query.strip()
+    (limit, _) = page_args(limit, 0)
+    if not query or limit == 0:
+        return []
 
-    q += " ORDER BY postnr ASC, husnr ASC, bokst ASC LIMIT ?"
-    qargs.append(str(limit))
+    names = _search_street_names(query)
+    if not names:
+        return []
+    name_rank = {n: i for i, n in enumerate(names)}
+
+    q = """
+        SELECT * FROM stadfong
+        WHERE heiti_nf IN (SELECT value FROM json_each(?))
+        OR heiti_tgf IN (SELECT value FROM json_each(?))
+        OR serheiti IN (SELECT value FROM json_each(?))
+    """
+    cur = shared_db.connection().cursor()
+    rows = list(cur.execute(q, [json_list(names)] * 3))
+
+    def sort_key(r: sqlite3.Row) -> tuple[Any, ...]:
+        rank = min(name_rank.get(r[c], len(names)) for c in ("heiti_nf", "heiti_tgf", "serheiti"))
+        return (
+            rank,
+            r["vidsk"] not in ("", None),
+            -1 if r["postnr"] is None else r["postnr"],
+            -1 if r["husnr"] is None else r["husnr"],
+            r["bokst"] or "",
+            r["hnitnum"],
+        )
 
-    return _run_addr_query(q, qargs)
+    rows.sort(key=sort_key)
+    return [postprocess_addr(row_to_dict(r)) for r in rows[: None if limit < 0 else limit]]
 
 
 def nearest_addr(
@@ -222,6 +458,12 @@ def nearest_addr_with_dist(
     if limit < 0 or max_dist < 0.0:
         raise ValueError("limit and max_dist must be non-negative")
 
+    if limit == 1:
+        # Single cell lookup if the database has a nearest address grid
+        res = grid_nearest(lat, lon, max_dist=max_dist, post_process=postprocess_addr)
+        if res is not None:
+            return res
+
     return find_nearest(
         lat=lat,
         lon=lon,
@@ -230,5 +472,55 @@ def nearest_addr_with_dist(
         id_column="hnitnum",
         limit=limit,
         max_dist=max_dist,
-        post_process=_postprocess_addr,
+        post_process=postprocess_addr,
+    )
+
+
+def nearest_addr_batch(
+    coords: Iterable[Sequence[float]], limit: int = 1, max_dist: float = 0.0, processes: int = 1
+) -> list[list[dict[str, Any]]]:
+    """Find the addresses closest to each of the given coordinates.
+    Accepts a sequence of (lat, lon) pairs or an (N, 2) NumPy array.
+    Returns one list of addresses per point, in input order."""
+
+    results = nearest_addr_batch_with_dist(
+        coords, limit=limit, max_dist=max_dist, processes=processes
+    )
+
+    # Strip out distances, same as nearest_addr()
+    return [[addr for addr, _dist in res] for res in results]
+
+
+def nearest_addr_batch_with_dist(
+    coords: Iterable[Sequence[float]], limit: int = 1, max_dist: float = 0.0, processes: int = 1
+) -> list[list[tuple[dict[str, Any], float]]]:
+    """Find the addresses closest to each of the given coordinates, with distances.
+
+    Much faster than calling nearest_addr_with_dist() in a loop for more
+    than a few dozen points, since points close together share spatial
+    index queries and fetched address rows.
+    Large batches can be split between several worker processes.
+    Returns one list of (address, distance_km) tuples per point, in input order.
+    """
+
+    points = [(float(lat), float(lon)) for lat, lon in coords]
+    for lat, lon in points:
+        if not valid_wgs84_coord(lat, lon):
+            raise ValueError("Invalid latitude or longitude value: {}, {}".format(lat, lon))
+
+    if limit < 0 or max_dist < 0.0:
+        raise ValueError("limit and max_dist must be non-negative")
+
+    if processes < 1:
+        raise ValueError("processes must be at least 1")
+
+    return find_nearest_batch(
+        points,
+        rtree_table="stadfong_rtree",
+        main_table="stadfong",
+        id_column="hnitnum",
+        limit=limit,
+        max_dist=max_dist,
+        post_process=postprocess_addr,
+        processes=processes,
     )
@@ -0,0 +1,301 @@
+"""
+
+iceaddr: Look up information about Icelandic streets, addresses,
+         placenames, landmarks, locations and postcodes.
+
+Copyright (c) 2018-2025 Sveinbjorn Thordarson.
+
+This file contains asyncio versions of the iceaddr lookup functions.
+
+Lookups run on a bounded pool of worker threads, each with its own
+database connection, so they never block the event loop. The number
+of lookups submitted to the pool at any one time is also bounded, so
+a burst of requests queues up on the event loop rather than in the pool.
+Lookups that are cancelled before they start are never run, and running
+database queries of cancelled lookups are interrupted.
+
+The pure in-memory functions (distance, postcode and municipality
+lookups) don't do any I/O and are not wrapped here.
+
+"""
+
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Callable, Iterable, Optional, Sequence, TypeVar
+
+import asyncio
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from . import addresses, bulk, meta, placenames, streets
+from .db import shared_db
+
+T = TypeVar("T")
+
+# Default number of worker threads
+DEFAULT_MAX_WORKERS = 4
+
+# Default max number of lookups submitted to the worker threads at once
+DEFAULT_MAX_CONCURRENCY = 64
+
+_max_workers = DEFAULT_MAX_WORKERS
+_max_concurrency = DEFAULT_MAX_CONCURRENCY
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Semaphores are bound to an event loop, so we keep one per loop
+_semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def configure(max_workers: Optional[int] = None, max_concurrency: Optional[int] = None) -> None:
+    """Set the number of worker threads and the max number of lookups
+    submitted to them at once. Should be called before any lookups are made."""
+    global _executor, _max_workers, _max_concurrency
+    with _executor_lock:
+        if max_workers is not None:
+            if max_workers < 1:
+                raise ValueError("max_workers must be at least 1")
+            _max_workers = max_workers
+        if max_concurrency is not None:
+            if max_concurrency < 1:
+                raise ValueError("max_concurrency must be at least 1")
+            _max_concurrency = max_concurrency
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
+        _semaphores.clear()
+
+
+def shutdown() -> None:
+    """Shut down the worker threads. They are restarted on next use."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_max_workers,
+                thread_name_prefix="iceaddr",
+                initializer=shared_db.dedicated_connection,
+            )
+        return _executor
+
+
+def _get_semaphore(loop: asyncio.AbstractEventLoop) -> asyncio.Semaphore:
+    sem = _semaphores.get(loop)
+    if sem is None:
+        sem = asyncio.Semaphore(_max_concurrency)
+        _semaphores[loop] = sem
+    return sem
+
+
+class _Call:
+    """A single lookup, run on a worker thread."""
+
+    def __init__(self, func: Callable[..., Any], args: Any, kwargs: Any) -> None:
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.cancelled = False
+
+    def __call__(self) -> Any:
+        with self.lock:
+            if self.cancelled:
+                return None
+            self.conn = shared_db.dedicated_connection()
+        try:
+            return self.func(*self.args, **self.kwargs)
+        finally:
+            with self.lock:
+                self.conn = None
+
+    def cancel(self) -> None:
+        """Prevent the call from starting, or interrupt its running query."""
+        with self.lock:
+            self.cancelled = True
+            if self.conn is not None:
+                self.conn.interrupt()
+
+
+async def _run(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run function on a worker thread and wait for the result."""
+    loop = asyncio.get_running_loop()
+    async with _get_semaphore(loop):
+        call = _Call(func, args, kwargs)
+        try:
+            return await loop.run_in_executor(_get_executor(), call)
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+
+
+async def iceaddr_lookup(
+    street_name: str,
+    number: Optional[int] = None,
+    letter: Optional[str] = None,
+    postcode: Optional[int] = None,
+    placename: Optional[str] = None,
+    limit: int = 50,
+    fuzzy: bool = False,
+    offset: int = 0,
+    after: Optional[dict[str, Any]] = None,
+) -> list[dict[str, Any]]:
+    """Async version of iceaddr_lookup()."""
+    return await _run(
+        addresses.iceaddr_lookup,
+        street_name,
+        number=number,
+        letter=letter,
+        postcode=postcode,
+        placename=placename,
+        limit=limit,
+        fuzzy=fuzzy,
+        offset=offset,
+        after=after,
+    )
+
+
+async def iceaddr_suggest(
+    search_str: str, limit: int = 50, offset: int = 0, after: Optional[dict[str, Any]] = None
+) -> list[dict[str, Any]]:
+    """Async version of iceaddr_suggest()."""
+    return await _run(
+        addresses.iceaddr_suggest, search_str, limit=limit, offset=offset, after=after
+    )
+
+
+async def iceaddr_search(query: str, limit: int = 50) -> list[dict[str, Any]]:
+    """Async version of iceaddr_search()."""
+    return await _run(addresses.iceaddr_search, query, limit=limit)
+
+
+async def street_name_suggest(prefix: str, limit: int = 10) -> list[str]:
+    """Async version of street_name_suggest(). The street name index is
+    built from the database on first use."""
+    return await _run(streets.street_name_suggest, prefix, limit=limit)
+
+
+async def nearest_addr(
+    lat: float, lon: float, limit: int = 1, max_dist: float = 0.0
+) -> list[dict[str, Any]]:
+    """Async version of nearest_addr()."""
+    return await _run(addresses.nearest_addr, lat, lon, limit=limit, max_dist=max_dist)
+
+
+async def nearest_addr_with_dist(
+    lat: float, lon: float, limit: int = 1, max_dist: float = 0.0
+) -> list[tuple[dict[str, Any], float]]:
+    """Async version of nearest_addr_with_dist()."""
+    return await _run(addresses.nearest_addr_with_dist, lat, lon, limit=limit, max_dist=max_dist)
+
+
+async def nearest_addr_batch(
+    coords: Iterable[Sequence[float]], limit: int = 1, max_dist: float = 0.0
+) -> list[list[dict[str, Any]]]:
+    """Async version of nearest_addr_batch()."""
+    return await _run(addresses.nearest_addr_batch, coords, limit=limit, max_dist=max_dist)
+
+
+async def nearest_addr_batch_with_dist(
+    coords: Iterable[Sequence[float]], limit: int = 1, max_dist: float = 0.0
+) -> list[list[tuple[dict[str, Any], float]]]:
+    """Async version of nearest_addr_batch_with_dist()."""
+    return await _run(
+        addresses.nearest_addr_batch_with_dist, coords, limit=limit, max_dist=max_dist
+    )
+
+
+async def placename_lookup(
+    placename: str,
+    partial: bool = False,
+    fuzzy: bool = False,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    after: Optional[dict[str, Any]] = None,
+) -> list[dict[str, Any]]:
+    """Async version of placename_lookup()."""
+    return await _run(
+        placenames.placename_lookup,
+        placename,
+        partial=partial,
+        fuzzy=fuzzy,
+        limit=limit,
+        offset=offset,
+        after=after,
+    )
+
+
+async def placename_search(query: str, limit: int = 50) -> list[dict[str, Any]]:
+    """Async version of placename_search()."""
+    return await _run(placenames.placename_search, query, limit=limit)
+
+
+async def nearest_placenames(
+    lat: float, lon: float, limit: int = 1, max_dist: float = 0.0
+) -> list[dict[str, Any]]:
+    """Async version of nearest_placenames()."""
+    return await _run(placenames.nearest_placenames, lat, lon, limit=limit, max_dist=max_dist)
+
+
+async def nearest_placenames_with_dist(
+    lat: float, lon: float, limit: int = 1, max_dist: float = 0.0
+) -> list[tuple[dict[str, Any], float]]:
+    """Async version of nearest_placenames_with_dist()."""
+    return await _run(
+        placenames.nearest_placenames_with_dist, lat, lon, limit=limit, max_dist=max_dist
+    )
+
+
+async def nearest_placenames_batch(
+    coords: Iterable[Sequence[float]], limit: int = 1, max_dist: float = 0.0
+) -> list[list[dict[str, Any]]]:
+    """Async version of nearest_placenames_batch()."""
+    return await _run(placenames.nearest_placenames_batch, coords, limit=limit, max_dist=max_dist)
+
+
+async def nearest_placenames_batch_with_dist(
+    coords: Iterable[Sequence[float]], limit: int = 1, max_dist: float = 0.0
+) -> list[list[tuple[dict[str, Any], float]]]:
+    """Async version of nearest_placenames_batch_with_dist()."""
+    return await _run(
+        placenames.nearest_placenames_batch_with_dist, coords, limit=limit, max_dist=max_dist
+    )
+
+
+async def iceaddr_metadata() -> dict[str, Any]:
+    """Async version of iceaddr_metadata()."""
+    return await _run(meta.iceaddr_metadata)
+
+
+def _geocode_chunk(geocoder: bulk.BulkGeocoder, chunk: list[str]) -> list[bulk.GeocodeResult]:
+    return list(geocoder.geocode(chunk))
+
+
+async def geocode(
+    addr_strs: Iterable[str], chunk_size: int = bulk.DEFAULT_CHUNK_SIZE
+) -> AsyncIterator[bulk.GeocodeResult]:
+    """Async version of geocode(). Each chunk of address strings is
+    geocoded on a worker thread, and its results are yielded when done.
+    Address strings are read from addr_strs on the event loop."""
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    geocoder = bulk.BulkGeocoder(chunk_size)
+    it = iter(addr_strs)
+    while True:
+        chunk = list(islice(it, chunk_size))
+        if not chunk:
+            break
+        for res in await _run(_geocode_chunk, geocoder, chunk):
+            yield res
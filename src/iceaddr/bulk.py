@@ -0,0 +1,272 @@
+"""
+
+iceaddr: Look up information about Icelandic streets, addresses,
+         placenames, landmarks, locations and postcodes.
+
+Copyright (c) 2018-2025 Sveinbjorn Thordarson.
+
+This file contains a streaming batch geocoder for large lists of
+address strings, e.g. CSV exports with hundreds of thousands of rows.
+
+Input is read and results are produced one chunk of rows at a time,
+so memory use stays constant regardless of input size. Repeated
+addresses are only resolved once, and all addresses on the same
+street within a chunk share a single database lookup.
+
+"""
+
+from __future__ import annotations
+
+from typing import IO, Any, Iterable, Iterator, Optional
+
+import csv
+import sqlite3
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from .addresses import cap_first, parse_search_str, postcodes_for_place, postprocess_addr
+from .db import json_list, row_to_dict, shared_db
+
+# Default number of input rows processed at a time
+DEFAULT_CHUNK_SIZE = 1000
+
+# Max number of distinct addresses whose results are remembered,
+# and of distinct streets whose addresses are kept in memory
+MAX_CACHED_ADDRESSES = 100000
+MAX_CACHED_STREETS = 1000
+
+# Match confidence is 1.0 for an exact match, multiplied by
+# the following for each part of the address that didn't match
+CONFIDENCE_NO_NUMBER = 0.5  # No house number given, or not found on street
+CONFIDENCE_NO_LETTER = 0.8  # House letter not found
+CONFIDENCE_NO_PLACE = 0.5  # Street not found in the given postcode or place
+CONFIDENCE_AMBIGUOUS = 0.7  # No place given, and matches in more than one postcode
+
+# Address keys added to each row of CSV output
+CSV_COLUMNS = (
+    "hnitnum",
+    "heiti_nf",
+    "husnr",
+    "bokst",
+    "postnr",
+    "stadur_nf",
+    "lat_wgs84",
+    "long_wgs84",
+    "confidence",
+)
+
+# Result for a single address: (address dict or None, confidence)
+GeocodeResult = tuple[Optional[dict[str, Any]], float]
+
+
+class _BoundedDict(OrderedDict[Any, Any]):
+    """Dict which drops its oldest keys when above a max size."""
+
+    def __init__(self, max_size: int) -> None:
+        super().__init__()
+        self.max_size = max_size
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        super().__setitem__(key, value)
+        if len(self) > self.max_size:
+            self.popitem(last=False)
+
+
+def _normalize(addr_str: str) -> str:
+    """Normalize whitespace and capitalization of an address string."""
+    return cap_first(" ".join(addr_str.split()).replace(" ,", ","))
+
+
+def _sort_key(r: sqlite3.Row) -> tuple[Any, ...]:
+    # Same order as iceaddr_lookup(), with NULLs replaced the same way
+    return (
+        r["vidsk"] not in ("", None),
+        -1 if r["postnr"] is None else r["postnr"],
+        -1 if r["husnr"] is None else r["husnr"],
+        r["bokst"] or "",
+        r["hnitnum"],
+    )
+
+
+def _number_matches(r: sqlite3.Row, number: str) -> bool:
+    if "-" in number:
+        return r["vidsk"] == number
+    return str(r["husnr"]) == number or (r["vidsk"] or "").split("-")[0] == number
+
+
+class BulkGeocoder:
+    """Geocodes address strings in chunks, remembering recent results.
+
+    Address strings are in the same format as accepted by iceaddr_suggest(),
+    e.g. "Öldugata 4", "Öldugata 4b, 101" or "Öldugötu 4, Reykjavík".
+    """
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        self.chunk_size = chunk_size
+        self._results: _BoundedDict = _BoundedDict(MAX_CACHED_ADDRESSES)
+        # Street name => its addresses, in nominative or dative case
+        self._streets: _BoundedDict = _BoundedDict(MAX_CACHED_STREETS)
+        self._postcodes: _BoundedDict = _BoundedDict(MAX_CACHED_STREETS)
+
+    def geocode(self, addr_strs: Iterable[str]) -> Iterator[GeocodeResult]:
+        """Geocode address strings, yielding an (address, confidence)
+        tuple for each of them, in input order. Address is None
+        if nothing matched."""
+        it = iter(addr_strs)
+        while True:
+            chunk = [_normalize(s or "") for s in islice(it, self.chunk_size)]
+            if not chunk:
+                break
+            yield from self._geocode_chunk(chunk)
+
+    def _geocode_chunk(self, chunk: list[str]) -> list[GeocodeResult]:
+        resolved: dict[str, GeocodeResult] = {}
+        parsed: dict[str, tuple[list[str], str]] = {}
+        for s in chunk:
+            if s in resolved or s in parsed:
+                continue
+            res = self._results.get(s)
+            if res is not None:
+                resolved[s] = res
+            else:
+                parsed[s] = parse_search_str(s)
+
+        # Look up all streets in this chunk at once
+        streets = self._fetch_streets({addr[0] for addr, _ in parsed.values() if addr})
+
+        for s, (addr, place) in parsed.items():
+            res = self._match(streets.get(addr[0]) if addr else None, addr, place)
+            resolved[s] = self._results[s] = res
+
+        results: list[GeocodeResult] = []
+        for s in chunk:
+            (match, confidence) = resolved[s]
+            # Each result gets its own copy of the address dict
+            results.append((dict(match) if match else None, confidence))
+        return results
+
+    def _fetch_streets(self, names: set[str]) -> dict[str, list[sqlite3.Row]]:
+        """Return addresses on each of the named streets, or with the given
+        special name (e.g. of a church or landmark), sorted in the same
+        order as by iceaddr_lookup(). Streets are only looked up in the
+        database if not looked up recently."""
+        streets = {n: self._streets[n] for n in names if n in self._streets}
+        missing = [n for n in names if n not in streets]
+        if not missing:
+            return streets
+        found: dict[str, list[sqlite3.Row]] = {n: [] for n in missing}
+        q = """
+            SELECT * FROM stadfong
+            WHERE heiti_nf IN (SELECT value FROM json_each(?))
+            OR heiti_tgf IN (SELECT value FROM json_each(?))
+            OR serheiti IN (SELECT value FROM json_each(?))
+        """
+        cur = shared_db.connection().cursor()
+        for r in cur.execute(q, [json_list(missing)] * 3):
+            for name in {r["heiti_nf"], r["heiti_tgf"], r["serheiti"]}:
+                if name in found:
+                    found[name].append(r)
+        for name, rows in found.items():
+            streets[name] = self._streets[name] = sorted(rows, key=_sort_key)
+        return streets
+
+    def _place_postcodes(self, place: str) -> set[int]:
+        if place not in self._postcodes:
+            self._postcodes[place] = set(postcodes_for_place(place))
+        return self._postcodes[place]
+
+    def _match(
+        self, rows: Optional[list[sqlite3.Row]], addr: list[str], place: str
+    ) -> GeocodeResult:
+        """Find best matching address among the addresses on a street,
+        and the match confidence."""
+        if rows and len(addr) > 1:
+            # As in iceaddr_lookup(), special names only match without a number
+            rows = [r for r in rows if addr[0] in (r["heiti_nf"], r["heiti_tgf"])]
+        if not rows:
+            return (None, 0.0)
+
+        confidence = 1.0
+        if place:
+            postcodes = self._place_postcodes(place)
+            in_place = [r for r in rows if r["postnr"] in postcodes]
+            if in_place:
+                rows = in_place
+            else:
+                confidence *= CONFIDENCE_NO_PLACE
+
+        if len(addr) > 1:
+            with_number = [r for r in rows if _number_matches(r, addr[1])]
+            if with_number:
+                rows = with_number
+                if len(addr) > 2:
+                    with_letter = [r for r in rows if (r["bokst"] or "").lower() == addr[2]]
+                    if with_letter:
+                        rows = with_letter
+                    else:
+                        confidence *= CONFIDENCE_NO_LETTER
+            else:
+                confidence *= CONFIDENCE_NO_NUMBER
+        else:
+            confidence *= CONFIDENCE_NO_NUMBER
+
+        if not place and len({r["postnr"] for r in rows}) > 1:
+            confidence *= CONFIDENCE_AMBIGUOUS
+
+        return (postprocess_addr(row_to_dict(rows[0])), round(confidence, 3))
+
+
+def geocode(
+    addr_strs: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[GeocodeResult]:
+    """Geocode an iterable of address strings, e.g. lines of a file, lazily.
+    Yields an (address, confidence) tuple for each address string, in input
+    order. Address is None if nothing matched. Confidence ranges from 0.0
+    (no match) to 1.0 (exact match of all parts of the address string)."""
+    return BulkGeocoder(chunk_size).geocode(addr_strs)
+
+
+def geocode_csv(
+    infile: IO[str],
+    outfile: IO[str],
+    column: str = "address",
+    delimiter: str = ",",
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> dict[str, Any]:
+    """Geocode the address strings in the given column of a CSV file with
+    a header row. Writes each input row to outfile with address keys
+    and match confidence added, as soon as its chunk is processed.
+    Returns number of rows, number of matched rows and rows per second."""
+    reader = csv.DictReader(infile, delimiter=delimiter)
+    if reader.fieldnames is None or column not in reader.fieldnames:
+        raise ValueError(f"Column not found in CSV input: {column}")
+
+    fields = list(reader.fieldnames) + [c for c in CSV_COLUMNS if c not in reader.fieldnames]
+    writer = csv.DictWriter(outfile, fieldnames=fields, delimiter=delimiter)
+    writer.writeheader()
+
+    geocoder = BulkGeocoder(chunk_size)
+    (num_rows, num_matched) = (0, 0)
+    t0 = time.perf_counter()
+    while True:
+        rows = list(islice(reader, chunk_size))
+        if not rows:
+            break
+        for row, (match, confidence) in zip(rows, geocoder.geocode(r[column] or "" for r in rows)):
+            for c in CSV_COLUMNS:
+                row[c] = match.get(c) if match else None
+            row["confidence"] = confidence
+            num_matched += match is not None
+        writer.writerows(rows)
+        num_rows += len(rows)
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "rows": num_rows,
+        "matched": num_matched,
+        "elapsed": elapsed,
+        "rows_per_sec": num_rows / elapsed if elapsed > 0 else 0.0,
+    }
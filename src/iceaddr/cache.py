@@ -0,0 +1,224 @@
+"""
+
+iceaddr: Look up information about Icelandic streets, addresses,
+         placenames, landmarks, locations and postcodes.
+
+Copyright (c) 2018-2025 Sveinbjorn Thordarson.
+
+This file contains an optional in-memory cache of lookup results.
+
+Caching is disabled by default, and is enabled by calling enable_cache().
+Results are cached in least-recently-used order, bounded both by number
+of entries and by their approximate size in bytes. Results are stored
+in frozen form, and callers get fresh copies, so modifying a returned
+result never affects the cache. The cache is cleared automatically
+when the database is replaced by one with a different creation date,
+or its data version changes after an incremental update.
+
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Hashable, Optional, TypeVar, cast
+
+import functools
+import inspect
+import sys
+import threading
+from collections import OrderedDict
+
+from .meta import check_data_version, on_data_change
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Default max number of cached results
+DEFAULT_MAX_ENTRIES = 10000
+
+# Default max total size of cached results, in bytes
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# Frozen result: a tuple of (key, value) tuples for each result dict
+_Frozen = tuple[tuple[tuple[str, Any], ...], ...]
+
+
+def _freeze(res: list[dict[str, Any]]) -> _Frozen:
+    return tuple(tuple(d.items()) for d in res)
+
+
+def _thaw(frozen: _Frozen) -> list[dict[str, Any]]:
+    return [dict(items) for items in frozen]
+
+
+def _size(frozen: _Frozen) -> int:
+    """Approximate memory footprint of a frozen result, in bytes. Dict
+    keys are column names shared by all results and are not counted."""
+    size = sys.getsizeof(frozen)
+    for items in frozen:
+        size += sys.getsizeof(items) + sum(sys.getsizeof(v) for _, v in items)
+    return size
+
+
+class LRUCache:
+    """Thread-safe LRU cache of frozen lookup results."""
+
+    def __init__(self, max_entries: int, max_bytes: int) -> None:
+        if max_entries < 1 or max_bytes < 1:
+            raise ValueError("max_entries and max_bytes must be at least 1")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Key => (frozen result, size in bytes)
+        self._entries: OrderedDict[Hashable, tuple[_Frozen, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[_Frozen]:
+        """Return cached result for key, or None if not cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, frozen: _Frozen) -> None:
+        """Add result to cache, evicting least recently used results as needed."""
+        size = _size(frozen)
+        if size > self.max_bytes:
+            return  # Too large to cache at all
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (frozen, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                (_, (_, evicted_size)) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Remove all cached results."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def invalidate(self) -> None:
+        """Remove all cached results, as they came from a database
+        that has since changed."""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Cache counters and current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache: Optional[LRUCache] = None
+
+
+def enable_cache(
+    max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES
+) -> None:
+    """Enable caching of address and placename lookup results, replacing
+    any existing cache."""
+    global _cache
+    _cache = LRUCache(max_entries, max_bytes)
+
+
+def disable_cache() -> None:
+    """Disable caching and discard all cached results."""
+    global _cache
+    _cache = None
+
+
+def clear_cache() -> None:
+    """Discard all cached results, keeping the cache enabled."""
+    if _cache is not None:
+        _cache.clear()
+
+
+def cache_stats() -> dict[str, Any]:
+    """Hit, miss and eviction counters and current size of the cache,
+    or an empty dict if caching is disabled."""
+    return _cache.stats() if _cache is not None else {}
+
+
+def _invalidate_cache() -> None:
+    if _cache is not None:
+        _cache.invalidate()
+
+
+on_data_change(_invalidate_cache)
+
+
+def _key_arg(arg: Any) -> Hashable:
+    """Argument for use in a cache key. Dicts, e.g. the address or
+    placename a page of results should follow, are frozen."""
+    if isinstance(arg, dict):
+        return tuple(sorted(cast("dict[str, Any]", arg).items()))
+    return arg
+
+
+def cached_by(**normalizers: Callable[[Any], Any]) -> Callable[[F], F]:
+    """Same as cached, but the arguments named are normalized by the given
+    functions before they are used in the cache key, the same way the
+    lookup function itself normalizes them, so that e.g. "öldugata " and
+    "Öldugata" share a cache entry. Arguments that are None are not."""
+
+    def decorator(func: F) -> F:
+        sig = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            cache = _cache
+            if cache is None:
+                return func(*args, **kwargs)
+
+            bound = sig.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = (func.__name__,) + tuple(
+                _key_arg(a if a is None or name not in normalizers else normalizers[name](a))
+                for name, a in bound.arguments.items()
+            )
+
+            check_data_version()
+            frozen = cache.get(key)
+            if frozen is not None:
+                return _thaw(frozen)
+
+            res = func(*args, **kwargs)
+            cache.put(key, _freeze(res))
+            return res
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def cached(func: F) -> F:
+    """Decorator caching results of a lookup function returning a list of
+    dicts, when caching is enabled. Arguments are bound to parameters so
+    that passing them by position or keyword, or omitting defaults,
+    doesn't result in separate cache entries. They are otherwise used as
+    is, since lookup functions differ in how they normalize them, e.g.
+    placename_lookup() doesn't strip whitespace; see cached_by()."""
+    return cached_by()(func)
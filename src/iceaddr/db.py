@@ -9,34 +9,375 @@ This file contains code related to the iceaddr sqlite3 database.
 
 """
 
+from typing import Any, Iterable, Iterator, Optional
+
+import json
+import os
 import sqlite3
+import threading
+import time
 from importlib import resources
 
 _DB_REL_PATH = "iceaddr.db"
 
+# Default max number of database connections per process
+DEFAULT_POOL_SIZE = min(8, os.cpu_count() or 1)
+
+# Default SQLite settings for each connection, see SharedDB
+DEFAULT_MMAP_SIZE = 0
+DEFAULT_CACHE_SIZE = -2000
+DEFAULT_IMMUTABLE = False
+DEFAULT_TEMP_STORE = "default"
+DEFAULT_QUERY_ONLY = False
+DEFAULT_IN_MEMORY = False
+
+TEMP_STORE_MODES = ("default", "file", "memory")
+
+# Number of prepared statements kept per connection. Lookup queries
+# are built from a small fixed set of SQL strings, with variable-length
+# lists bound as a single JSON array parameter (see json_list()), so
+# they are all prepared once and then reused.
+CACHED_STATEMENTS = 256
+
+# Min length of strings matched using the trigram full-text indexes
+FTS_MIN_LEN = 3
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    return value.lower() in ("1", "true", "yes", "on") if value else default
+
 
 class SharedDB:
-    """Singleton object wrapper for local SQLite3 database."""
+    """Shared read-only connections to the local SQLite3 database.
+
+    Each thread is given its own connection, opened lazily, so that
+    lookups from different threads don't serialize on a single
+    connection. Once pool_size connections have been opened, further
+    threads share the existing connections in round-robin fashion.
+
+    SQLite settings applied to each connection:
+        mmap_size: Max bytes of the database file to memory-map, 0 for none
+        cache_size: Page cache size, in pages if positive, in KiB if negative
+        immutable: Open the database file as immutable, which skips
+            all locking and change detection
+        temp_store: Where temporary tables and indexes are kept,
+            "default", "file" or "memory"
+        query_only: Refuse all changes to the database
+        in_memory: Copy the whole database into memory when the first
+            connection is opened, and have all connections use the copy
+
+    Settings can also be given via the ICEADDR_DB_POOL_SIZE, ICEADDR_DB_MMAP_SIZE,
+    ICEADDR_DB_CACHE_SIZE, ICEADDR_DB_IMMUTABLE, ICEADDR_DB_TEMP_STORE,
+    ICEADDR_DB_QUERY_ONLY and ICEADDR_DB_IN_MEMORY env vars.
+    """
 
-    def __init__(self):
-        self.db_conn = None
+    def __init__(
+        self,
+        pool_size: Optional[int] = None,
+        mmap_size: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        immutable: Optional[bool] = None,
+        temp_store: Optional[str] = None,
+        query_only: Optional[bool] = None,
+        in_memory: Optional[bool] = None,
+    ):
+        self.pool_size: int
+        self.mmap_size: int
+        self.cache_size: int
+        self.immutable: bool
+        self.temp_store: str
+        self.query_only: bool
+        self.in_memory: bool
+        # Settings from env vars, overridden by any given as arguments
+        self._set(
+            pool_size=_env_int("ICEADDR_DB_POOL_SIZE", DEFAULT_POOL_SIZE),
+            mmap_size=_env_int("ICEADDR_DB_MMAP_SIZE", DEFAULT_MMAP_SIZE),
+            cache_size=_env_int("ICEADDR_DB_CACHE_SIZE", DEFAULT_CACHE_SIZE),
+            immutable=_env_bool("ICEADDR_DB_IMMUTABLE", DEFAULT_IMMUTABLE),
+            temp_store=os.environ.get("ICEADDR_DB_TEMP_STORE") or DEFAULT_TEMP_STORE,
+            query_only=_env_bool("ICEADDR_DB_QUERY_ONLY", DEFAULT_QUERY_ONLY),
+            in_memory=_env_bool("ICEADDR_DB_IN_MEMORY", DEFAULT_IN_MEMORY),
+        )
+        self._set(pool_size, mmap_size, cache_size, immutable, temp_store, query_only, in_memory)
+        self._conns: list[sqlite3.Connection] = []
+        self._dedicated: list[sqlite3.Connection] = []
+        self._next_slot = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Connection keeping the in-memory copy of the database alive
+        self._mem_conn: Optional[sqlite3.Connection] = None
+        self._mem_stats: dict[str, Any] = {}
 
     def connection(self) -> sqlite3.Connection:
-        # Open connection lazily
-        if not self.db_conn:
-            db_path = resources.files("iceaddr").joinpath(_DB_REL_PATH)
-
-            # Open database file in read-only mode via URI
-            # As long as we're read-only, thread safety is not an issue
-            db_uri = f"file:{db_path}?mode=ro"
-            self.db_conn = sqlite3.connect(db_uri, uri=True, check_same_thread=False)
-
-            # Return rows as key-value dicts
-            self.db_conn.row_factory = lambda c, r: dict(  # type: ignore noqa: PGH003
-                zip([col[0] for col in c.description], r)  # type: ignore noqa: PGH003
+        # Fast path, this thread already has a connection
+        local = self._local
+        if getattr(local, "generation", None) == self._generation:
+            return local.conn
+
+        with self._lock:
+            slot = self._next_slot % self.pool_size
+            self._next_slot += 1
+            if slot >= len(self._conns):
+                self._conns.append(self._open())
+            local.conn = self._conns[slot]
+            local.generation = self._generation
+            local.dedicated = False
+
+        return local.conn
+
+    def dedicated_connection(self) -> sqlite3.Connection:
+        """Return a connection reserved for the calling thread, outside of the
+        shared pool, opening it if needed. Used by worker threads that must never
+        share their connection with other threads, e.g. so that their queries
+        can be interrupted. Subsequent calls to connection() from the thread
+        return the same connection."""
+        local = self._local
+        if getattr(local, "generation", None) == self._generation and local.dedicated:
+            return local.conn
+
+        with self._lock:
+            local.conn = self._open()
+            local.generation = self._generation
+            local.dedicated = True
+            self._dedicated.append(local.conn)
+
+        return local.conn
+
+    def _file_uri(self) -> str:
+        db_path = resources.files("iceaddr").joinpath(_DB_REL_PATH)
+
+        # Open database file in read-only mode via URI
+        # As long as we're read-only, thread safety is not an issue
+        db_uri = f"file:{db_path}?mode=ro"
+        if self.immutable:
+            db_uri += "&immutable=1"
+        return db_uri
+
+    def _mem_uri(self) -> str:
+        # Named in-memory database, shared by all connections opened with
+        # the same URI in this process. Forked child processes load their own.
+        return f"file:iceaddr_mem_{os.getpid()}_{id(self)}?mode=memory&cache=shared"
+
+    def _load_into_memory(self) -> None:
+        """Copy the database file into a shared in-memory database,
+        using the SQLite backup API. Must be called with the lock held."""
+        t0 = time.perf_counter()
+        mem_conn = sqlite3.connect(self._mem_uri(), uri=True, check_same_thread=False)
+        src = sqlite3.connect(self._file_uri(), uri=True)
+        try:
+            src.backup(mem_conn)
+        finally:
+            src.close()
+        (page_count,) = mem_conn.execute("PRAGMA page_count").fetchone()
+        (page_size,) = mem_conn.execute("PRAGMA page_size").fetchone()
+        self._mem_conn = mem_conn
+        self._mem_stats = {
+            "load_time": time.perf_counter() - t0,
+            "memory_bytes": page_count * page_size,
+        }
+
+    def _open(self) -> sqlite3.Connection:
+        """Open a new connection to the database."""
+        if self.in_memory:
+            if self._mem_conn is None:
+                self._load_into_memory()
+            conn = sqlite3.connect(
+                self._mem_uri(),
+                uri=True,
+                check_same_thread=False,
+                cached_statements=CACHED_STATEMENTS,
+            )
+            # The in-memory copy is writable, so make sure it's never changed
+            conn.execute("PRAGMA query_only=1")
+        else:
+            conn = sqlite3.connect(
+                self._file_uri(),
+                uri=True,
+                check_same_thread=False,
+                cached_statements=CACHED_STATEMENTS,
+            )
+
+        # Return rows as sqlite3.Row objects, which support access by
+        # column name and are much cheaper to create than dicts. Callers
+        # convert to dicts only the rows they actually return.
+        conn.row_factory = sqlite3.Row
+
+        if self.mmap_size and not self.in_memory:
+            # Read pages straight from the OS page cache, which is shared
+            # between processes, instead of copying them into SQLite's cache
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        if self.cache_size != DEFAULT_CACHE_SIZE:
+            conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        if self.temp_store != "default":
+            conn.execute(f"PRAGMA temp_store={self.temp_store}")
+        if self.query_only:
+            conn.execute("PRAGMA query_only=1")
+
+        return conn
+
+    def configure(
+        self,
+        pool_size: Optional[int] = None,
+        mmap_size: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        immutable: Optional[bool] = None,
+        temp_store: Optional[str] = None,
+        query_only: Optional[bool] = None,
+        in_memory: Optional[bool] = None,
+    ) -> None:
+        """Change settings, see class docstring. Settings that are None are
+        left unchanged. Closes all open connections, so this should be
+        called at startup, before lookups are made from other threads."""
+        with self._lock:
+            self._set(
+                pool_size, mmap_size, cache_size, immutable, temp_store, query_only, in_memory
             )
+            self._close_all()
+
+    def warm_up(self) -> dict[str, Any]:
+        """Open a connection for the calling thread now rather than on first
+        lookup, loading the in-memory copy of the database if enabled.
+        Returns load time (in seconds) and size (in bytes) of the in-memory
+        copy, or an empty dict if the database isn't loaded into memory."""
+        self.connection()
+        return self.memory_stats()
+
+    def memory_stats(self) -> dict[str, Any]:
+        """Load time (in seconds) and size (in bytes) of the in-memory copy
+        of the database, or an empty dict if it hasn't been loaded."""
+        return dict(self._mem_stats)
+
+    def _set(
+        self,
+        pool_size: Optional[int] = None,
+        mmap_size: Optional[int] = None,
+        cache_size: Optional[int] = None,
+        immutable: Optional[bool] = None,
+        temp_store: Optional[str] = None,
+        query_only: Optional[bool] = None,
+        in_memory: Optional[bool] = None,
+    ) -> None:
+        """Validate and apply settings."""
+        if pool_size is not None and pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        if mmap_size is not None and mmap_size < 0:
+            raise ValueError("mmap_size must be non-negative")
+        if temp_store is not None and temp_store not in TEMP_STORE_MODES:
+            raise ValueError(f"Unknown temp_store mode: {temp_store}")
+
+        if pool_size is not None:
+            self.pool_size = pool_size
+        if mmap_size is not None:
+            self.mmap_size = mmap_size
+        if cache_size is not None:
+            self.cache_size = cache_size
+        if immutable is not None:
+            self.immutable = immutable
+        if temp_store is not None:
+            self.temp_store = temp_store
+        if query_only is not None:
+            self.query_only = query_only
+        if in_memory is not None:
+            self.in_memory = in_memory
+
+    def settings(self) -> dict[str, Any]:
+        """Current settings."""
+        return {
+            "pool_size": self.pool_size,
+            "mmap_size": self.mmap_size,
+            "cache_size": self.cache_size,
+            "immutable": self.immutable,
+            "temp_store": self.temp_store,
+            "query_only": self.query_only,
+            "in_memory": self.in_memory,
+        }
+
+    def reset_after_fork(self) -> None:
+        """Forget connections inherited from the parent process, without
+        closing them, as SQLite connections must not be used across fork().
+        Called in child processes before any lookups are made."""
+        self._conns = []
+        self._dedicated = []
+        self._mem_conn = None
+        self._mem_stats = {}
+        self._next_slot = 0
+        self._generation += 1
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def close(self) -> None:
+        """Close all open connections. They are reopened lazily on next use."""
+        with self._lock:
+            self._close_all()
+
+    def _close_all(self) -> None:
+        for conn in self._conns + self._dedicated:
+            conn.close()
+        if self._mem_conn is not None:
+            # Closing the last connection frees the in-memory copy
+            self._mem_conn.close()
+            self._mem_conn = None
+            self._mem_stats = {}
+        self._conns = []
+        self._dedicated = []
+        self._next_slot = 0
+        # Invalidate connections cached by threads
+        self._generation += 1
+
+
+def dict_rows(cur: sqlite3.Cursor) -> list[dict[str, Any]]:
+    """Fetch all result rows from cursor as key-value dicts. Column
+    names are read once per query rather than once per row."""
+    cols = [col[0] for col in cur.description]
+    return [dict(zip(cols, r)) for r in cur]
+
+
+def iter_dict_rows(cur: sqlite3.Cursor) -> Iterator[dict[str, Any]]:
+    """Stream result rows from cursor as key-value dicts, as they are
+    fetched, rather than fetching all of them into a list."""
+    cols = [col[0] for col in cur.description]
+    return (dict(zip(cols, r)) for r in cur)
+
+
+def page_args(limit: Optional[int], offset: int) -> list[int]:
+    """Arguments for "LIMIT ? OFFSET ?", where a limit of None means no
+    limit, as does a negative limit in SQLite. Raises ValueError if offset
+    is negative."""
+    if offset < 0:
+        raise ValueError("offset must be non-negative")
+    return [-1 if limit is None or limit < 0 else limit, offset]
+
+
+def row_to_dict(row: sqlite3.Row) -> dict[str, Any]:
+    """Convert a single result row to a key-value dict."""
+    return dict(zip(row.keys(), row))
+
+
+def json_list(values: Iterable[Any]) -> str:
+    """Encode values as a JSON array, for binding a list of any length to
+    a single parameter, e.g. "WHERE postnr IN (SELECT value FROM json_each(?))".
+    Unlike "IN (?,?,...)", the SQL is the same regardless of list length."""
+    return json.dumps(list(values), ensure_ascii=False)
+
+
+def fts_phrase(s: str) -> str:
+    """Quote string as an FTS5 phrase, for matching it as a substring
+    in a trigram full-text index, e.g. "ornefni_fts MATCH ?"."""
+    return '"' + s.replace('"', '""') + '"'
+
 
-        return self.db_conn
+def search_key(query: str) -> str:
+    """Search query as matched, for use in cache keys. Queries long enough
+    to be matched in a trigram full-text index are matched ignoring case."""
+    query = query.strip()
+    return query.lower() if len(query) >= FTS_MIN_LEN else query
 
 
 shared_db = SharedDB()
@@ -0,0 +1,230 @@
+"""
+
+iceaddr: Look up information about Icelandic streets, addresses,
+         placenames, landmarks, locations and postcodes.
+
+Copyright (c) 2018-2025 Sveinbjorn Thordarson.
+
+This file contains typo-tolerant matching of street names, placenames
+and postcode place names, used by lookups with fuzzy=True.
+
+Names are folded to lowercase ASCII, so that e.g. "Oldugata" matches
+"Öldugata", and looked up in a symmetric delete index (as in SymSpell),
+which finds all names within a small edit distance of the search string
+without comparing it to every name. Only the few matching names are then
+looked up in the database.
+
+"""
+
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from itertools import combinations
+
+from .db import shared_db
+from .meta import check_data_version, on_data_change
+from .postcodes import POSTCODES
+from .text import fold
+
+# Max edit distance of fuzzy matches
+STREET_MAX_DISTANCE = 2
+PLACENAME_MAX_DISTANCE = 1
+
+# Only deletes from this many leading characters of each name are indexed,
+# which bounds index size regardless of name length. Differences further
+# into a name are still counted when matches are verified.
+PREFIX_LENGTH = 7
+
+
+def _deletes(s: str, max_distance: int) -> set[str]:
+    """All strings made by deleting up to max_distance characters from s."""
+    res = {s}
+    for n in range(1, min(max_distance, len(s)) + 1):
+        for idxs in combinations(range(len(s)), n):
+            res.add("".join(c for i, c in enumerate(s) if i not in idxs))
+    return res
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Edit distance between two strings, counting insertions, deletions,
+    substitutions and transpositions of adjacent characters. Returns
+    max_distance + 1 if the distance is greater than max_distance."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2: list[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > max_distance:
+            return max_distance + 1
+        (prev2, prev) = (prev, cur)
+    return min(prev[-1], max_distance + 1)
+
+
+class SymSpellIndex:
+    """Symmetric delete index of names, for finding all names within a
+    given edit distance of a search string.
+
+    Deletes of up to max_distance characters from each folded name are
+    precomputed. Two names are within edit distance d of each other only if
+    they share some string made by deleting up to d characters from each,
+    so candidates are found by looking up the deletes of the search string.
+    For a compact, bounded footprint, the deletes are stored as sorted
+    hashes in a flat array, with the name each came from in another.
+    Hash collisions only add candidates, which are verified anyway.
+    """
+
+    def __init__(
+        self,
+        names: Iterable[tuple[str, int]],
+        max_distance: int,
+        prefix_length: int = PREFIX_LENGTH,
+    ) -> None:
+        t0 = time.perf_counter()
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+
+        # Folded name => names, with their weights (e.g. number of addresses)
+        folded: dict[str, dict[str, int]] = {}
+        for name, weight in names:
+            if name:
+                entry = folded.setdefault(fold(name), {})
+                entry[name] = entry.get(name, 0) + weight
+
+        self.keys = sorted(folded)
+        # Parallel to keys: names, highest weight first
+        self.names = [
+            [n for n, _ in sorted(folded[k].items(), key=lambda t: (-t[1], t[0]))]
+            for k in self.keys
+        ]
+        self.weights = array("q", (sum(folded[k].values()) for k in self.keys))
+
+        pairs = sorted(
+            (hash(d), i)
+            for i, k in enumerate(self.keys)
+            for d in _deletes(k[:prefix_length], max_distance)
+        )
+        self.hashes = array("q", (h for h, _ in pairs))
+        self.ids = array("l", (i for _, i in pairs))
+
+        self.build_time = time.perf_counter() - t0
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, s: str, limit: int = 10) -> list[tuple[str, int]]:
+        """Return up to limit (name, distance) tuples for names within
+        max_distance of s, ignoring case and diacritics. Closest matches
+        come first, and then names with the highest weight."""
+        q = fold(s.strip())
+        if not q:
+            return []
+        (hashes, ids, keys) = (self.hashes, self.ids, self.keys)
+
+        candidates: set[int] = set()
+        for d in _deletes(q[: self.prefix_length], self.max_distance):
+            h = hash(d)
+            i = bisect_left(hashes, h)
+            while i < len(hashes) and hashes[i] == h:
+                candidates.add(ids[i])
+                i += 1
+
+        found: list[tuple[int, int, int]] = []
+        for i in candidates:
+            dist = edit_distance(q, keys[i], self.max_distance)
+            if dist <= self.max_distance:
+                found.append((dist, -self.weights[i], i))
+        found.sort()
+
+        res: list[tuple[str, int]] = []
+        for dist, _, i in found:
+            res.extend((name, dist) for name in self.names[i])
+        return res[:limit]
+
+    def memory_size(self) -> int:
+        """Approximate memory footprint of the index, in bytes."""
+        size = sys.getsizeof(self.hashes) + sys.getsizeof(self.ids) + sys.getsizeof(self.weights)
+        size += sys.getsizeof(self.keys) + sum(sys.getsizeof(k) for k in self.keys)
+        size += sys.getsizeof(self.names)
+        for names in self.names:
+            size += sys.getsizeof(names) + sum(sys.getsizeof(n) for n in names)
+        return size
+
+    def stats(self) -> dict[str, Any]:
+        """Size and build time of the index."""
+        return {
+            "names": len(self),
+            "deletes": len(self.hashes),
+            "memory_bytes": self.memory_size(),
+            "build_time": self.build_time,
+        }
+
+
+def _street_names() -> list[tuple[str, int]]:
+    """Street names, in both cases, and special names, with number of addresses."""
+    q = """
+        SELECT heiti_nf, COUNT(*) FROM stadfong GROUP BY heiti_nf
+        UNION ALL SELECT heiti_tgf, COUNT(*) FROM stadfong GROUP BY heiti_tgf
+        UNION ALL SELECT serheiti, COUNT(*) FROM stadfong GROUP BY serheiti
+    """
+    return [(r[0], r[1]) for r in shared_db.connection().cursor().execute(q)]
+
+
+def _placenames() -> list[tuple[str, int]]:
+    q = "SELECT nafn, COUNT(*) FROM ornefni GROUP BY nafn"
+    return [(r[0], r[1]) for r in shared_db.connection().cursor().execute(q)]
+
+
+def _postcode_placenames() -> list[tuple[str, int]]:
+    return [(pc[k], 1) for pc in POSTCODES.values() for k in ("stadur_nf", "stadur_tgf")]
+
+
+_SOURCES = {
+    "streets": (_street_names, STREET_MAX_DISTANCE),
+    "placenames": (_placenames, PLACENAME_MAX_DISTANCE),
+    "postcodes": (_postcode_placenames, PLACENAME_MAX_DISTANCE),
+}
+
+_indexes: dict[str, SymSpellIndex] = {}
+_lock = threading.Lock()
+on_data_change(_indexes.clear)
+
+
+def fuzzy_index(kind: str) -> SymSpellIndex:
+    """Return the fuzzy index of "streets", "placenames" or "postcodes"
+    (i.e. postcode place names), building it on first use, and again
+    after the database has changed."""
+    check_data_version()
+    idx = _indexes.get(kind)
+    if idx is None:
+        with _lock:
+            idx = _indexes.get(kind)
+            if idx is None:
+                (source, max_distance) = _SOURCES[kind]
+                idx = SymSpellIndex(source(), max_distance)
+                _indexes[kind] = idx
+    return idx
+
+
+def fuzzy_matches(kind: str, s: str, limit: int = 10) -> list[str]:
+    """Return names of the given kind (see fuzzy_index) closest to s,
+    e.g. "Oldugotu" => ["Öldugötu"]. Only the closest matches are
+    returned, e.g. no names at edit distance 2 if there is one at 1."""
+    matches = fuzzy_index(kind).lookup(s, limit=limit)
+    return [name for name, dist in matches if dist == matches[0][1]]
+
+
+def fuzzy_index_stats() -> dict[str, dict[str, Any]]:
+    """Size and build time of all fuzzy indexes built so far."""
+    return {kind: idx.stats() for kind, idx in _indexes.items()}
@@ -7,7 +7,24 @@ This file contains code related to distance calculation.
 
 """
 
+from typing import Any, Optional, Sequence
+
 import math
+from array import array
+from functools import cache
+from importlib import import_module
+
+
+@cache
+def _numpy() -> Any:
+    """Return the NumPy module, or None if it isn't installed. NumPy is
+    optional, so it is typed as Any rather than resolved by type checkers,
+    and it is only imported when first needed, since importing it is slow."""
+    try:
+        return import_module("numpy")
+    except ImportError:
+        return None
+
 
 EARTH_RADIUS_KM = 6371.0088
 
@@ -49,12 +66,219 @@ def distance(loc1: tuple[float, float], loc2: tuple[float, float]) -> float:
     return EARTH_RADIUS_KM * c
 
 
+def distance_many(origin: tuple[float, float], lats: Sequence[float], lons: Sequence[float]) -> Any:
+    """Haversine distance (in km) from origin to each of the points given
+    by the parallel sequences lats and lons. Like distance(), returns
+    infinity for missing (None, NaN or zero) coordinates.
+
+    Returns a NumPy array if NumPy is installed, otherwise an array.array
+    of doubles.
+    """
+    if len(lats) != len(lons):
+        raise ValueError("lats and lons must have the same length")
+    (lat1, lon1) = origin
+    np = _numpy()
+    if np is not None:
+        return _haversine_np(
+            np.float64(lat1 or 0.0),
+            np.float64(lon1 or 0.0),
+            np.asarray(lats, dtype=np.float64),
+            np.asarray(lons, dtype=np.float64),
+        )
+
+    if not lat1 or not lon1:
+        return array("d", [math.inf]) * len(lats)
+
+    # Plain loop, with everything hoisted out of it that can be. Angles
+    # are converted straight to half-angles in radians.
+    (sin, cos, asin, sqrt, inf) = (math.sin, math.cos, math.asin, math.sqrt, math.inf)
+    f = math.pi / 360
+    hlat1 = lat1 * f
+    hlon1 = lon1 * f
+    coslat1 = math.cos(2 * hlat1)
+    d = 2 * EARTH_RADIUS_KM
+    res: list[float] = []
+    append = res.append
+    for lat2, lon2 in zip(lats, lons):
+        # Skip missing, zero or NaN coordinates
+        if lat2 and lon2 and not math.isnan(lat2) and not math.isnan(lon2):
+            slat = sin(lat2 * f - hlat1)
+            slon = sin(lon2 * f - hlon1)
+            a = slat * slat + coslat1 * cos(lat2 * 2 * f) * slon * slon
+            append(d * asin(min(1.0, sqrt(a))))
+        else:
+            append(inf)
+    return array("d", res)
+
+
+def _haversine_np(lat1: Any, lon1: Any, lat2: Any, lon2: Any) -> Any:
+    """Haversine distances between NumPy arrays of coordinates,
+    broadcast against each other."""
+    np = _numpy()
+    rlat1 = np.radians(lat1)
+    rlat2 = np.radians(lat2)
+    slat = np.sin((rlat2 - rlat1) / 2)
+    slon = np.sin((np.radians(lon2) - np.radians(lon1)) / 2)
+    a = slat * slat + np.cos(rlat1) * np.cos(rlat2) * slon * slon
+    # Clip rounding errors so that sqrt(1 - a) stays real
+    a = np.clip(a, 0.0, 1.0)
+    res = EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    # Missing, zero or NaN coordinates
+    missing1 = (lat1 == 0) | (lon1 == 0) | np.isnan(lat1) | np.isnan(lon1)
+    missing2 = (lat2 == 0) | (lon2 == 0) | np.isnan(lat2) | np.isnan(lon2)
+    res[np.broadcast_to(missing1 | missing2, res.shape)] = np.inf
+    return res
+
+
+def distance_matrix(a: Sequence[tuple[float, float]], b: Sequence[tuple[float, float]]) -> Any:
+    """Haversine distances (in km) between every point in a and every point
+    in b, as a len(a) x len(b) matrix. Infinite for missing coordinates.
+
+    Returns a 2D NumPy array if NumPy is installed, otherwise a list
+    of array.array rows.
+    """
+    blats = [p[0] for p in b]
+    blons = [p[1] for p in b]
+    np = _numpy()
+    if np is None:
+        return [distance_many(p, blats, blons) for p in a]
+
+    alats = np.array([p[0] for p in a], dtype=np.float64)[:, np.newaxis]
+    alons = np.array([p[1] for p in a], dtype=np.float64)[:, np.newaxis]
+    return _haversine_np(
+        alats, alons, np.array(blats, dtype=np.float64), np.array(blons, dtype=np.float64)
+    )
+
+
+def distance_to_box_edge(loc: tuple[float, float], box: tuple[float, float, float, float]) -> float:
+    """Lower bound on the distance (in km) from a point inside a
+    (min_lat, max_lat, min_lon, max_lon) box to any point outside of it.
+    Infinite if the box covers the whole globe."""
+    (lat, lon) = loc
+    (lat0, lat1, lon0, lon1) = box
+
+    # Distance to the bounding parallels, along the meridian
+    dists = [
+        math.radians(lat1 - lat) * EARTH_RADIUS_KM if lat1 < 90.0 else math.inf,
+        math.radians(lat - lat0) * EARTH_RADIUS_KM if lat0 > -90.0 else math.inf,
+    ]
+
+    # Distance to the great circles of the bounding meridians
+    if lon1 - lon0 < 360.0:
+        coslat = math.cos(math.radians(lat))
+        for dlon in (lon1 - lon, lon - lon0):
+            if dlon >= 90.0:
+                # Too wide for the great circle bound to hold
+                return 0.0
+            dists.append(math.asin(coslat * math.sin(math.radians(dlon))) * EARTH_RADIUS_KM)
+
+    return min(dists)
+
+
 ICELAND_COORDS = (64.9957538607, -18.5739616708)
 
 
-def in_iceland(loc: tuple[float, float], km_radius: float = 800.0) -> bool:
-    """Check if coordinates are within or very close to Iceland."""
-    return distance(loc, ICELAND_COORDS) <= km_radius
+# Simplified outline (lat, lon) of Iceland's exclusive economic zone, i.e.
+# 200 nautical miles from the coast, bounded by the median lines towards
+# Greenland and the Faroe Islands. Only approximate, for filtering.
+ICELAND_EEZ = (
+    (68.8, -19.0), (69.0, -17.0), (69.3, -14.5), (69.5, -11.4), (69.0, -9.1),
+    (68.2, -7.3), (67.3, -6.4), (66.4, -6.0), (65.4, -6.5), (64.6, -8.0),
+    (64.0, -9.5), (63.4, -10.6), (62.9, -11.6), (62.3, -12.5), (61.6, -13.2),
+    (60.7, -14.0), (60.3, -15.6), (60.1, -17.3), (60.1, -19.0), (60.0, -20.8),
+    (60.1, -22.5), (60.4, -24.2), (60.6, -26.1), (61.1, -27.9), (61.8, -29.3),
+    (62.7, -30.3), (63.6, -30.8), (64.6, -30.3), (65.4, -29.6), (66.1, -28.7),
+    (66.7, -27.7), (67.2, -26.3), (67.6, -25.0), (67.8, -23.4), (68.1, -22.0),
+    (68.5, -20.7),
+)  # fmt: skip
+
+# (min_lat, max_lat, min_lon, max_lon) of the EEZ outline. Points
+# outside of it are rejected without the point-in-polygon test.
+_EEZ_BBOX = (
+    min(p[0] for p in ICELAND_EEZ),
+    max(p[0] for p in ICELAND_EEZ),
+    min(p[1] for p in ICELAND_EEZ),
+    max(p[1] for p in ICELAND_EEZ),
+)
+
+# Bounding box of the Icelandic mainland and islands, which lies entirely
+# within the EEZ. Points inside it are accepted without further testing.
+_LAND_BBOX = (63.2, 67.2, -24.6, -13.2)
+
+
+def _polygon_edges(
+    polygon: Sequence[tuple[float, float]],
+) -> list[tuple[float, float, float, float]]:
+    """Non-horizontal edges of polygon as (lat0, lat1, lon at lat0, dlon/dlat)."""
+    edges: list[tuple[float, float, float, float]] = []
+    (lat0, lon0) = polygon[-1]
+    for lat1, lon1 in polygon:
+        if lat0 != lat1:
+            edges.append((lat0, lat1, lon0, (lon1 - lon0) / (lat1 - lat0)))
+        (lat0, lon0) = (lat1, lon1)
+    return edges
+
+
+_EEZ_EDGES = _polygon_edges(ICELAND_EEZ)
+
+
+def _in_polygon(lat: float, lon: float, edges: list[tuple[float, float, float, float]]) -> bool:
+    """Ray casting point-in-polygon test, in plain lat/lon coordinates."""
+    inside = False
+    for lat0, lat1, lon0, slope in edges:
+        if (lat0 > lat) != (lat1 > lat) and lon < lon0 + (lat - lat0) * slope:
+            inside = not inside
+    return inside
+
+
+def in_iceland(loc: tuple[float, float], km_radius: Optional[float] = None) -> bool:
+    """Check if coordinates are in Iceland or Icelandic waters, i.e. within
+    Iceland's exclusive economic zone. If km_radius is given, check instead
+    whether they are within that distance of the centre of Iceland."""
+    if km_radius is not None:
+        return distance(loc, ICELAND_COORDS) <= km_radius
+
+    (lat, lon) = loc
+    if not lat or not lon:
+        return False  # Missing coordinates
+    (min_lat, max_lat, min_lon, max_lon) = _LAND_BBOX
+    if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+        return True
+    (min_lat, max_lat, min_lon, max_lon) = _EEZ_BBOX
+    if not (min_lat <= lat <= max_lat and min_lon <= lon <= max_lon):
+        return False
+    return _in_polygon(lat, lon, _EEZ_EDGES)
+
+
+def in_iceland_many(lats: Sequence[float], lons: Sequence[float]) -> Any:
+    """Vectorized in_iceland() for the points given by the parallel
+    sequences lats and lons.
+
+    Returns a NumPy boolean array if NumPy is installed,
+    otherwise a list of bools.
+    """
+    if len(lats) != len(lons):
+        raise ValueError("lats and lons must have the same length")
+    np = _numpy()
+    if np is None:
+        return [in_iceland((lat, lon)) for lat, lon in zip(lats, lons)]
+
+    lat = np.asarray(lats, dtype=np.float64)
+    lon = np.asarray(lons, dtype=np.float64)
+    (min_lat, max_lat, min_lon, max_lon) = _EEZ_BBOX
+    # Comparisons with NaN (missing coordinates) are always false
+    inside = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+    inside &= lon != 0.0
+    # Point-in-polygon test for the remaining candidates,
+    # one polygon edge at a time over all of them
+    idx = np.nonzero(inside)[0]
+    (plat, plon) = (lat[idx], lon[idx])
+    crossings = np.zeros(len(idx), dtype=bool)
+    for lat0, lat1, lon0, slope in _EEZ_EDGES:
+        crossings ^= ((lat0 > plat) != (lat1 > plat)) & (plon < lon0 + (plat - lat0) * slope)
+    inside[idx] = crossings
+    return inside
 
 
 def valid_wgs84_coord(lat: float, lon: float) -> bool:
@@ -0,0 +1,257 @@
+"""
+
+iceaddr: Look up information about Icelandic streets, addresses,
+         placenames, landmarks, locations and postcodes.
+
+Copyright (c) 2018-2025 Sveinbjorn Thordarson.
+
+This file contains an optional precomputed grid for fast nearest
+address lookups, stored in the stadfong_grid table of the database.
+
+The grid covers the area around all addresses with cells of a fixed
+size in degrees. Each cell holds the IDs and coordinates of the few
+addresses which can be the nearest address to some point in the cell,
+so finding the nearest address to a point takes a single cell lookup
+and a handful of distance computations. Points in cells not covered
+by the grid fall back to regular nearest-neighbor search.
+
+The grid is created at build time, see build_db.py.
+
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Optional
+
+import math
+import sqlite3
+import struct
+import threading
+import time
+
+from .db import row_to_dict, shared_db
+from .geo import EARTH_RADIUS_KM, distance
+from .memindex import GridIndex
+from .meta import check_data_version, on_data_change
+
+GRID_TABLE = "stadfong_grid"
+
+# Default cell size in degrees of latitude, about 220 m. Cells are twice
+# as wide in degrees of longitude, which makes them roughly square.
+DEFAULT_GRID_CELL_SIZE = 0.002
+
+# Default max distance (in km) from a cell to its nearest address.
+# Cells further away from all addresses are left out of the grid.
+DEFAULT_GRID_MAX_DIST = 0.5
+
+# Each candidate is packed as (hnitnum, lat, lon)
+_CANDIDATE = struct.Struct("<qdd")
+
+# Number of addresses nearest to a cell's center used to find an upper
+# bound on the distance from any point in the cell to its nearest address
+_BOUND_NEIGHBORS = 8
+
+# Number of cells inserted at a time when building the grid
+_INSERT_BATCH = 10000
+
+_Box = tuple[float, float, float, float]
+
+
+def _cell_box(row: int, col: int, cell_lat: float, cell_lon: float) -> _Box:
+    return (row * cell_lat, (row + 1) * cell_lat, col * cell_lon, (col + 1) * cell_lon)
+
+
+def _corners(box: _Box) -> list[tuple[float, float]]:
+    (lat0, lat1, lon0, lon1) = box
+    return [(lat0, lon0), (lat0, lon1), (lat1, lon0), (lat1, lon1)]
+
+
+def _max_dist_to_box(loc: tuple[float, float], box: _Box) -> float:
+    """Distance (in km) from a point to the furthest point of a small
+    lat/lon box. On each edge of the box the distance is greatest at
+    one of its ends, so this is the distance to the furthest corner."""
+    return max(distance(loc, c) for c in _corners(box))
+
+
+def _min_dist_to_box(loc: tuple[float, float], box: _Box) -> float:
+    """Lower bound on the distance (in km) from a point to any point in a
+    small lat/lon box, from the latitude difference and the distance to
+    the great circle through the nearest bounding meridian."""
+    (lat, lon) = loc
+    (lat0, lat1, lon0, lon1) = box
+    dlat = max(lat0 - lat, lat - lat1, 0.0)
+    dlon = max(lon0 - lon, lon - lon1, 0.0)
+    d_lon = math.asin(math.cos(math.radians(lat)) * math.sin(math.radians(dlon)))
+    return max(math.radians(dlat), d_lon) * EARTH_RADIUS_KM
+
+
+def build_grid(
+    conn: sqlite3.Connection,
+    cell_size: float = DEFAULT_GRID_CELL_SIZE,
+    max_dist: float = DEFAULT_GRID_MAX_DIST,
+    commit: bool = True,
+) -> dict[str, Any]:
+    """Create (or replace) the nearest address grid in the database. Smaller
+    cells have fewer candidates each, but there are many more of them, and
+    a larger max_dist covers more of the country at the cost of more cells.
+    If commit is False, the grid is left in the current transaction, e.g.
+    to replace it along with the addresses it was built from.
+    Returns number of cells, candidates, size in bytes and build time."""
+    if cell_size <= 0.0 or max_dist <= 0.0:
+        raise ValueError("cell_size and max_dist must be positive")
+    t0 = time.perf_counter()
+    (cell_lat, cell_lon) = (cell_size, cell_size * 2)
+
+    index = GridIndex("stadfong", "hnitnum", conn)
+    coords: dict[int, tuple[float, float]] = {}
+    q = """
+        SELECT hnitnum, lat_wgs84, long_wgs84 FROM stadfong
+        WHERE lat_wgs84 IS NOT NULL AND long_wgs84 IS NOT NULL
+    """
+    for pid, lat, lon in conn.execute(q):
+        coords[pid] = (lat, lon)
+
+    # Cells within max_dist of some address
+    cells: set[tuple[int, int]] = set()
+    dlat = math.degrees(max_dist / EARTH_RADIUS_KM)
+    for lat, lon in coords.values():
+        dlon = dlat / math.cos(math.radians(abs(lat) + dlat))
+        for row in range(
+            math.floor((lat - dlat) / cell_lat), math.floor((lat + dlat) / cell_lat) + 1
+        ):
+            for col in range(
+                math.floor((lon - dlon) / cell_lon), math.floor((lon + dlon) / cell_lon) + 1
+            ):
+                if (row, col) not in cells:
+                    box = _cell_box(row, col, cell_lat, cell_lon)
+                    if _min_dist_to_box((lat, lon), box) <= max_dist:
+                        cells.add((row, col))
+
+    # The sqlite3 module doesn't begin a transaction before DROP or CREATE
+    if not conn.in_transaction:
+        conn.execute("BEGIN")
+    conn.execute(f"DROP TABLE IF EXISTS {GRID_TABLE}")
+    conn.execute(
+        f"""
+        CREATE TABLE {GRID_TABLE} (
+            row INTEGER NOT NULL,
+            col INTEGER NOT NULL,
+            candidates BLOB NOT NULL,
+            PRIMARY KEY (row, col)
+        ) STRICT, WITHOUT ROWID;
+        """
+    )
+
+    num_candidates = 0
+    num_bytes = 0
+    batch: list[tuple[int, int, bytes]] = []
+    for row, col in sorted(cells):
+        box = _cell_box(row, col, cell_lat, cell_lon)
+        center = ((box[0] + box[1]) / 2, (box[2] + box[3]) / 2)
+        # No point in the cell is further than this from its nearest address
+        bound = min(
+            _max_dist_to_box(coords[pid], box)
+            for pid in index.knn(center[0], center[1], _BOUND_NEIGHBORS)
+        )
+        # Addresses which may be nearest to some point in the cell are within
+        # bound of the cell, and so within bound plus the cell's "radius"
+        # of its center. Only those are packed, nearest to center first.
+        radius = bound + _max_dist_to_box(center, box)
+        blob = b"".join(
+            _CANDIDATE.pack(pid, *coords[pid])
+            for pid in index.knn(center[0], center[1], len(index), radius)
+            if _min_dist_to_box(coords[pid], box) <= bound
+        )
+        batch.append((row, col, blob))
+        num_candidates += len(blob) // _CANDIDATE.size
+        num_bytes += len(blob)
+        if len(batch) >= _INSERT_BATCH:
+            conn.executemany(f"INSERT INTO {GRID_TABLE} VALUES (?,?,?)", batch)
+            batch.clear()
+    conn.executemany(f"INSERT INTO {GRID_TABLE} VALUES (?,?,?)", batch)
+
+    conn.executemany(
+        "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+        [("grid_cell_size", repr(cell_size)), ("grid_max_dist", repr(max_dist))],
+    )
+    if commit:
+        conn.commit()
+
+    return {
+        "cells": len(cells),
+        "candidates": num_candidates,
+        "bytes": num_bytes,
+        "build_time": time.perf_counter() - t0,
+    }
+
+
+# Cell size of the grid in the database, 0.0 if there is no grid,
+# or None if not yet checked
+_cell_size: Optional[float] = None
+_lock = threading.Lock()
+
+
+def _reset() -> None:
+    global _cell_size
+    _cell_size = None
+
+
+on_data_change(_reset)
+
+
+def grid_cell_size() -> float:
+    """Cell size (in degrees of latitude) of the nearest address grid in
+    the database, or 0.0 if the database has no grid. Checked again after
+    the database has changed, e.g. the grid has been recreated."""
+    global _cell_size
+    check_data_version()
+    if _cell_size is None:
+        with _lock:
+            cur = shared_db.connection().cursor()
+            try:
+                r = cur.execute("SELECT value FROM metadata WHERE key='grid_cell_size'").fetchone()
+                has_table = cur.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (GRID_TABLE,)
+                ).fetchone()
+                _cell_size = float(r[0]) if r and has_table else 0.0
+            except sqlite3.Error:
+                _cell_size = 0.0
+    return _cell_size
+
+
+def grid_nearest(
+    lat: float,
+    lon: float,
+    max_dist: float = 0.0,
+    post_process: Callable[[dict[str, Any]], dict[str, Any]] | None = None,
+) -> Optional[list[tuple[dict[str, Any], float]]]:
+    """Find the address nearest to (lat, lon) using the precomputed grid.
+    Returns a list with a single (address, distance_km) tuple, or an empty
+    list if it is further away than max_dist (if given). Returns None if the
+    point is not covered by the grid, the database has no grid, or the
+    grid is out of date and the address has since been deleted."""
+    cell_size = grid_cell_size()
+    if not cell_size:
+        return None
+
+    cur = shared_db.connection().cursor()
+    r = cur.execute(
+        f"SELECT candidates FROM {GRID_TABLE} WHERE row=? AND col=?",
+        (math.floor(lat / cell_size), math.floor(lon / (cell_size * 2))),
+    ).fetchone()
+    if r is None:
+        return None
+
+    (best_id, best_dist) = (None, math.inf)
+    for pid, clat, clon in _CANDIDATE.iter_unpack(r[0]):
+        d = distance((lat, lon), (clat, clon))
+        if d < best_dist:
+            (best_id, best_dist) = (pid, d)
+    if best_id is None or (max_dist > 0.0 and best_dist > max_dist):
+        return []
+
+    row = cur.execute("SELECT * FROM stadfong WHERE hnitnum=?", (best_id,)).fetchone()
+    if row is None:
+        return None
+    res = row_to_dict(row)
+    return [(post_process(res) if post_process else res, best_dist)]
@@ -0,0 +1,223 @@
+"""
+
+iceaddr: Look up information about Icelandic streets, addresses,
+         placenames, landmarks, locations and postcodes.
+
+Copyright (c) 2018-2025 Sveinbjorn Thordarson.
+
+This file contains an in-memory spatial index for nearest-neighbor
+queries, used instead of the SQLite R-Tree when the "memory" nearest
+engine is selected (see nearest.set_nearest_engine).
+
+"""
+
+from __future__ import annotations
+
+from typing import Any, Optional
+
+import heapq
+import math
+import sqlite3
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .db import shared_db
+from .geo import EARTH_RADIUS_KM, distance_to_box_edge
+from .meta import check_data_version, on_data_change
+
+# Grid cell size in degrees. At Icelandic latitudes,
+# this gives roughly square cells of about 500 m side.
+CELL_LAT = 0.005
+CELL_LON = 0.01
+
+
+class GridIndex:
+    """Compact columnar point index over a uniform lat/lon grid.
+
+    Point IDs and coordinates are kept in flat arrays, ordered by grid row
+    and then by column, so the points in any run of cells within a row form
+    a single contiguous slice. For each row, the sorted columns of its
+    non-empty cells and their offsets into the point arrays are kept.
+
+    Nearest-neighbor search visits squares of cells of doubling size around
+    the query point until nothing outside the visited area can be closer.
+    """
+
+    def __init__(
+        self, main_table: str, id_column: str, conn: Optional[sqlite3.Connection] = None
+    ) -> None:
+        t0 = time.perf_counter()
+
+        q = f"""
+            SELECT {id_column}, lat_wgs84, long_wgs84 FROM {main_table}
+            WHERE lat_wgs84 IS NOT NULL AND long_wgs84 IS NOT NULL
+        """
+        conn = conn or shared_db.connection()
+        points: list[tuple[int, int, int, float, float]] = []
+        for pid, lat, lon in conn.cursor().execute(q):
+            row = math.floor(lat / CELL_LAT)
+            col = math.floor(lon / CELL_LON)
+            points.append((row, col, pid, lat, lon))
+        points.sort()
+
+        self.ids = array("q")
+        self.lats = array("d")  # Latitude in radians
+        self.lons = array("d")  # Longitude in radians
+        self.coslats = array("d")
+        # Row => (sorted columns of non-empty cells, start offset of each cell
+        # in the point arrays, followed by the end offset of the last cell)
+        self.rows: dict[int, tuple[array[int], array[int]]] = {}
+
+        for i, (row, col, pid, lat, lon) in enumerate(points):
+            self.ids.append(pid)
+            self.lats.append(math.radians(lat))
+            self.lons.append(math.radians(lon))
+            self.coslats.append(math.cos(math.radians(lat)))
+
+            if row not in self.rows:
+                self.rows[row] = (array("l"), array("l", [i]))
+            (cols, offsets) = self.rows[row]
+            if not cols or cols[-1] != col:
+                cols.append(col)
+                offsets.append(i + 1)
+            else:
+                offsets[-1] = i + 1
+
+        self.min_row = min(self.rows, default=0)
+        self.max_row = max(self.rows, default=0)
+        self.min_col = min((c[0][0] for c in self.rows.values()), default=0)
+        self.max_col = max((c[0][-1] for c in self.rows.values()), default=0)
+
+        self.build_time = time.perf_counter() - t0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def memory_size(self) -> int:
+        """Approximate memory footprint of the index, in bytes."""
+        size = sum(sys.getsizeof(a) for a in (self.ids, self.lats, self.lons, self.coslats))
+        size += sys.getsizeof(self.rows)
+        for cols, offsets in self.rows.values():
+            size += sys.getsizeof(cols) + sys.getsizeof(offsets) + sys.getsizeof((cols, offsets))
+        return size
+
+    def stats(self) -> dict[str, Any]:
+        """Size and build time of the index."""
+        return {
+            "points": len(self),
+            "cells": sum(len(c[0]) for c in self.rows.values()),
+            "memory_bytes": self.memory_size(),
+            "build_time": self.build_time,
+        }
+
+    def knn(self, lat: float, lon: float, k: int, max_dist: float = 0.0) -> list[Any]:
+        """Return IDs of the k points closest to (lat, lon), nearest first."""
+        if k <= 0 or not self.rows:
+            return []
+
+        limit_dist = max_dist if max_dist > 0.0 else math.inf
+        rlat = math.radians(lat)
+        rlon = math.radians(lon)
+        coslat = math.cos(rlat)
+        (lats, lons, coslats) = (self.lats, self.lons, self.coslats)
+        (sin, asin, sqrt) = (math.sin, math.asin, math.sqrt)
+        (prow, pcol) = (math.floor(lat / CELL_LAT), math.floor(lon / CELL_LON))
+
+        # Max-heap (of negated distances) holding the k best so far
+        heap: list[tuple[float, int]] = []
+
+        # Half-size (in cells) of the square searched so far, -1 for none
+        done = -1
+        # Squares closer than the extent of the index are all empty
+        size = max(
+            0,
+            self.min_row - prow,
+            prow - self.max_row,
+            self.min_col - pcol,
+            pcol - self.max_col,
+        )
+        while True:
+            for start, end in self._annulus(prow, pcol, done, size):
+                for i in range(start, end):
+                    slat = sin((lats[i] - rlat) / 2)
+                    slon = sin((lons[i] - rlon) / 2)
+                    a = slat * slat + coslat * coslats[i] * slon * slon
+                    d = 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+                    if d > limit_dist:
+                        continue
+                    if len(heap) < k:
+                        heapq.heappush(heap, (-d, i))
+                    elif d < -heap[0][0]:
+                        heapq.heapreplace(heap, (-d, i))
+
+            if (
+                prow - size <= self.min_row
+                and prow + size >= self.max_row
+                and pcol - size <= self.min_col
+                and pcol + size >= self.max_col
+            ):
+                break  # Searched every non-empty cell
+
+            box = (
+                (prow - size) * CELL_LAT,
+                (prow + size + 1) * CELL_LAT,
+                (pcol - size) * CELL_LON,
+                (pcol + size + 1) * CELL_LON,
+            )
+            kth = -heap[0][0] if len(heap) == k else math.inf
+            if min(kth, limit_dist) <= distance_to_box_edge((lat, lon), box):
+                break
+
+            done = size
+            size = max(1, size * 2)
+
+        ids = self.ids
+        return [ids[i] for _, i in sorted(heap, reverse=True)]
+
+    def _annulus(self, prow: int, pcol: int, inner: int, outer: int) -> list[tuple[int, int]]:
+        """Slices of the point arrays for the cells within Chebyshev distance
+        outer, but not within distance inner, of cell (prow, pcol)."""
+        slices: list[tuple[int, int]] = []
+        for row in range(max(prow - outer, self.min_row), min(prow + outer, self.max_row) + 1):
+            r = self.rows.get(row)
+            if r is None:
+                continue
+            if inner >= 0 and abs(row - prow) <= inner:
+                # Row passes through the inner square, two slices
+                spans = [(pcol - outer, pcol - inner - 1), (pcol + inner + 1, pcol + outer)]
+            else:
+                spans = [(pcol - outer, pcol + outer)]
+            (cols, offsets) = r
+            for col0, col1 in spans:
+                j0 = bisect_left(cols, col0)
+                j1 = bisect_right(cols, col1)
+                if j0 < j1:
+                    slices.append((offsets[j0], offsets[j1]))
+        return slices
+
+
+_indexes: dict[str, GridIndex] = {}
+_lock = threading.Lock()
+on_data_change(_indexes.clear)
+
+
+def grid_index(main_table: str, id_column: str) -> GridIndex:
+    """Return the in-memory index for a table, building it on first use,
+    and again after the database has changed."""
+    check_data_version()
+    idx = _indexes.get(main_table)
+    if idx is None:
+        with _lock:
+            idx = _indexes.get(main_table)
+            if idx is None:
+                idx = GridIndex(main_table, id_column)
+                _indexes[main_table] = idx
+    return idx
+
+
+def grid_index_stats() -> dict[str, dict[str, Any]]:
+    """Size and build time of all in-memory indexes built so far."""
+    return {table: idx.stats() for table, idx in _indexes.items()}
@@ -3,22 +3,34 @@
 iceaddr: Look up information about Icelandic streets, addresses,
          placenames, landmarks, locations and postcodes.
 
-This file contains code related to database metadata.
+This file contains code related to database metadata, and to noticing
+when the database has changed, so that data loaded from it into memory
+can be dropped.
 
 """
 
 from __future__ import annotations
 
+from typing import Any, Callable, Optional
+
 import datetime
-from typing import Any
+import threading
+import time
+
+from .db import shared_db
 
-from .db import SharedDB
+# How often (in seconds) to check whether the database has changed
+CHECK_INTERVAL = 60.0
+
+_version: Optional[tuple[Any, Any]] = None
+_checked: Optional[float] = None
+_listeners: list[Callable[[], None]] = []
+_lock = threading.Lock()
 
 
 def iceaddr_metadata() -> dict[str, Any]:
     """Return all database metadata as a dictionary."""
-    db = SharedDB()
-    c = db.connection().cursor()
+    c = shared_db.connection().cursor()
 
     try:
         c.execute("SELECT key, value FROM metadata")
@@ -42,3 +54,29 @@ def iceaddr_metadata() -> dict[str, Any]:
         return metadata
     except Exception:
         return {}
+
+
+def on_data_change(func: Callable[[], None]) -> None:
+    """Register function to call when the database has changed, i.e. when
+    its creation date or data version (see build_db.py --update) differ
+    from when it was last checked."""
+    _listeners.append(func)
+
+
+def check_data_version() -> None:
+    """Call the functions registered with on_data_change() if the database
+    has changed. It is only checked every CHECK_INTERVAL seconds."""
+    global _version, _checked
+    now = time.monotonic()
+    if _checked is not None and now - _checked < CHECK_INTERVAL:
+        return
+    with _lock:
+        if _checked is not None and now - _checked < CHECK_INTERVAL:
+            return
+        _checked = now
+        meta = iceaddr_metadata()
+        version = (meta.get("date_created"), meta.get("data_version"))
+        if _version is not None and version != _version:
+            for func in _listeners:
+                func()
+        _version = version
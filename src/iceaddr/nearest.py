@@ -7,14 +7,70 @@ Copyright (c) 2018-2025 Sveinbjorn Thordarson.
 
 This file contains shared logic for nearest-neighbor spatial queries.
 
+Nearest-neighbor search is exact: the R-Tree is searched in growing
+rings around the query point(s) until the k best candidates found so
+far are provably closer than anything outside the searched area.
+
 """
 
 from __future__ import annotations
 
-from typing import Any, Callable
+from typing import Any, Callable, Iterable, Optional, Sequence
+
+import heapq
+import math
+import os
+import sqlite3
+from bisect import bisect_left
+
+from .db import json_list, row_to_dict, shared_db
+from .geo import EARTH_RADIUS_KM, distance, distance_to_box_edge
+from .memindex import grid_index
+
+# Side length (in degrees) of the coarse and fine grid cells used to
+# group nearby points together in batch nearest-neighbor searches
+BATCH_COARSE_CELL_SIZE = 0.1
+BATCH_CELL_SIZE = 0.01
+
+# Points in a coarse grid cell are grouped by fine grid cell if there are
+# more than this many, or more than this many R-Tree entries per point
+# within their bounding box
+_MAX_COARSE_GROUP = 32
+_ENTRIES_PER_POINT = 64
+
+# Number of points handed to a worker process at a time
+# in multiprocess batch nearest-neighbor searches
+PROCESS_CHUNK_SIZE = 2000
+
+# Max bytes of the database file memory-mapped by worker processes
+WORKER_MMAP_SIZE = 1 << 30
+
+# Radius of the first search ring, in km
+_INITIAL_RADIUS_KM = 0.5
+
+# R-Tree coordinates are stored as 32-bit floats, which can be off by up
+# to a metre or so at Icelandic latitudes. Candidates are therefore kept
+# within this margin (in km) and re-ranked using the exact coordinates.
+_EPS_KM = 0.002
+
+# (min_lat, max_lat, min_lon, max_lon)
+_Box = tuple[float, float, float, float]
 
-from .db import shared_db
-from .geo import distance
+# Nearest-neighbor search engines. "sqlite" uses the R-Tree tables in
+# the database, "memory" uses an in-process grid index (see memindex.py)
+# which is built on first use and then answers queries without SQLite.
+NEAREST_ENGINES = ("sqlite", "memory")
+
+_engine = os.environ.get("ICEADDR_NEAREST_ENGINE", "sqlite").lower()
+
+
+def set_nearest_engine(engine: str) -> None:
+    """Select the nearest-neighbor search engine, either "sqlite" (default)
+    or "memory". Can also be set via the ICEADDR_NEAREST_ENGINE env var."""
+    global _engine
+    if engine not in NEAREST_ENGINES:
+        raise ValueError(f"Unknown nearest engine: {engine}")
+    _engine = engine
 
 
 def find_nearest(
@@ -42,43 +98,342 @@ def find_nearest(
     Returns:
         List of tuples of (dict, distance_km) for the nearest locations
     """
-    db_conn = shared_db.connection()
-    cur = db_conn.cursor()
-
-    # Search within an expanding bounding box to find candidates
-    search_radius = 0.01  # Start with a box of roughly 1.1km side
-    ids = []
-    # We want at least 'limit' candidates, but also a few more to sort through
-    min_candidates = max(limit, 20)
-
-    for _ in range(6):  # Expand search radius up to 6 times
-        q_ids = f"""
-            SELECT id FROM {rtree_table}
+    return find_nearest_batch(
+        [(lat, lon)], rtree_table, main_table, id_column, limit, max_dist, post_process
+    )[0]
+
+
+def find_nearest_batch(
+    coords: Iterable[Sequence[float]],
+    rtree_table: str,
+    main_table: str,
+    id_column: str,
+    limit: int = 1,
+    max_dist: float = 0.0,
+    post_process: Callable[[dict[str, Any]], dict[str, Any]] | None = None,
+    processes: int = 1,
+) -> list[list[tuple[dict[str, Any], float]]]:
+    """Nearest-neighbor search for many points at once.
+
+    Points are grouped by grid cell (see _group_points) and each group
+    shares a single set of R-Tree candidates, so neighbouring points don't
+    repeat the same spatial queries or fetch the same rows twice.
+
+    Args:
+        coords: Sequence of (lat, lon) pairs, e.g. a list of tuples or an
+            (N, 2) NumPy array
+        rtree_table, main_table, id_column, limit, max_dist, post_process:
+            Same as for find_nearest()
+        processes: Number of worker processes to split the search between.
+            Requires post_process to be picklable, i.e. a module-level function.
+
+    Returns:
+        List with one list of (dict, distance_km) tuples per input point,
+        in input order
+    """
+    points = [(float(lat), float(lon)) for lat, lon in coords]
+    results: list[list[tuple[dict[str, Any], float]]] = [[] for _ in points]
+    if limit <= 0:
+        return results
+
+    if processes > 1 and len(points) > PROCESS_CHUNK_SIZE:
+        args = (rtree_table, main_table, id_column, limit, max_dist, post_process)
+        return _find_nearest_parallel(points, processes, args)
+
+    cur = shared_db.connection().cursor()
+    groups = _group_points(cur, rtree_table, points)
+
+    # Rows already fetched, shared between neighbouring groups
+    row_cache: dict[Any, sqlite3.Row] = {}
+
+    for idxs in groups:
+        group = [points[i] for i in idxs]
+        if _engine == "memory":
+            index = grid_index(main_table, id_column)
+            cand_ids = [index.knn(lat, lon, limit, max_dist) for lat, lon in group]
+        else:
+            cand_ids = knn_candidates(cur, rtree_table, group, limit, max_dist)
+
+        missing = list({x for ids in cand_ids for x in ids if x not in row_cache})
+        for row in _fetch_rows(cur, main_table, id_column, missing):
+            row_cache[row[id_column]] = row
+
+        for i, ids in zip(idxs, cand_ids):
+            (lat, lon) = points[i]
+            rows = [row_cache[x] for x in ids if x in row_cache]
+            results[i] = _closest(lat, lon, rows, limit, max_dist, post_process)
+
+    return results
+
+
+def _group_points(
+    cur: sqlite3.Cursor, rtree_table: str, points: list[tuple[float, float]]
+) -> list[list[int]]:
+    """Group points that are close together, so that each group shares its
+    R-Tree queries. Points are grouped by coarse grid cell, unless there
+    are many of them, or many R-Tree entries around them for their number,
+    in which case they are grouped by fine grid cell, as each point would
+    otherwise have to skip over many entries that aren't near it."""
+    coarse: dict[tuple[int, int], list[int]] = {}
+    for i, (lat, lon) in enumerate(points):
+        key = (math.floor(lat / BATCH_COARSE_CELL_SIZE), math.floor(lon / BATCH_COARSE_CELL_SIZE))
+        coarse.setdefault(key, []).append(i)
+
+    groups: list[list[int]] = []
+    for idxs in coarse.values():
+        if len(idxs) == 1 or (
+            len(idxs) <= _MAX_COARSE_GROUP
+            and (
+                _engine == "memory"
+                or not _has_entries(
+                    cur, rtree_table, [points[i] for i in idxs], _ENTRIES_PER_POINT * len(idxs)
+                )
+            )
+        ):
+            groups.append(idxs)
+            continue
+        fine: dict[tuple[int, int], list[int]] = {}
+        for i in idxs:
+            (lat, lon) = points[i]
+            key = (math.floor(lat / BATCH_CELL_SIZE), math.floor(lon / BATCH_CELL_SIZE))
+            fine.setdefault(key, []).append(i)
+        groups.extend(fine.values())
+    return groups
+
+
+def _has_entries(
+    cur: sqlite3.Cursor, rtree_table: str, points: list[tuple[float, float]], num: int
+) -> bool:
+    """Whether the R-Tree has more than num entries within the bounding box of the points."""
+    q = f"""
+        SELECT count(*) FROM (
+            SELECT 1 FROM {rtree_table}
             WHERE max_long >= ? AND min_long <= ? AND max_lat >= ? AND min_lat <= ?
-        """
-        # Standard R-Tree overlap check: box overlaps if it's not entirely outside
-        params = [
-            lon - search_radius,  # Not entirely west of search box
-            lon + search_radius,  # Not entirely east of search box
-            lat - search_radius,  # Not entirely south of search box
-            lat + search_radius,  # Not entirely north of search box
+            LIMIT ?
+        )
+    """
+    bbox = (
+        min(p[1] for p in points),
+        max(p[1] for p in points),
+        min(p[0] for p in points),
+        max(p[0] for p in points),
+    )
+    return cur.execute(q, (*bbox, num + 1)).fetchone()[0] > num
+
+
+def _init_worker(engine: str) -> None:
+    """Set up a worker process for batch nearest-neighbor search. The database
+    is memory-mapped, so that all workers share its pages via the OS page cache."""
+    shared_db.reset_after_fork()
+    shared_db.configure(mmap_size=WORKER_MMAP_SIZE)
+    set_nearest_engine(engine)
+
+
+def _spread_bits(v: int) -> int:
+    """Interleave the lower 16 bits of v with zeros."""
+    v &= 0xFFFF
+    v = (v | (v << 8)) & 0x00FF00FF
+    v = (v | (v << 4)) & 0x0F0F0F0F
+    v = (v | (v << 2)) & 0x33333333
+    return (v | (v << 1)) & 0x55555555
+
+
+def _zorder(lat: float, lon: float) -> int:
+    """Position of the point's grid cell along a Z-order curve,
+    which keeps cells that are close in the order close in space."""
+    row = math.floor(lat / BATCH_CELL_SIZE) + 9000
+    col = math.floor(lon / BATCH_CELL_SIZE) + 18000
+    return _spread_bits(row) | (_spread_bits(col) << 1)
+
+
+def _find_nearest_parallel(
+    points: list[tuple[float, float]], processes: int, args: tuple[Any, ...]
+) -> list[list[tuple[dict[str, Any], float]]]:
+    """Split batch nearest-neighbor search between worker processes, in
+    chunks of points that are close together, so each worker's spatial
+    queries and fetched rows are shared by as many points as possible."""
+    # Imported here since it pulls in multiprocessing, only needed for this
+    from concurrent.futures import ProcessPoolExecutor
+
+    order = sorted(range(len(points)), key=lambda i: _zorder(*points[i]))
+    chunks = [order[i : i + PROCESS_CHUNK_SIZE] for i in range(0, len(order), PROCESS_CHUNK_SIZE)]
+
+    results: list[list[tuple[dict[str, Any], float]]] = [[] for _ in points]
+    with ProcessPoolExecutor(
+        max_workers=processes, initializer=_init_worker, initargs=(_engine,)
+    ) as executor:
+        futures = [
+            executor.submit(find_nearest_batch, [points[i] for i in chunk], *args)
+            for chunk in chunks
         ]
-        res = cur.execute(q_ids, params)
-        ids = [r["id"] for r in res]
+        for chunk, future in zip(chunks, futures):
+            for i, res in zip(chunk, future.result()):
+                results[i] = res
+    return results
+
+
+def knn_candidates(
+    cur: sqlite3.Cursor,
+    rtree_table: str,
+    points: list[tuple[float, float]],
+    k: int,
+    max_dist: float = 0.0,
+) -> list[list[Any]]:
+    """Best-first k-nearest-neighbor search in an R-Tree for a group of points.
+
+    The R-Tree is queried in rings of doubling radius around the bounding box
+    of the points. Each point keeps a priority queue of its k best candidates,
+    only comparing itself with candidates within a band of latitude as wide
+    as its k-th best distance, and is done once that distance is no greater
+    than the distance to the nearest edge of the area searched so far, since
+    nothing outside the area can then be closer. This gives exact results without ever
+    falling back to a full table scan.
+
+    Returns a list with the candidate IDs for each point. These are a small
+    superset of the exact k nearest, to allow re-ranking using the exact
+    (non-R-Tree) coordinates.
+    """
+    bbox: _Box = (
+        min(p[0] for p in points),
+        max(p[0] for p in points),
+        min(p[1] for p in points),
+        max(p[1] for p in points),
+    )
+    limit_dist = max_dist + _EPS_KM if max_dist > 0.0 else math.inf
+
+    seen: set[Any] = set()
+    # Max-heaps (of negated distances) holding the k best distances so far
+    heaps: list[list[float]] = [[] for _ in points]
+    # All (distance, id) candidates within limit_dist, for each point
+    found: list[list[tuple[float, Any]]] = [[] for _ in points]
+    pending = list(range(len(points)))
+
+    radius = _INITIAL_RADIUS_KM
+    inner: Optional[_Box] = None
+    while pending:
+        box = _search_box(bbox, radius)
+        # Entries on the edge between two strips of the ring are returned twice
+        new: list[tuple[Any, float, float]] = []
+        for c in _query_ring(cur, rtree_table, box, inner):
+            if c[0] not in seen:
+                seen.add(c[0])
+                new.append(c)
 
-        if len(ids) >= min_candidates:
-            break
-        search_radius *= 2  # Double the search area
+        # Each point only looks at the new entries in a band of latitude
+        # around it, whose half-width is its k-th best distance so far
+        new.sort(key=lambda c: c[1])
+        new_lats = [clat for _, clat, _ in new]
+        for i in pending:
+            pt = points[i]
+            heap = heaps[i]
+            j = bisect_left(new_lats, pt[0])
+            for entries in (new[j:], reversed(new[:j])):
+                for cid, clat, clon in entries:
+                    bound = min(-heap[0] if len(heap) == k else math.inf, limit_dist) + _EPS_KM
+                    if abs(math.radians(clat - pt[0])) * EARTH_RADIUS_KM > bound:
+                        break  # No closer entries further away in latitude
+                    d = distance(pt, (clat, clon))
+                    if d > limit_dist:
+                        continue
+                    found[i].append((d, cid))
+                    if len(heap) < k:
+                        heapq.heappush(heap, -d)
+                    elif d < -heap[0]:
+                        heapq.heapreplace(heap, -d)
 
-    if not ids:
-        # Fallback for very sparse areas, using the old brute-force method.
-        # This should be rare.
-        res = list(db_conn.cursor().execute(f"SELECT * FROM {main_table}", []))
+        still_pending: list[int] = []
+        for i in pending:
+            kth = -heaps[i][0] if len(heaps[i]) == k else math.inf
+            bound = distance_to_box_edge(points[i], box)
+            if min(kth, limit_dist) + _EPS_KM > bound:
+                still_pending.append(i)
+        pending = still_pending
+
+        inner = box
+        # Grow faster while we haven't found anything at all
+        radius *= 2 if seen else 4
+
+    results: list[list[Any]] = []
+    for i in range(len(points)):
+        kth = -heaps[i][0] if len(heaps[i]) == k else math.inf
+        cutoff = min(kth + _EPS_KM, limit_dist)
+        results.append([cid for d, cid in found[i] if d <= cutoff])
+    return results
+
+
+def _search_box(bbox: _Box, radius: float) -> _Box:
+    """Expand bounding box by radius (in km) in every direction. If the
+    expanded box reaches a pole or spans a quarter of the globe, it is
+    widened to cover all longitudes."""
+    (min_lat, max_lat, min_lon, max_lon) = bbox
+    dlat = math.degrees(radius / EARTH_RADIUS_KM)
+    lat0 = max(min_lat - dlat, -90.0)
+    lat1 = min(max_lat + dlat, 90.0)
+
+    if lat0 <= -90.0 or lat1 >= 90.0:
+        return (lat0, lat1, -180.0, 180.0)
+
+    max_cos = math.cos(math.radians(max(abs(lat0), abs(lat1))))
+    dlon = math.degrees(radius / (EARTH_RADIUS_KM * max_cos))
+    lon0 = min_lon - dlon
+    lon1 = max_lon + dlon
+    if lon1 - lon0 >= 90.0 or lon0 < -180.0 or lon1 > 180.0:
+        return (lat0, lat1, -180.0, 180.0)
+
+    return (lat0, lat1, lon0, lon1)
+
+
+def _query_ring(
+    cur: sqlite3.Cursor, rtree_table: str, box: _Box, inner: Optional[_Box]
+) -> list[tuple[Any, float, float]]:
+    """Return (id, lat, lon) for R-Tree entries in box but not in inner box."""
+    (lat0, lat1, lon0, lon1) = box
+    if inner is None:
+        rects = [box]
     else:
-        # We have candidate IDs, now fetch their full details
-        q_detail = f"SELECT * FROM {main_table} WHERE {id_column} IN ({','.join(['?'] * len(ids))})"
-        res = list(db_conn.cursor().execute(q_detail, ids))
+        (ilat0, ilat1, ilon0, ilon1) = inner
+        rects = [
+            (ilat1, lat1, lon0, lon1),  # North strip
+            (lat0, ilat0, lon0, lon1),  # South strip
+            (ilat0, ilat1, lon0, ilon0),  # West strip
+            (ilat0, ilat1, ilon1, lon1),  # East strip
+        ]
 
+    q = f"""
+        SELECT id, min_lat, max_lat, min_long, max_long FROM {rtree_table}
+        WHERE max_long >= ? AND min_long <= ? AND max_lat >= ? AND min_lat <= ?
+    """
+    res: list[tuple[Any, float, float]] = []
+    for r_lat0, r_lat1, r_lon0, r_lon1 in rects:
+        if r_lat0 >= r_lat1 or r_lon0 >= r_lon1:
+            continue  # Empty strip
+        # Standard R-Tree overlap check: box overlaps if it's not entirely outside
+        for r in cur.execute(q, (r_lon0, r_lon1, r_lat0, r_lat1)):
+            lat = (r["min_lat"] + r["max_lat"]) / 2
+            lon = (r["min_long"] + r["max_long"]) / 2
+            res.append((r["id"], lat, lon))
+    return res
+
+
+def _fetch_rows(
+    cur: sqlite3.Cursor, main_table: str, id_column: str, ids: list[Any]
+) -> list[sqlite3.Row]:
+    """Fetch full rows for the given IDs from the main table. IDs are bound
+    as a single JSON array, so the same statement is used for any number
+    of IDs."""
+    q_detail = f"SELECT * FROM {main_table} WHERE {id_column} IN (SELECT value FROM json_each(?))"
+    return list(cur.execute(q_detail, (json_list(ids),)))
+
+
+def _closest(
+    lat: float,
+    lon: float,
+    res: list[sqlite3.Row],
+    limit: int,
+    max_dist: float,
+    post_process: Callable[[dict[str, Any]], dict[str, Any]] | None,
+) -> list[tuple[dict[str, Any], float]]:
+    """Rank candidate rows by distance from (lat, lon)."""
     # Compute distance once for each result and pair with the data
     # This avoids computing distance twice (once for sort, once for filter)
     with_distances = [(x, distance((lat, lon), (x["lat_wgs84"], x["long_wgs84"]))) for x in res]
@@ -93,7 +448,7 @@ def find_nearest(
     # Take top limit results, convert to dicts and apply post-processing
     results_with_dist: list[tuple[dict[str, Any], float]] = []
     for x, dist in closest[:limit]:
-        result: dict[str, Any] = dict(x)
+        result = row_to_dict(x)
         if post_process:
             result = post_process(result)
         results_with_dist.append((result, dist))
@@ -11,10 +11,25 @@ This file contains code related to placename lookup.
 
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Iterable, Iterator, Sequence
 
-from .db import shared_db
-from .nearest import find_nearest
+import sqlite3
+from itertools import chain
+
+from .cache import cached, cached_by
+from .db import (
+    FTS_MIN_LEN,
+    dict_rows,
+    fts_phrase,
+    iter_dict_rows,
+    json_list,
+    page_args,
+    row_to_dict,
+    search_key,
+    shared_db,
+)
+from .fuzzy import fuzzy_matches
+from .nearest import find_nearest, find_nearest_batch
 from .geo import valid_wgs84_coord
 
 # These particular placenames share a name with other, perhaps larger, placenames,
@@ -61,8 +76,9 @@ _ORDER = [
 ]
 
 
-def _precedence(pn: dict[str, Any]) -> int:
-    """Sort priority for placenames."""
+def placename_rank(pn: dict[str, Any]) -> int:
+    """Sort priority of placename, lower first. Stored in the rank column
+    when the database is built."""
     if pn["nafn"] in _HARDCODED_PRIORITY:
         (lat, lng) = _HARDCODED_PRIORITY[pn["nafn"]]
         if pn["lat_wgs84"] == lat and pn["long_wgs84"] == lng:
@@ -75,19 +91,180 @@ def _precedence(pn: dict[str, Any]) -> int:
     return 9999
 
 
-def placename_lookup(placename: str, partial: bool = False) -> list[dict[str, Any]]:
-    """Look up Icelandic placename in database."""
-    q = "SELECT * FROM ornefni WHERE nafn=?"
-    if partial:
-        q = "SELECT * FROM ornefni WHERE nafn LIKE ?"
-        placename = f"%{placename}%"
+def _rank(pn: dict[str, Any]) -> int:
+    """Sort priority of placename, precomputed in the rank column of
+    databases built with it, otherwise computed by placename_rank()."""
+    rank = pn.get("rank")
+    return placename_rank(pn) if rank is None else rank
+
+
+def _without_rank(pn: dict[str, Any]) -> dict[str, Any]:
+    """Remove the internal rank column from placename."""
+    pn.pop("rank", None)
+    return pn
+
+
+def _rank_key(pn: dict[str, Any]) -> tuple[int, int]:
+    """Position of placename in results, by precedence and then by id."""
+    return (_rank(pn), pn["id"])
+
+
+def _ranked_matches(
+    cur: sqlite3.Cursor,
+    where: str,
+    args: list[Any],
+    limit: int | None = None,
+    offset: int = 0,
+    after: dict[str, Any] | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Placenames matching the given WHERE clause, ordered by precedence,
+    following the placename after, if given, and skipping offset of them.
+    The database orders them by the precomputed rank column, so that only
+    the top limit matches are fetched, and they are streamed from the
+    cursor, unless the database lacks the column."""
+    q = f"SELECT * FROM ornefni WHERE ({where})"
+    qargs = list(args)
+    if after is not None:
+        q += " AND (rank, id) > (?, ?)"
+        qargs.extend(_rank_key(after))
+    (limit, offset) = page_args(limit, offset)
+    try:
+        rows = cur.execute(f"{q} ORDER BY rank, id LIMIT ? OFFSET ?", qargs + [limit, offset])
+    except sqlite3.OperationalError as e:
+        if "rank" not in str(e):
+            raise
+    else:
+        return map(_without_rank, iter_dict_rows(rows))
+
+    # No rank column in database
+    matches = dict_rows(cur.execute(f"SELECT * FROM ornefni WHERE {where}", args))
+    matches.sort(key=_rank_key)
+    if after is not None:
+        key = _rank_key(after)
+        matches = [pn for pn in matches if _rank_key(pn) > key]
+    return iter(matches[offset : None if limit < 0 else offset + limit])
+
+
+def _partial_matches(
+    cur: sqlite3.Cursor,
+    placename: str,
+    limit: int | None = None,
+    offset: int = 0,
+    after: dict[str, Any] | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Placenames containing the given string, ordered by precedence.
+    Candidates are found in the trigram full-text index, if present,
+    rather than by scanning the whole table, and then matched with LIKE."""
+    like = f"%{placename}%"
+    if len(placename) >= FTS_MIN_LEN:
+        where = """
+            id IN (SELECT rowid FROM ornefni_fts WHERE ornefni_fts MATCH ?)
+            AND nafn LIKE ?
+        """
+        try:
+            return _ranked_matches(cur, where, [fts_phrase(placename), like], limit, offset, after)
+        except sqlite3.OperationalError:
+            pass  # No full-text index in database
+    return _ranked_matches(cur, "nafn LIKE ?", [like], limit, offset, after)
+
+
+def placename_lookup_iter(
+    placename: str,
+    partial: bool = False,
+    fuzzy: bool = False,
+    limit: int | None = None,
+    offset: int = 0,
+    after: dict[str, Any] | None = None,
+) -> Iterator[dict[str, Any]]:
+    """Same as placename_lookup(), but streams placenames from the
+    database cursor as they are iterated over, rather than fetching
+    all of them into a list, and returns all matches by default."""
+    page_args(limit, offset)
+
+    cur = shared_db.connection().cursor()
+
+    def matches(limit: int | None, offset: int, after: dict[str, Any] | None) -> Iterator[Any]:
+        if partial:
+            return _partial_matches(cur, placename, limit, offset, after)
+        return _ranked_matches(cur, "nafn=?", [placename], limit, offset, after)
+
+    res = matches(limit, offset, after)
+    if not fuzzy:
+        return res
+    first = next(res, None)
+    if first is not None:
+        return chain([first], res)
+    # An empty page following the last match is no reason to match fuzzily
+    paged = offset or after is not None or limit == 0
+    if paged and next(matches(1, 0, None), None) is not None:
+        return iter(())
+    names = fuzzy_matches("placenames", placename)
+    where = "nafn IN (SELECT value FROM json_each(?))"
+    return _ranked_matches(cur, where, [json_list(names)], limit, offset, after)
+
+
+@cached
+def placename_lookup(
+    placename: str,
+    partial: bool = False,
+    fuzzy: bool = False,
+    limit: int | None = None,
+    offset: int = 0,
+    after: dict[str, Any] | None = None,
+) -> list[dict[str, Any]]:
+    """Look up Icelandic placename in database, ordered by precedence.
+    If fuzzy is True and there is no match, placenames with a typo or
+    without Icelandic characters also match, e.g. "Hafnarfjordur".
+
+    Results can be paged through by passing the last placename of the
+    previous page as after, which only fetches the next limit placenames
+    from the database, or by skipping offset placenames, which still
+    steps through all the skipped ones."""
+    return list(placename_lookup_iter(placename, partial, fuzzy, limit, offset, after))
+
+
+@cached_by(query=search_key)
+def placename_search(query: str, limit: int = 50) -> list[dict[str, Any]]:
+    """Search for placenames containing the query string, ignoring case.
+    Results are ranked by BM25 relevance, so that names made up mostly of
+    the query string come first, and placenames sharing the same name are
+    ordered by precedence, as in placename_lookup(). A negative limit
+    means no limit."""
+    query = query.strip()
+    (limit, _) = page_args(limit, 0)
+    if not query or limit == 0:
+        return []
+    stop = None if limit < 0 else limit
 
-    db_conn = shared_db.connection()
-    res = db_conn.cursor().execute(q, [placename])
-    matches = [dict(row) for row in res]
-    matches.sort(key=_precedence)
+    cur = shared_db.connection().cursor()
+    if len(query) >= FTS_MIN_LEN:
+        q = """
+            SELECT ornefni.*, bm25(ornefni_fts) AS score
+            FROM ornefni_fts JOIN ornefni ON ornefni.id = ornefni_fts.rowid
+            WHERE ornefni_fts MATCH ? ORDER BY score
+        """
+        try:
+            rows = cur.execute(q, [fts_phrase(query)])
+        except sqlite3.OperationalError:
+            pass  # No full-text index in database
+        else:
+            # Placenames with the same name have the same score, keep
+            # fetching until past the last one tied with the limit-th result
+            matches: list[dict[str, Any]] = []
+            for r in rows:
+                if 0 < limit <= len(matches) and r["score"] != matches[-1]["score"]:
+                    break
+                matches.append(row_to_dict(r))
+            matches.sort(key=lambda pn: (pn["score"], _rank(pn)))
+            for pn in matches:
+                del pn["score"]
+                _without_rank(pn)
+            return matches[:stop]
 
-    return matches
+    # Without a full-text index, shorter names are assumed more relevant
+    matches = list(_partial_matches(cur, query))
+    matches.sort(key=lambda pn: (len(pn["nafn"] or ""), _rank(pn)))
+    return matches[:stop]
 
 
 def nearest_placenames(
@@ -127,5 +304,55 @@ def nearest_placenames_with_dist(
         id_column="id",
         limit=limit,
         max_dist=max_dist,
-        post_process=None,  # No extra processing needed for placenames
+        post_process=_without_rank,
+    )
+
+
+def nearest_placenames_batch(
+    coords: Iterable[Sequence[float]], limit: int = 1, max_dist: float = 0.0, processes: int = 1
+) -> list[list[dict[str, Any]]]:
+    """Find the placenames closest to each of the given coordinates.
+    Accepts a sequence of (lat, lon) pairs or an (N, 2) NumPy array.
+    Returns one list of placenames per point, in input order."""
+
+    results = nearest_placenames_batch_with_dist(
+        coords, limit=limit, max_dist=max_dist, processes=processes
+    )
+
+    # Strip out distances, same as nearest_placenames()
+    return [[pn for pn, _dist in res] for res in results]
+
+
+def nearest_placenames_batch_with_dist(
+    coords: Iterable[Sequence[float]], limit: int = 1, max_dist: float = 0.0, processes: int = 1
+) -> list[list[tuple[dict[str, Any], float]]]:
+    """Find the placenames closest to each of the given coordinates, with distances.
+
+    Much faster than calling nearest_placenames_with_dist() in a loop for
+    more than a few dozen points, since points close together share spatial
+    index queries and fetched placename rows.
+    Large batches can be split between several worker processes.
+    Returns one list of (placename, distance_km) tuples per point, in input order.
+    """
+
+    points = [(float(lat), float(lon)) for lat, lon in coords]
+    for lat, lon in points:
+        if not valid_wgs84_coord(lat, lon):
+            raise ValueError("Invalid latitude or longitude value: {}, {}".format(lat, lon))
+
+    if limit < 0 or max_dist < 0.0:
+        raise ValueError("limit and max_dist must be non-negative")
+
+    if processes < 1:
+        raise ValueError("processes must be at least 1")
+
+    return find_nearest_batch(
+        points,
+        rtree_table="ornefni_rtree",
+        main_table="ornefni",
+        id_column="id",
+        limit=limit,
+        max_dist=max_dist,
+        post_process=_without_rank,
+        processes=processes,
     )
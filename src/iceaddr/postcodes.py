@@ -11,8 +11,12 @@ This file contains code and data related to Icelandic postcodes.
 
 from typing import Optional, Union
 
+import functools
+from bisect import bisect_left
 from collections import defaultdict
 
+from .text import fold
+
 POSTCODES: dict[int, dict[str, str]] = {
     101: {
         "lysing": "Miðborg",
@@ -1398,18 +1402,57 @@ POSTCODES: dict[int, dict[str, str]] = {
 }
 
 
-# Pre-calculate reverse mappings for faster lookups
-_PLACENAME_TO_POSTCODES: dict[str, list[int]] = defaultdict(list)
-_REGION_TO_POSTCODES: dict[str, list[int]] = defaultdict(list)
+# Names of postcode places and regions, in nominative and dative cases
+_NAME_KEYS = {
+    "placename": ("stadur_nf", "stadur_tgf"),
+    "region": ("svaedi_nf", "svaedi_tgf"),
+}
+
+# Max number of cached partial name lookups, e.g. while typing a query
+PREFIX_CACHE_SIZE = 4096
+
+
+class _NameIndex:
+    """Sorted index of postcode place or region names, folded to lowercase
+    without diacritics, answering exact and prefix queries by bisection."""
+
+    def __init__(self, names: dict[str, set[int]]) -> None:
+        self.keys = sorted(names)
+        # Parallel to keys: sorted postcodes
+        self.codes = [tuple(sorted(names[k])) for k in self.keys]
 
-for code, data in POSTCODES.items():
-    # Placenames (nominative and dative cases)
-    _PLACENAME_TO_POSTCODES[data["stadur_nf"].lower()].append(code)
-    _PLACENAME_TO_POSTCODES[data["stadur_tgf"].lower()].append(code)
+    def exact(self, key: str) -> tuple[int, ...]:
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.codes[i]
+        return ()
 
-    # Regions (nominative and dative cases)
-    _REGION_TO_POSTCODES[data["svaedi_nf"].lower()].append(code)
-    _REGION_TO_POSTCODES[data["svaedi_tgf"].lower()].append(code)
+    def prefix(self, key: str) -> tuple[int, ...]:
+        lo = bisect_left(self.keys, key)
+        hi = bisect_left(self.keys, key + "\U0010ffff", lo)
+        if hi - lo == 1:
+            return self.codes[lo]
+        return tuple(sorted({c for codes in self.codes[lo:hi] for c in codes}))
+
+
+@functools.lru_cache(maxsize=None)
+def _name_index(kind: str) -> _NameIndex:
+    """Index of "placename" or "region" names, built on first use rather
+    than when the module is imported."""
+    names: dict[str, set[int]] = defaultdict(set)
+    for code, data in POSTCODES.items():
+        for k in _NAME_KEYS[kind]:
+            names[fold(data[k])].add(code)
+    return _NameIndex(names)
+
+
+@functools.lru_cache(maxsize=PREFIX_CACHE_SIZE)
+def _postcodes_for_name(kind: str, name: str, partial: bool) -> tuple[int, ...]:
+    """Sorted postcodes for a full or partial name of the given kind,
+    ignoring case and diacritics."""
+    idx = _name_index(kind)
+    key = fold(name)
+    return idx.prefix(key) if partial else idx.exact(key)
 
 
 def postcode_lookup(postcode: Union[int, str]) -> Optional[dict[str, str]]:
@@ -1420,16 +1463,9 @@ def postcode_lookup(postcode: Union[int, str]) -> Optional[dict[str, str]]:
 
 def postcodes_for_region(region_name: str, partial: bool = False) -> list[int]:
     """Return postcodes matching a full or partial region name,
-    e.g. "Norðurland", "Höfuðborgarsvæðið"."""
-    if not partial:
-        return sorted(_REGION_TO_POSTCODES.get(region_name.lower(), []))
-
-    matches: list[int] = []
-    search_str = region_name.lower()
-    for name, codes in _REGION_TO_POSTCODES.items():
-        if name.startswith(search_str):
-            matches.extend(codes)
-    return sorted(set(matches))
+    e.g. "Norðurland", "Höfuðborgarsvæðið". Case and diacritics
+    are ignored, so e.g. "nordurl" matches "Norðurland"."""
+    return list(_postcodes_for_name("region", region_name, partial))
 
 
 def region_for_postcode(postcode: Union[int, str]) -> Optional[str]:
@@ -1442,13 +1478,6 @@ def region_for_postcode(postcode: Union[int, str]) -> Optional[str]:
 
 def postcodes_for_placename(placename: str, partial: bool = False) -> list[int]:
     """Returns postcodes matching a full or partial placename,
-    e.g. "Reykjavík", "Dalvík"."""
-    if not partial:
-        return sorted(_PLACENAME_TO_POSTCODES.get(placename.lower(), []))
-
-    matches: list[int] = []
-    search_str = placename.lower()
-    for name, codes in _PLACENAME_TO_POSTCODES.items():
-        if name.startswith(search_str):
-            matches.extend(codes)
-    return sorted(set(matches))
+    e.g. "Reykjavík", "Dalvík". Case and diacritics are ignored,
+    so e.g. "kopav" matches "Kópavogur"."""
+    return list(_postcodes_for_name("placename", placename, partial))
@@ -0,0 +1,573 @@
+"""
+
+iceaddr: Look up information about Icelandic streets, addresses,
+         placenames, landmarks, locations and postcodes.
+
+Copyright (c) 2018-2025 Sveinbjorn Thordarson.
+
+This file contains a compact, read-only binary snapshot of the address
+and placename data, an alternative to the SQLite database for processes
+which start often and only make a few lookups, e.g. serverless functions.
+
+The snapshot is a single file which is memory-mapped and used as is.
+Opening it only reads a small header, and lookups read just the pages
+they touch, so there is no database to open and nothing is parsed or
+loaded into memory up front.
+
+File layout (all integers little-endian):
+
+    magic       8 bytes, b"ICEADDRS"
+    version     uint32
+    sections    uint32, number of sections
+    directory   for each section: name (24 bytes, NUL-padded),
+                offset and length in bytes (uint64 each)
+
+followed by the sections, each starting at an 8-byte boundary:
+
+    meta                    "key value" lines: database metadata,
+                            spatial grid cell size and extent
+    columns                 "table column type" lines, type being
+                            q (int64), d (float64) or s (string)
+    strings                 UTF-8 encoded strings, sorted, concatenated
+    string_offsets          uint32 start of each string in strings,
+                            followed by the end of the last one
+    <table>.<column>        fixed-width column values, strings as
+                            uint32 indexes into the string table
+    <table>.<column>.keys   sorted string indexes of a column, and
+    <table>.<column>.rows   the rows they belong to (uint32 each)
+    stadfong.cells          sorted spatial grid cell keys, and
+    stadfong.cell_offsets   the start of each cell in the following,
+                            then the end of the last cell (uint32)
+    stadfong.cell_rows      rows of addresses ordered by grid cell,
+    stadfong.cell_lats      and their coordinates (float64)
+    stadfong.cell_lons
+
+Addresses are ordered by street name, so the addresses on a street are
+contiguous, and the spatial grid has its own copy of their coordinates,
+in which all addresses in a run of cells within a grid row are
+contiguous. Placenames are ordered by precedence (see placenames.py),
+so any set of placenames is in result order when ordered by row. NULL
+values are stored as the smallest int64, NaN or the largest uint32,
+respectively.
+
+Snapshots are created with build_snapshot.py.
+
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Literal, Optional
+
+import math
+import mmap
+import os
+import struct
+import time
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+
+from .geo import EARTH_RADIUS_KM, distance, distance_to_box_edge, valid_wgs84_coord
+from .municipalities import MUNICIPALITIES
+from .postcodes import POSTCODES, postcodes_for_placename
+
+if TYPE_CHECKING:
+    import sqlite3
+
+SNAPSHOT_FILENAME = "iceaddr.snapshot"
+
+MAGIC = b"ICEADDRS"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<8sII")
+_NAME_SIZE = 24
+_DIR_ENTRY = struct.Struct(f"<{_NAME_SIZE}sQQ")
+
+# Grid cell size in degrees, the same as for the in-memory nearest index
+CELL_LAT = 0.005
+CELL_LON = 0.01
+
+_NULL_INT = -(2**63)
+_NULL_STR = 2**32 - 1
+
+# Column type => memoryview format
+_Format = Literal["q", "d", "I"]
+_FORMATS: dict[str, _Format] = {"q": "q", "d": "d", "s": "I"}
+
+# Columns used only for ordering rows when the database is built, which
+# the snapshot does by storing rows in that order instead
+_INTERNAL = ("rank",)
+
+# Columns indexed for lookups by exact value
+_INDEXED = {"stadfong": ("heiti_nf", "heiti_tgf", "serheiti"), "ornefni": ("nafn",)}
+
+
+def _cell_key(row: int, col: int) -> int:
+    """Grid cell key, ordered by row and then by column."""
+    return row * 2**32 + col + 2**31
+
+
+def _column_type(decl: str) -> str:
+    decl = decl.upper()
+    if "INT" in decl:
+        return "q"
+    if "REAL" in decl or "FLOA" in decl or "DOUB" in decl:
+        return "d"
+    return "s"
+
+
+def write_snapshot(conn: sqlite3.Connection, path: str | Path) -> dict[str, Any]:
+    """Write snapshot of the address and placename tables of a database to
+    a file. Returns number of addresses, placenames, strings, size in bytes
+    and build time."""
+    from .placenames import placename_rank
+
+    t0 = time.perf_counter()
+    sections: dict[str, bytes] = {}
+
+    tables: dict[str, tuple[list[tuple[str, str]], list[tuple[Any, ...]]]] = {}
+    for table in ("stadfong", "ornefni"):
+        cols = [
+            (r[1], _column_type(r[2]))
+            for r in conn.execute(f"PRAGMA table_info({table})")
+            if r[1] not in _INTERNAL
+        ]
+        col_list = ", ".join(c for c, _ in cols)
+        rows = [tuple(r) for r in conn.execute(f"SELECT {col_list} FROM {table}")]
+        tables[table] = (cols, rows)
+
+    # Order addresses by street name, and placenames by precedence
+    (cols, rows) = tables["stadfong"]
+    names = [c for c, _ in cols]
+    (inf, ilat, ilon) = (
+        names.index("heiti_nf"),
+        names.index("lat_wgs84"),
+        names.index("long_wgs84"),
+    )
+    rows.sort(key=lambda r: (r[inf] or "", r[0]))
+    located = [
+        (math.floor(r[ilat] / CELL_LAT), math.floor(r[ilon] / CELL_LON), r[0], i)
+        for i, r in enumerate(rows)
+        if r[ilat] is not None and r[ilon] is not None
+    ]
+    located.sort()
+    cells = [(row, col) for row, col, _, _ in located]
+    cell_rows = [i for _, _, _, i in located]
+    cell_lats = [rows[i][ilat] for i in cell_rows]
+    cell_lons = [rows[i][ilon] for i in cell_rows]
+
+    (cols, rows) = tables["ornefni"]
+    names = [c for c, _ in cols]
+    rows.sort(key=lambda r: (placename_rank(dict(zip(names, r))), r[0]))
+
+    # Interned string table
+    strings = sorted(
+        {
+            v
+            for cols, rows in tables.values()
+            for i, (_, t) in enumerate(cols)
+            if t == "s"
+            for v in (r[i] for r in rows)
+            if v is not None
+        }
+    )
+    sids = {s: i for i, s in enumerate(strings)}
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = [0]
+    for b in encoded:
+        offsets.append(offsets[-1] + len(b))
+    sections["strings"] = b"".join(encoded)
+    sections["string_offsets"] = struct.pack(f"<{len(offsets)}I", *offsets)
+
+    column_lines: list[str] = []
+    for table, (cols, rows) in tables.items():
+        for i, (col, t) in enumerate(cols):
+            column_lines.append(f"{table} {col} {t}")
+            values = [r[i] for r in rows]
+            if t == "q":
+                data = [_NULL_INT if v is None else int(v) for v in values]
+            elif t == "d":
+                data = [math.nan if v is None else float(v) for v in values]
+            else:
+                data = [_NULL_STR if v is None else sids[v] for v in values]
+            sections[f"{table}.{col}"] = struct.pack(f"<{len(data)}{_FORMATS[t]}", *data)
+            if col in _INDEXED[table]:
+                pairs = sorted((sids[v], j) for j, v in enumerate(values) if v)
+                sections[f"{table}.{col}.keys"] = struct.pack(
+                    f"<{len(pairs)}I", *(k for k, _ in pairs)
+                )
+                sections[f"{table}.{col}.rows"] = struct.pack(
+                    f"<{len(pairs)}I", *(j for _, j in pairs)
+                )
+    sections["columns"] = "\n".join(column_lines).encode("utf-8")
+
+    # Spatial grid: keys of non-empty cells and their first rows
+    keys: list[int] = []
+    starts: list[int] = []
+    for i, (row, col) in enumerate(cells):
+        key = _cell_key(row, col)
+        if not keys or keys[-1] != key:
+            keys.append(key)
+            starts.append(i)
+    starts.append(len(cells))
+    sections["stadfong.cells"] = struct.pack(f"<{len(keys)}q", *keys)
+    sections["stadfong.cell_offsets"] = struct.pack(f"<{len(starts)}I", *starts)
+    sections["stadfong.cell_rows"] = struct.pack(f"<{len(cell_rows)}I", *cell_rows)
+    sections["stadfong.cell_lats"] = struct.pack(f"<{len(cell_lats)}d", *cell_lats)
+    sections["stadfong.cell_lons"] = struct.pack(f"<{len(cell_lons)}d", *cell_lons)
+
+    meta = dict(conn.execute("SELECT key, value FROM metadata").fetchall())
+    meta["cell_lat"] = repr(CELL_LAT)
+    meta["cell_lon"] = repr(CELL_LON)
+    if cells:
+        meta["min_row"] = str(min(r for r, _ in cells))
+        meta["max_row"] = str(max(r for r, _ in cells))
+        meta["min_col"] = str(min(c for _, c in cells))
+        meta["max_col"] = str(max(c for _, c in cells))
+    sections["meta"] = "\n".join(f"{k} {v}" for k, v in meta.items()).encode("utf-8")
+
+    # Lay out sections after the header and directory
+    offset = _HEADER.size + _DIR_ENTRY.size * len(sections)
+    directory: list[bytes] = []
+    body: list[bytes] = []
+    for name, data in sections.items():
+        pad = -offset % 8
+        body.append(b"\0" * pad)
+        offset += pad
+        encoded_name = name.encode("ascii")
+        if len(encoded_name) > _NAME_SIZE:
+            # Would be silently truncated by struct
+            raise ValueError(f"Section name longer than {_NAME_SIZE} bytes: {name}")
+        directory.append(_DIR_ENTRY.pack(encoded_name, offset, len(data)))
+        body.append(data)
+        offset += len(data)
+
+    tmp = Path(f"{path}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(sections)))
+        f.write(b"".join(directory))
+        f.write(b"".join(body))
+    os.replace(tmp, path)
+
+    return {
+        "addresses": len(tables["stadfong"][1]),
+        "placenames": len(tables["ornefni"][1]),
+        "strings": len(strings),
+        "bytes": offset,
+        "build_time": time.perf_counter() - t0,
+    }
+
+
+class Snapshot:
+    """Read-only address and placename lookups from a memory-mapped
+    snapshot file. Lookup methods return the same results as the
+    functions of the same name using the SQLite database."""
+
+    def __init__(self, path: str | Path) -> None:
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MADV_RANDOM"):
+            # Lookups touch a few scattered pages, so don't read ahead
+            self._mm.madvise(mmap.MADV_RANDOM)
+        self._buf = memoryview(self._mm)
+
+        (magic, version, count) = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Not an iceaddr snapshot (version {FORMAT_VERSION}): {path}")
+        self._sections: dict[str, tuple[int, int]] = {}
+        for i in range(count):
+            (name, offset, length) = _DIR_ENTRY.unpack_from(
+                self._mm, _HEADER.size + i * _DIR_ENTRY.size
+            )
+            self._sections[name.rstrip(b"\0").decode("ascii")] = (offset, length)
+
+        # Table => [(column, type)]
+        self._columns: dict[str, list[tuple[str, str]]] = {}
+        for line in self._text("columns").splitlines():
+            (table, col, t) = line.split()
+            self._columns.setdefault(table, []).append((col, t))
+        self._meta = dict(
+            line.split(" ", 1) for line in self._text("meta").splitlines() if " " in line
+        )
+
+        # Arrays of the sections used so far, by name
+        self._arrays: dict[str, memoryview[Any]] = {}
+        self._strings_start = self._sections["strings"][0]
+        self._string_offsets = self._array("string_offsets")
+        self._lowered: Optional[bytes] = None
+
+    def _text(self, name: str) -> str:
+        (offset, length) = self._sections[name]
+        return self._mm[offset : offset + length].decode("utf-8")
+
+    def _array(self, name: str, fmt: _Format = "I") -> memoryview[Any]:
+        a = self._arrays.get(name)
+        if a is None:
+            (offset, length) = self._sections[name]
+            a = self._arrays[name] = self._buf[offset : offset + length].cast(fmt)
+        return a
+
+    def _column(self, table: str, col: str) -> memoryview[Any]:
+        name = f"{table}.{col}"
+        a = self._arrays.get(name)
+        if a is None:
+            t = dict(self._columns[table])[col]
+            a = self._array(name, _FORMATS[t])
+        return a
+
+    def _string_bytes(self, sid: int) -> bytes:
+        (start, offsets) = (self._strings_start, self._string_offsets)
+        return self._mm[start + offsets[sid] : start + offsets[sid + 1]]
+
+    def _string(self, sid: int) -> str:
+        return self._string_bytes(sid).decode("utf-8")
+
+    def _sid(self, s: str) -> Optional[int]:
+        """Index of string in the string table, or None if not present."""
+        b = s.encode("utf-8")
+        (lo, hi) = (0, len(self._string_offsets) - 1)
+        # The strings are sorted, and UTF-8 byte order is code point order
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string_bytes(mid) < b:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self._string_offsets) - 1 and self._string_bytes(lo) == b:
+            return lo
+        return None
+
+    def _value(self, table: str, col: str, t: str, i: int) -> Any:
+        v = self._column(table, col)[i]
+        if t == "s":
+            return None if v == _NULL_STR else self._string(v)
+        if t == "q":
+            return None if v == _NULL_INT else v
+        return None if math.isnan(v) else v
+
+    def _row(self, table: str, i: int) -> dict[str, Any]:
+        return {col: self._value(table, col, t, i) for col, t in self._columns[table]}
+
+    def _addr(self, i: int) -> dict[str, Any]:
+        """Address with postcode and municipality info."""
+        addr = self._row("stadfong", i)
+        pn = addr.get("postnr")
+        if pn is not None and POSTCODES.get(pn):
+            addr.update(POSTCODES[pn])
+        mn = addr.get("svfnr")
+        if mn is not None and MUNICIPALITIES.get(mn):
+            addr["svfheiti"] = MUNICIPALITIES[mn]
+        return addr
+
+    def _rows_with(self, table: str, col: str, sid: int) -> list[int]:
+        """Rows where an indexed column has the given string."""
+        keys = self._array(f"{table}.{col}.keys")
+        rows = self._array(f"{table}.{col}.rows")
+        return [rows[j] for j in range(bisect_left(keys, sid), bisect_right(keys, sid))]
+
+    def metadata(self) -> dict[str, str]:
+        """Metadata of the database the snapshot was made from."""
+        return dict(self._meta)
+
+    def iceaddr_lookup(
+        self,
+        street_name: str,
+        number: Optional[int] = None,
+        letter: Optional[str] = None,
+        postcode: Optional[int] = None,
+        placename: Optional[str] = None,
+        limit: int = 50,
+    ) -> list[dict[str, Any]]:
+        """Look up all addresses matching criterion."""
+        street_name = street_name.strip()
+        street_name = street_name[:1].upper() + street_name[1:]
+
+        pc = [postcode] if postcode else []
+        if placename and not postcode:
+            pc = postcodes_for_placename(placename.strip())
+
+        sid = self._sid(street_name)
+        if sid is None:
+            return []
+        name_cols = ["heiti_nf", "heiti_tgf"]
+        if not number:
+            name_cols.append("serheiti")
+        rows = sorted({i for col in name_cols for i in self._rows_with("stadfong", col, sid)})
+
+        # Filter and order by the columns involved, and only
+        # make dicts of the addresses returned
+        husnr = self._column("stadfong", "husnr")
+        postnr = self._column("stadfong", "postnr")
+        vidsk = self._column("stadfong", "vidsk")
+        bokst = self._column("stadfong", "bokst")
+        empty = self._sid("")
+        if number:
+            # Also match the first number of a range, e.g. "4-6"
+            prefix = f"{number}-".encode()
+            rows = [
+                i
+                for i in rows
+                if husnr[i] == number
+                or (
+                    vidsk[i] not in (empty, _NULL_STR)
+                    and self._string_bytes(vidsk[i]).startswith(prefix)
+                )
+            ]
+            if letter:
+                lowered = letter.encode().lower()
+                rows = [
+                    i
+                    for i in rows
+                    if bokst[i] != _NULL_STR and self._string_bytes(bokst[i]).lower() == lowered
+                ]
+        if pc:
+            rows = [i for i in rows if postnr[i] in pc]
+
+        hnitnum = self._column("stadfong", "hnitnum")
+
+        def order(i: int) -> tuple[Any, ...]:
+            (h, b) = (husnr[i], bokst[i])
+            return (
+                vidsk[i] not in (empty, _NULL_STR),
+                postnr[i],
+                h != _NULL_INT,
+                h,
+                b != _NULL_STR and b,
+                hnitnum[i],
+            )
+
+        rows.sort(key=order)
+        if limit >= 0:
+            rows = rows[:limit]
+        return [self._addr(i) for i in rows]
+
+    def placename_lookup(self, placename: str, partial: bool = False) -> list[dict[str, Any]]:
+        """Look up Icelandic placename, ordered by precedence. Partial
+        matches contain the given string, ignoring case of ASCII letters."""
+        if partial:
+            sids = self._containing(placename)
+        else:
+            sid = self._sid(placename)
+            sids = [] if sid is None else [sid]
+        rows = sorted(i for sid in sids for i in self._rows_with("ornefni", "nafn", sid))
+        return [self._row("ornefni", i) for i in rows]
+
+    def _containing(self, s: str) -> list[int]:
+        """Indexes of strings containing s, ignoring case of ASCII letters."""
+        if self._lowered is None:
+            (offset, length) = self._sections["strings"]
+            self._lowered = self._mm[offset : offset + length].lower()
+        (lowered, offsets) = (self._lowered, self._string_offsets)
+        b = s.encode("utf-8").lower()
+        sids: list[int] = []
+        pos = lowered.find(b)
+        while pos >= 0:
+            sid = bisect_right(offsets, pos) - 1
+            end = offsets[sid + 1]
+            if pos + len(b) <= end:
+                sids.append(sid)
+            # Continue with the next string
+            pos = lowered.find(b, end)
+        return sids
+
+    def nearest_addr(
+        self, lat: float, lon: float, limit: int = 1, max_dist: float = 0.0
+    ) -> list[dict[str, Any]]:
+        """Find the address closest to the given coordinates."""
+        return [addr for addr, _ in self.nearest_addr_with_dist(lat, lon, limit, max_dist)]
+
+    def nearest_addr_with_dist(
+        self, lat: float, lon: float, limit: int = 1, max_dist: float = 0.0
+    ) -> list[tuple[dict[str, Any], float]]:
+        """Find the address closest to the given coordinates, with distances in km."""
+        if not valid_wgs84_coord(lat, lon):
+            raise ValueError("Invalid latitude or longitude value: {}, {}".format(lat, lon))
+        if limit < 0 or max_dist < 0.0:
+            raise ValueError("limit and max_dist must be non-negative")
+
+        lats = self._column("stadfong", "lat_wgs84")
+        lons = self._column("stadfong", "long_wgs84")
+        res: list[tuple[dict[str, Any], float]] = []
+        for i in self._knn(lat, lon, limit, max_dist):
+            res.append((self._addr(i), distance((lat, lon), (lats[i], lons[i]))))
+        return res
+
+    def _knn(self, lat: float, lon: float, k: int, max_dist: float) -> list[int]:
+        """Rows of the k addresses closest to (lat, lon), nearest first.
+        Visits squares of cells of doubling size around the point, as in
+        memindex.GridIndex, until nothing further out can be closer."""
+        if k <= 0 or "min_row" not in self._meta:
+            return []
+        meta = self._meta
+        (cell_lat, cell_lon) = (float(meta["cell_lat"]), float(meta["cell_lon"]))
+        (min_row, max_row) = (int(meta["min_row"]), int(meta["max_row"]))
+        (min_col, max_col) = (int(meta["min_col"]), int(meta["max_col"]))
+        cells = self._array("stadfong.cells", "q")
+        offsets = self._array("stadfong.cell_offsets")
+        lats = self._array("stadfong.cell_lats", "d")
+        lons = self._array("stadfong.cell_lons", "d")
+
+        limit_dist = max_dist if max_dist > 0.0 else math.inf
+        (rlat, rlon) = (math.radians(lat), math.radians(lon))
+        coslat = math.cos(rlat)
+        (sin, cos, asin, sqrt, radians) = (math.sin, math.cos, math.asin, math.sqrt, math.radians)
+        (prow, pcol) = (math.floor(lat / cell_lat), math.floor(lon / cell_lon))
+
+        # k best so far, as (distance, index in cell order), nearest first
+        best: list[tuple[float, int]] = []
+        done = -1
+        size = max(0, min_row - prow, prow - max_row, min_col - pcol, pcol - max_col)
+        while True:
+            for row in range(max(prow - size, min_row), min(prow + size, max_row) + 1):
+                if done >= 0 and abs(row - prow) <= done:
+                    spans = [(pcol - size, pcol - done - 1), (pcol + done + 1, pcol + size)]
+                else:
+                    spans = [(pcol - size, pcol + size)]
+                for col0, col1 in spans:
+                    j0 = bisect_left(cells, _cell_key(row, col0))
+                    j1 = bisect_left(cells, _cell_key(row, col1 + 1))
+                    for i in range(offsets[j0], offsets[j1]):
+                        plat = radians(lats[i])
+                        slat = sin((plat - rlat) / 2)
+                        slon = sin((radians(lons[i]) - rlon) / 2)
+                        a = slat * slat + coslat * cos(plat) * slon * slon
+                        d = 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a)))
+                        if d <= limit_dist and (len(best) < k or d < best[-1][0]):
+                            best.insert(bisect_left(best, (d, i)), (d, i))
+                            del best[k:]
+
+            if (
+                prow - size <= min_row
+                and prow + size >= max_row
+                and pcol - size <= min_col
+                and pcol + size >= max_col
+            ):
+                break  # Searched every non-empty cell
+
+            box = (
+                (prow - size) * cell_lat,
+                (prow + size + 1) * cell_lat,
+                (pcol - size) * cell_lon,
+                (pcol + size + 1) * cell_lon,
+            )
+            kth = best[-1][0] if len(best) == k else math.inf
+            if min(kth, limit_dist) <= distance_to_box_edge((lat, lon), box):
+                break
+
+            done = size
+            size = max(1, size * 2)
+
+        rows = self._array("stadfong.cell_rows")
+        return [rows[i] for _, i in best]
+
+    def close(self) -> None:
+        """Unmap the snapshot file. Results already returned remain valid."""
+        for a in self._arrays.values():
+            a.release()
+        self._arrays.clear()
+        self._buf.release()
+        self._mm.close()
+
+
+def open_snapshot(path: Optional[str | Path] = None) -> Snapshot:
+    """Open snapshot file, by default the one installed with the package."""
+    return Snapshot(path or Path(__file__).with_name(SNAPSHOT_FILENAME))
@@ -0,0 +1,114 @@
+"""
+
+iceaddr: Look up information about Icelandic streets, addresses,
+         placenames, landmarks, locations and postcodes.
+
+Copyright (c) 2018-2025 Sveinbjorn Thordarson.
+
+This file contains an in-memory prefix index of street names,
+used for autocompletion.
+
+"""
+
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+
+from .db import shared_db
+from .meta import check_data_version, on_data_change
+
+# Sorts after any character that can follow a prefix
+_MAX_CHAR = chr(0x10FFFF)
+
+
+class StreetIndex:
+    """Sorted array of all distinct street names, in both the nominative
+    and dative case, lowercased for case-insensitive prefix matching.
+    All names starting with a given prefix form a contiguous range,
+    found with two binary searches."""
+
+    def __init__(self) -> None:
+        q = """
+            SELECT heiti_nf, heiti_tgf, COUNT(*) AS cnt FROM stadfong
+            WHERE heiti_nf IS NOT NULL
+            GROUP BY heiti_nf, heiti_tgf
+        """
+        # Lowercased name => set of (name, nominative name)
+        entries: dict[str, set[tuple[str, str]]] = {}
+        # Nominative name => number of addresses
+        counts: dict[str, int] = {}
+        for r in shared_db.connection().cursor().execute(q):
+            (nf, tgf) = (r["heiti_nf"], r["heiti_tgf"] or r["heiti_nf"])
+            counts[nf] = counts.get(nf, 0) + r["cnt"]
+            for name in (nf, tgf):
+                entries.setdefault(name.lower(), set()).add((name, nf))
+
+        self.keys = sorted(entries)
+        # Parallel to keys: the matching names, exactly as in the database
+        self.names = [sorted(entries[k]) for k in self.keys]
+        self.counts = counts
+
+    def _range(self, prefix: str) -> range:
+        prefix = prefix.lower()
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + _MAX_CHAR, lo)
+        return range(lo, hi)
+
+    def matches(self, prefix: str) -> list[tuple[str, str]]:
+        """Return (name, nominative name) for all street names, in either
+        case, starting with prefix."""
+        return [n for i in self._range(prefix) for n in self.names[i]]
+
+    def suggest(self, prefix: str, limit: int = 10) -> list[str]:
+        """Return distinct street names (nominative case) starting with
+        prefix, exact matches first, then by number of addresses."""
+        return self._rank(prefix, self.matches(prefix))[:limit]
+
+    def top_matches(self, prefix: str, max_streets: int) -> list[str]:
+        """Return all names, in either case, starting with prefix,
+        for the max_streets highest ranked matching streets."""
+        matches = self.matches(prefix)
+        top = set(self._rank(prefix, matches)[:max_streets])
+        return sorted({name for name, nf in matches if nf in top})
+
+    def _rank(self, prefix: str, matches: list[tuple[str, str]]) -> list[str]:
+        exact = prefix.lower()
+        found: dict[str, bool] = {}
+        for name, nf in matches:
+            found[nf] = found.get(nf, False) or name.lower() == exact
+        return sorted(found, key=lambda nf: (not found[nf], -self.counts[nf], nf))
+
+
+_index: StreetIndex | None = None
+_lock = threading.Lock()
+
+
+def _reset() -> None:
+    global _index
+    _index = None
+
+
+on_data_change(_reset)
+
+
+def street_index() -> StreetIndex:
+    """Return the street name index, building it on first use, and again
+    after the database has changed."""
+    global _index
+    check_data_version()
+    if _index is None:
+        with _lock:
+            if _index is None:
+                _index = StreetIndex()
+    return _index
+
+
+def street_name_suggest(prefix: str, limit: int = 10) -> list[str]:
+    """Return street names (nominative case) starting with prefix, in either
+    the nominative or dative case, e.g. "Öldug" => ["Öldugata"]. Exact
+    matches come first, then streets ranked by number of addresses."""
+    prefix = prefix.strip()
+    if not prefix:
+        return []
+    return street_index().suggest(prefix, limit=limit)
@@ -0,0 +1,23 @@
+"""
+
+iceaddr: Look up information about Icelandic streets, addresses,
+         placenames, landmarks, locations and postcodes.
+
+Copyright (c) 2018-2025 Sveinbjorn Thordarson.
+
+This file contains text normalization shared by fuzzy matching and the
+postcode name index. It has no dependencies on the rest of the package.
+
+"""
+
+import unicodedata
+
+_FOLD = str.maketrans({"ð": "d", "þ": "th", "æ": "ae", "ö": "o", "ø": "o", "ß": "ss"})
+
+
+def fold(s: str) -> str:
+    """Fold string to lowercase without diacritics, e.g. "Þórsgötu" => "thorsgotu"."""
+    s = s.lower().translate(_FOLD)
+    if s.isascii():
+        return s
+    return "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c))
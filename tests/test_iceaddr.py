@@ -9,33 +9,80 @@ Tests for iceaddr python package.
 
 """
 
-from typing import Optional
+from typing import Any, Callable, Optional
 
+import asyncio
 import datetime
+import io
+import os
+import random
+import re
+import sqlite3
+import subprocess
 import sys
+import threading
 from pathlib import Path
 
+import pytest
+
 # Add parent directory to import path
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from iceaddr import (
     POSTCODES,
+    aio,
+    cache_stats,
+    clear_cache,
+    disable_cache,
+    enable_cache,
+    geo,
+    geocode,
+    geocode_csv,
+    grid,
     iceaddr_lookup,
+    iceaddr_lookup_iter,
     iceaddr_metadata,
+    iceaddr_search,
     iceaddr_suggest,
+    iceaddr_suggest_iter,
     municipality_code_for_municipality,
     municipality_for_municipality_code,
     nearest_addr,
+    nearest_addr_batch,
+    nearest_addr_batch_with_dist,
     nearest_addr_with_dist,
     nearest_placenames,
+    nearest_placenames_batch,
+    nearest_placenames_batch_with_dist,
     nearest_placenames_with_dist,
     placename_lookup,
+    placename_lookup_iter,
+    placename_search,
     postcode_lookup,
     postcodes_for_placename,
     postcodes_for_region,
     region_for_postcode,
+    set_nearest_engine,
+    street_name_suggest,
+)
+from iceaddr.addresses import postprocess_addr
+from iceaddr.db import DEFAULT_POOL_SIZE, dict_rows, shared_db
+from iceaddr.fuzzy import edit_distance, fuzzy_index_stats, fuzzy_matches
+from iceaddr.geo import (
+    ICELAND_COORDS,
+    distance,
+    distance_many,
+    distance_matrix,
+    in_iceland,
+    in_iceland_many,
+    valid_wgs84_coord,
 )
-from iceaddr.geo import ICELAND_COORDS, in_iceland, valid_wgs84_coord
+from iceaddr.grid import build_grid
+from iceaddr.memindex import grid_index_stats
+from iceaddr.nearest import find_nearest
+from iceaddr.placenames import placename_rank
+from iceaddr.snapshot import open_snapshot, write_snapshot
+from iceaddr.text import fold
 
 
 def test_address_lookup():
@@ -135,6 +182,208 @@ def test_address_suggest_with_dashed_numbers():
     assert iceaddr_suggest("Laugavegur 151-155")
 
 
+def test_geocode(monkeypatch: pytest.MonkeyPatch):
+    """Test bulk geocoding of address strings."""
+    addrs = [
+        "Öldugata 4, 101",
+        "öldugötu  4 ,  Reykjavík",
+        "Öldugata 4, 101",
+        "Öldugata 4",
+        "Öldugata 4x, 101",
+        "Öldugata",
+        "Xyzzystræti 3",
+        "",
+    ]
+    res = list(geocode(addrs, chunk_size=3))
+    assert len(res) == len(addrs)
+    (match, confidence) = res[0]
+    assert match is not None
+    assert (match["heiti_nf"], match["husnr"], match["postnr"]) == ("Öldugata", 4, 101)
+    assert match["stadur_nf"] == "Reykjavík"
+    assert confidence == 1.0
+    assert res[1] == res[0]
+    assert res[2] == res[0]
+    assert res[3][0] == iceaddr_lookup("Öldugata", number=4)[0]
+    assert res[3][1] < 1.0  # Street number in several postcodes
+    assert res[4][0] == match
+    assert res[4][1] < 1.0  # No such letter
+    assert res[5][0] is not None
+    assert res[5][1] < 1.0  # No number
+    assert res[6] == (None, 0.0)
+    assert res[7] == (None, 0.0)
+
+    # Addresses with a special name, e.g. of a church, match by that name,
+    # but only without a house number, as in iceaddr_lookup()
+    (church, _) = next(geocode(["Hallgrímskirkja, 101"]))
+    assert church is not None and church == iceaddr_lookup("Hallgrímskirkja")[0]
+    assert next(geocode(["Hallgrímskirkja 1"])) == (None, 0.0)
+
+    # Modifying a result doesn't affect others
+    match["postnr"] = 999
+    assert next(geocode(["Öldugata 4, 101"]))[0] == res[1][0]
+
+    infile = io.StringIO("id;adr\n1;Öldugata 4, 101\n2;Xyzzystræti 3\n")
+    outfile = io.StringIO()
+    stats = geocode_csv(infile, outfile, column="adr", delimiter=";")
+    assert (stats["rows"], stats["matched"]) == (2, 1)
+    lines = outfile.getvalue().splitlines()
+    assert lines[0].startswith("id;adr;hnitnum;heiti_nf;")
+    assert lines[0].endswith(";confidence")
+    assert lines[1].startswith("1;Öldugata 4, 101;")
+    assert lines[1].endswith(";1.0")
+    assert lines[2].endswith(";0.0")
+
+    with pytest.raises(ValueError):
+        geocode_csv(io.StringIO("id\n1\n"), io.StringIO())
+
+    # Addresses without a house number come first, before number 0,
+    # in the same order as iceaddr_lookup()
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    shared_db.connection().backup(conn)
+    conn.row_factory = sqlite3.Row
+    hnitnums = [
+        r[0] for r in conn.execute("SELECT hnitnum FROM stadfong WHERE heiti_nf='Öldugata'")
+    ]
+    conn.execute("UPDATE stadfong SET vidsk='', postnr=100 WHERE heiti_nf='Öldugata'")
+    conn.execute("UPDATE stadfong SET husnr=0 WHERE hnitnum=?", [min(hnitnums)])
+    conn.execute("UPDATE stadfong SET husnr=NULL WHERE hnitnum=?", [max(hnitnums)])
+    monkeypatch.setattr(shared_db, "connection", lambda: conn)
+    first = iceaddr_lookup("Öldugata", limit=1)[0]
+    assert first["hnitnum"] == max(hnitnums)
+    assert next(geocode(["Öldugata"]))[0] == first
+
+
+def test_street_name_suggest():
+    """Test street name prefix index used for autocompletion."""
+    assert street_name_suggest("Öldugata")[0] == "Öldugata"
+    assert "Öldugata" in street_name_suggest("öldugö")  # Dative case, lowercase
+    assert street_name_suggest("Öldu", limit=2) == street_name_suggest("Öldu")[:2]
+    assert all(s.lower().startswith("ölduga") for s in street_name_suggest("Ölduga"))
+    assert street_name_suggest("Xyzzy") == []
+    assert street_name_suggest(" ") == []
+
+    # Same results as matching street names with LIKE
+    q = """
+        SELECT * FROM stadfong WHERE heiti_nf LIKE ? OR heiti_tgf LIKE ?
+        ORDER BY postnr, husnr, bokst LIMIT 200
+    """
+    for prefix in ("Öldug", "Laugav", "Xyzzy"):
+        cur = shared_db.connection().cursor()
+        expected = [r["hnitnum"] for r in cur.execute(q, [prefix + "%", prefix + "%"])]
+        assert [a["hnitnum"] for a in iceaddr_suggest(prefix, limit=200)] == expected
+
+
+def test_dict_rows():
+    """Test conversion of database rows to dicts."""
+    cur = shared_db.connection().cursor()
+    rows = dict_rows(cur.execute("SELECT * FROM stadfong WHERE heiti_nf=? LIMIT 5", ["Öldugata"]))
+    assert len(rows) == 5
+    for r in rows:
+        assert type(r) is dict
+        assert r["heiti_nf"] == "Öldugata"
+        assert "hnitnum" in r and "lat_wgs84" in r
+
+    res = iceaddr_lookup("Öldugata", number=4, postcode=101)
+    assert type(res[0]) is dict
+
+
+def test_connection_per_thread():
+    """Test that threads get their own database connections, up to the pool size."""
+    pool_size = 3
+    shared_db.configure(pool_size=pool_size)
+    conns: list[object] = []
+    results: list[bool] = []
+
+    def lookup() -> None:
+        conns.append(shared_db.connection())
+        res = nearest_addr(OLDUGATA_4_COORDS[0], OLDUGATA_4_COORDS[1])
+        results.append(res[0]["heiti_nf"] == "Öldugata")
+
+    try:
+        threads = [threading.Thread(target=lookup) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len({id(c) for c in conns}) == pool_size
+        assert results == [True] * 5
+    finally:
+        shared_db.configure(pool_size=DEFAULT_POOL_SIZE)
+
+    with pytest.raises(ValueError):
+        shared_db.configure(pool_size=0)
+
+
+def test_connection_settings():
+    """Test SQLite settings applied to database connections."""
+    defaults = shared_db.settings()
+    shared_db.configure(
+        mmap_size=1 << 20, cache_size=-4096, immutable=True, temp_store="memory", query_only=True
+    )
+    try:
+        conn = shared_db.connection()
+        assert conn.execute("PRAGMA mmap_size").fetchone()[0] == 1 << 20
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -4096
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # Memory
+        assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+        assert nearest_addr(*OLDUGATA_4_COORDS)[0]["heiti_nf"] == "Öldugata"
+        assert shared_db.settings()["immutable"] is True
+    finally:
+        shared_db.configure(**defaults)
+    assert shared_db.settings() == defaults
+
+    with pytest.raises(ValueError):
+        shared_db.configure(temp_store="disk")
+    with pytest.raises(ValueError):
+        shared_db.configure(mmap_size=-1)
+
+
+def test_in_memory_db():
+    """Test using an in-memory copy of the database."""
+    expected = iceaddr_lookup("Öldugata", number=4)
+    assert shared_db.memory_stats() == {}
+    shared_db.configure(in_memory=True)
+    try:
+        stats = shared_db.warm_up()
+        assert stats["memory_bytes"] > 0
+        assert stats["load_time"] > 0
+        db_file = shared_db.connection().execute("PRAGMA database_list").fetchone()[2]
+        assert db_file == ""  # Not backed by a file
+        assert iceaddr_lookup("Öldugata", number=4) == expected
+
+        # Other threads share the same in-memory copy
+        results: list[object] = []
+        t = threading.Thread(target=lambda: results.append(nearest_addr(*OLDUGATA_4_COORDS)))
+        t.start()
+        t.join()
+        assert results == [nearest_addr(*OLDUGATA_4_COORDS)]
+        assert shared_db.memory_stats() == stats
+    finally:
+        shared_db.configure(in_memory=False)
+    assert shared_db.memory_stats() == {}
+
+
+def test_static_sql():
+    """Test that queries with lists of values use the same SQL for any list length."""
+    statements: set[str] = set()
+    conn = shared_db.connection()
+    # Traced SQL has bound parameters expanded, replace them with placeholders
+    conn.set_trace_callback(lambda sql: statements.add(re.sub(r"'[^']*'", "?", sql)))
+    try:
+        res = iceaddr_lookup("Öldugata", placename="Reykjavík")
+        assert res and all(a["postnr"] in postcodes_for_placename("Reykjavík") for a in res)
+        assert iceaddr_lookup("Öldugata", postcode=101) == [a for a in res if a["postnr"] == 101]
+        iceaddr_lookup("Öldugata", placename="Kópavogur")
+        assert len(statements) == 1
+
+        statements.clear()
+        for s in ("Öldugata 4, Reykjavík", "Öldugata 4, 101", "Öldugata 4, Hafnarfj"):
+            iceaddr_suggest(s)
+        assert len(statements) == 1
+    finally:
+        conn.set_trace_callback(None)
+
+
 def test_postcode_data_integrity():
     """Make sure postcode data is sane."""
     for k, v in POSTCODES.items():
@@ -177,6 +426,17 @@ def test_postcode_lookup():
     assert postcodes_for_region("Höfuðborgarsvæðið")
     assert postcodes_for_region("Norður", partial=True)
 
+    # Diacritics and case are ignored, and results are copies
+    assert postcodes_for_placename("KOPAV", partial=True) == postcodes_for_placename("Kópavogur")
+    assert postcodes_for_region("Nordurland") == postcodes_for_region("Norðurland")
+    assert postcodes_for_region("Höfuðborgarsv", partial=True) == postcodes_for_region(
+        "hofudborgarsvaedid"
+    )
+    postcodes_for_placename("Selfoss").clear()
+    assert postcodes_for_placename("Selfoss") == selfoss_pc
+    assert postcodes_for_placename("Selfossx", partial=True) == []
+    assert len(postcodes_for_placename("", partial=True)) == len(POSTCODES)
+
     assert region_for_postcode(101) == "Höfuðborgarsvæðið"
     assert region_for_postcode(900) == "Suðurland og Reykjanes"
     assert region_for_postcode(710) == "Austurland"
@@ -191,16 +451,233 @@ def test_municipality_lookup():
     assert municipality_for_municipality_code(0) == "Reykjavíkurborg"
 
 
-def test_placename_lookup():
+def test_placename_lookup(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
     """Test placename lookup."""
     assert len(placename_lookup("Meðalfellsvatn")) != 0
     assert len(placename_lookup("Meðalfell", partial=True)) != 0
     assert len(placename_lookup("Hellisheiði")) > 1
 
+    # Same results as matching with LIKE, without using the full-text index
+    cur = shared_db.connection().cursor()
+    for s in ("Meðalfell", "heiði", "Hv", "Xyzzy"):
+        expected = dict_rows(cur.execute("SELECT * FROM ornefni WHERE nafn LIKE ?", [f"%{s}%"]))
+        res = placename_lookup(s, partial=True)
+        assert sorted(pn["id"] for pn in res) == sorted(pn["id"] for pn in expected)
+
+    # Ordered by precedence, which is precomputed in the rank column
+    res = placename_lookup("Bakki")
+    assert len(res) > 1
+    assert res[0]["lat_wgs84"] == 66.0701681
+    assert [placename_rank(pn) for pn in res] == sorted(placename_rank(pn) for pn in res)
+    # The rank column is internal and not part of results
+    assert all(set(pn) == {"id", "nafn", "flokkur", "lat_wgs84", "long_wgs84"} for pn in res)
+    assert all("rank" not in pn for pn in placename_search("Bakki"))
+    assert all("rank" not in pn for pn, _ in nearest_placenames_with_dist(64.15, -21.95, limit=5))
+    assert placename_lookup("Bakki", limit=3) == res[:3]
+    assert (
+        placename_lookup("akki", partial=True, limit=5)
+        == placename_lookup("akki", partial=True)[:5]
+    )
+    assert placename_lookup("Bakki", limit=0) == []
+    assert placename_lookup("Bakki", limit=-1) == res  # No limit, as in SQLite
+
+    # Same order in databases without the rank column
+    conn = sqlite3.connect(tmp_path / "norank.db", check_same_thread=False)
+    shared_db.connection().backup(conn)
+    conn.execute("DROP INDEX idx_ornefni_nafn_rank")
+    conn.execute("ALTER TABLE ornefni DROP COLUMN rank")
+    conn.row_factory = sqlite3.Row
+    monkeypatch.setattr(shared_db, "connection", lambda: conn)
+    assert placename_lookup("Bakki") == res
+    assert placename_lookup("Bakki", limit=3) == res[:3]
+    assert placename_lookup("Bakki", limit=3, after=res[2]) == res[3:6]
+    assert placename_lookup("Bakki", limit=-1) == res
+    assert placename_search("Bakki")[0] == res[0]
+
+
+def test_fuzzy_lookup():
+    """Test typo-tolerant lookup of street names and placenames."""
+    assert fold("Þórsgötu") == "thorsgotu"
+    assert fold("Æðey") == "aedey"
+    assert edit_distance("oldugata", "oldugtaa", 2) == 1  # Transposition
+    assert edit_distance("oldugata", "laugavegur", 2) == 3
+
+    assert fuzzy_matches("streets", "Oldugata") == ["Öldugata"]
+    assert "Laugavegur" in fuzzy_matches("streets", "laugavegr")
+    assert fuzzy_matches("streets", "Xyzzystræti") == []
+
+    expected = iceaddr_lookup("Öldugata", number=4, placename="Reykjavík")
+    assert iceaddr_lookup("Oldugotu", number=4, placename="Reykjavik") == []
+    assert iceaddr_lookup("Oldugotu", number=4, placename="Reykjavik", fuzzy=True) == expected
+    assert iceaddr_lookup("Laugavegr", number=151, fuzzy=True)
+    assert iceaddr_lookup("Xyzzystræti", fuzzy=True) == []
+
+    expected = placename_lookup("Hafnarfjörður")
+    assert expected
+    assert placename_lookup("Hafnarfjordur") == []
+    assert placename_lookup("Hafnarfjordur", fuzzy=True) == expected
+    assert placename_lookup("Medalfellsvatn", fuzzy=True) == placename_lookup("Meðalfellsvatn")
+
+    stats = fuzzy_index_stats()
+    assert stats["streets"]["names"] > 0
+    assert stats["streets"]["memory_bytes"] > 0
+
+
+def test_placename_search():
+    """Test full-text placename and address search."""
+    res = placename_search("hellisheiði")
+    assert res[0]["nafn"] == "Hellisheiði"
+    assert len(res) == len({pn["id"] for pn in res})
+    # Placenames with the same name are ordered by precedence
+    same = [pn for pn in res if pn["nafn"] == "Hellisheiði"]
+    assert same[0]["lat_wgs84"] == 64.0221268
+    assert all("heiði" in pn["nafn"].lower() for pn in placename_search("HEIÐI", limit=20))
+    assert len(placename_search("fell", limit=5)) == 5
+    assert placename_search("Xyzzy") == []
+    # Too short for the full-text index, shortest names first
+    res = placename_search("ey", limit=10)
+    assert len(res) == 10 and all("ey" in pn["nafn"].lower() for pn in res)
+    assert [len(pn["nafn"]) for pn in res] == sorted(len(pn["nafn"]) for pn in res)
+    assert placename_search(" ") == []
+    # A negative limit means no limit, as in the lookup functions
+    everything = placename_search("fell", limit=-1)
+    assert len(everything) > 50
+    assert everything[:5] == placename_search("fell", limit=5)
+    assert placename_search("fell", limit=0) == []
+    assert placename_search("ey", limit=-1)[:10] == res
+
+    res = iceaddr_search("ldugöt")  # Dative case
+    assert res[0]["heiti_nf"] == "Öldugata"
+    assert "svfheiti" in res[0]
+    assert len(iceaddr_search("gata", limit=10)) == 10
+    assert iceaddr_search("Xyzzy") == []
+    everything = iceaddr_search("gata", limit=-1)
+    assert len(everything) > 50
+    assert everything[:10] == iceaddr_search("gata", limit=10)
+    assert iceaddr_search("gata", limit=0) == []
+
+
+def _pages(func: Callable[..., list[dict[str, Any]]], *args: Any, **kwargs: Any) -> list[Any]:
+    """Fetch all results of a lookup function, page by page."""
+    (res, page) = ([], func(*args, limit=40, **kwargs))
+    while page:
+        res.extend(page)
+        page = func(*args, limit=40, after=page[-1], **kwargs)
+    return res
+
+
+def test_pagination():
+    """Test paging through lookup results, and streaming them."""
+    expected = placename_lookup("Bakki")
+    assert len(expected) > 100
+    assert _pages(placename_lookup, "Bakki") == expected
+    assert placename_lookup("Bakki", limit=10, offset=20) == expected[20:30]
+    assert placename_lookup("Bakki", offset=len(expected)) == []
+    it = placename_lookup_iter("Bakki")
+    assert not isinstance(it, list)
+    assert next(it) == expected[0]
+    assert [expected[0], *it] == expected
+    assert _pages(placename_lookup, "kki", partial=True) == placename_lookup("kki", partial=True)
+
+    # Past the last match, there's no fallback to fuzzy matching
+    assert placename_lookup("Bakki", fuzzy=True, after=expected[-1]) == []
+    expected = placename_lookup("Hafnarfjordur", fuzzy=True)
+    assert expected
+    assert (
+        placename_lookup("Hafnarfjordur", fuzzy=True, limit=1, after=expected[0]) == expected[1:2]
+    )
 
-def test_in_iceland():
+    expected = iceaddr_lookup("Öldugata", limit=1000)
+    assert len(expected) > 100
+    assert _pages(iceaddr_lookup, "Öldugata") == expected
+    assert iceaddr_lookup("Öldugata", limit=10, offset=20) == expected[20:30]
+    assert list(iceaddr_lookup_iter("Öldugata")) == expected
+    assert _pages(iceaddr_lookup, "Oldugata", fuzzy=True) == expected
+
+    expected = iceaddr_suggest("Öldug", limit=1000)
+    assert len(expected) > 100
+    assert _pages(iceaddr_suggest, "Öldug") == expected
+    assert list(iceaddr_suggest_iter("Öldug")) == expected
+    assert list(iceaddr_suggest_iter("Ö")) == []
+
+    # Cursors are part of cache keys
+    enable_cache()
+    try:
+        assert _pages(iceaddr_suggest, "Öldug") == expected
+        assert _pages(iceaddr_suggest, "Öldug") == expected
+        assert cache_stats()["hits"] > 0
+    finally:
+        disable_cache()
+
+    for func in (placename_lookup, placename_lookup_iter, iceaddr_lookup, iceaddr_suggest_iter):
+        with pytest.raises(ValueError):
+            func("Öldugata", offset=-1)
+    assert iceaddr_lookup("Öldugata", limit=-1) == iceaddr_lookup("Öldugata", limit=1000)
+
+
+def test_in_iceland(monkeypatch: pytest.MonkeyPatch):
     """Test if coordinates are within Iceland."""
     assert in_iceland(ICELAND_COORDS)
+    assert in_iceland((64.1466, -21.9426))  # Reykjavík
+    assert in_iceland((66.5391, -18.0200))  # Grímsey
+    assert in_iceland((67.1350, -18.6900))  # Kolbeinsey
+    assert in_iceland((63.4030, -20.6020))  # Surtsey
+    assert in_iceland((61.0, -20.0))  # Icelandic waters
+    assert not in_iceland((58.9, -18.6))  # At sea, ~680 km away
+    assert not in_iceland((62.0, -6.8))  # Faroe Islands
+    assert not in_iceland((65.6, -37.6))  # Greenland
+    assert not in_iceland((0.0, 0.0))
+
+    # Legacy distance check
+    assert in_iceland((58.9, -18.6), km_radius=800.0)
+    assert not in_iceland((58.9, -18.6), km_radius=500.0)
+
+    lats = [64.1466, 61.0, 58.9, 62.0, float("nan")]
+    lons = [-21.9426, -20.0, -18.6, -6.8, -20.0]
+    assert list(in_iceland_many(lats, lons)) == [True, True, False, False, False]
+
+    # Same results without NumPy, whether or not it is installed
+    monkeypatch.setattr(geo, "_numpy", lambda: None)
+    assert in_iceland_many(lats, lons) == [True, True, False, False, False]
+    rnd = random.Random(1)
+    lats = [rnd.uniform(55.0, 72.0) for _ in range(500)]
+    lons = [rnd.uniform(-35.0, -3.0) for _ in range(500)]
+    assert in_iceland_many(lats, lons) == [in_iceland(p) for p in zip(lats, lons)]
+
+
+def test_distance_many():
+    """Test distance calculation for arrays of coordinates."""
+    origin = (64.1466, -21.9426)
+    lats = [65.6835, 63.4186, None, 0.0, float("nan"), 64.1466]
+    lons = [-18.1002, -19.0060, -21.0, -21.0, -21.0, -21.9426]
+    dists = list(distance_many(origin, lats, lons))
+    for lat, lon, d in zip(lats[:2], lons[:2], dists[:2]):
+        assert d == pytest.approx(distance(origin, (lat, lon)))
+    assert dists[2:5] == [float("inf")] * 3
+    assert dists[5] == pytest.approx(0.0)
+    assert list(distance_many((0.0, 0.0), lats, lons)) == [float("inf")] * len(lats)
+    assert len(distance_many(origin, [], [])) == 0
+    with pytest.raises(ValueError):
+        distance_many(origin, [64.0], [])
+
+    points = list(zip(lats[:2], lons[:2]))
+    matrix = distance_matrix([origin, *points], points)
+    assert len(matrix) == 3
+    assert list(matrix[0]) == pytest.approx(dists[:2])
+    assert matrix[1][0] == pytest.approx(0.0)
+    assert matrix[1][1] == pytest.approx(distance(points[0], points[1]))
+
+
+def test_geo_imports_numpy_lazily():
+    """Test that NumPy is only imported when a vectorized function needs it."""
+    code = """
+import sys
+import iceaddr.geo
+assert "numpy" not in sys.modules, "numpy"
+iceaddr.geo.distance_many((64.1, -21.9), [64.2], [-21.8])
+"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
 
 
 def test_valid_wgs84_coord():
@@ -400,6 +877,227 @@ def test_nearest_with_dist_max_dist():
         assert dist <= 1.0
 
 
+def test_nearest_is_exact():
+    """Test that nearest lookups agree with a brute-force search, both in
+    dense urban areas and in the empty highlands."""
+    points = [
+        OLDUGATA_4_COORDS,
+        (65.6835, -18.0878),
+        (64.75, -18.0),
+        (63.4, -16.5),
+        (66.34146202544589, -20.50809222436415),
+    ]
+    for table, func in (
+        ("stadfong", nearest_addr_with_dist),
+        ("ornefni", nearest_placenames_with_dist),
+    ):
+        rows = list(
+            shared_db.connection().execute(
+                f"SELECT lat_wgs84, long_wgs84 FROM {table} WHERE lat_wgs84 IS NOT NULL"
+            )
+        )
+        for lat, lon in points:
+            expected = sorted(
+                distance((lat, lon), (r["lat_wgs84"], r["long_wgs84"])) for r in rows
+            )[:10]
+            results = func(lat, lon, limit=10)
+            assert [d for _, d in results] == pytest.approx(expected)
+
+    # Same results for batches, in which points close together share their
+    # R-Tree queries, grouped by fine grid cell in Reykjavík and by coarse
+    # grid cell in the highlands
+    rnd = random.Random(2)
+    batch = [(64.14 + rnd.uniform(0, 0.02), -21.95 + rnd.uniform(0, 0.04)) for _ in range(40)]
+    batch += [(64.71 + rnd.uniform(0, 0.08), -18.09 + rnd.uniform(0, 0.08)) for _ in range(5)]
+    for limit, max_dist in ((1, 0.0), (3, 0.0), (3, 5.0)):
+        expected_batch = [
+            nearest_addr_with_dist(lat, lon, limit=limit, max_dist=max_dist) for lat, lon in batch
+        ]
+        assert nearest_addr_batch_with_dist(batch, limit=limit, max_dist=max_dist) == expected_batch
+
+
+def test_nearest_memory_engine():
+    """Test that the in-memory nearest engine gives the same results as SQLite."""
+    points = [FISKISLOD_31_COORDS, OLDUGATA_4_COORDS, (64.75, -18.0)]
+    expected = [nearest_addr_with_dist(lat, lon, limit=5) for lat, lon in points]
+    expected_pn = [nearest_placenames(lat, lon, limit=3) for lat, lon in points]
+
+    set_nearest_engine("memory")
+    try:
+        assert [nearest_addr_with_dist(lat, lon, limit=5) for lat, lon in points] == expected
+        assert [nearest_placenames(lat, lon, limit=3) for lat, lon in points] == expected_pn
+        assert nearest_addr_batch_with_dist(points, limit=5) == expected
+        assert nearest_addr(FISKISLOD_31_COORDS[0], FISKISLOD_31_COORDS[1], max_dist=0.001) == []
+    finally:
+        set_nearest_engine("sqlite")
+
+    stats = grid_index_stats()
+    assert stats["stadfong"]["points"] > 0
+    assert stats["stadfong"]["memory_bytes"] > 0
+    assert stats["stadfong"]["build_time"] > 0
+
+    with pytest.raises(ValueError):
+        set_nearest_engine("blergh")
+
+
+def test_nearest_grid(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    """Test nearest address lookups using a precomputed grid, built
+    for a copy of the database with only addresses in Reykjavík."""
+    conn = sqlite3.connect(tmp_path / "grid.db", check_same_thread=False)
+    shared_db.connection().backup(conn)
+    conn.execute("DELETE FROM stadfong WHERE NOT lat_wgs84 BETWEEN 64.12 AND 64.16")
+    conn.execute("DELETE FROM stadfong_rtree WHERE id NOT IN (SELECT hnitnum FROM stadfong)")
+    stats = build_grid(conn, cell_size=0.001, max_dist=0.3)
+    assert stats["cells"] > 0
+    assert stats["candidates"] >= stats["cells"]
+
+    conn.row_factory = sqlite3.Row
+    monkeypatch.setattr(shared_db, "connection", lambda: conn)
+    monkeypatch.setattr(grid, "_cell_size", None)
+    assert grid.grid_cell_size() == 0.001
+
+    # Same results as regular nearest-neighbor search
+    rnd = random.Random(1)
+    num_covered = 0
+    for _ in range(200):
+        (lat, lon) = (rnd.uniform(64.11, 64.17), rnd.uniform(-22.0, -21.8))
+        covered = grid.grid_nearest(lat, lon) is not None
+        num_covered += covered
+        expected = find_nearest(lat, lon, "stadfong_rtree", "stadfong", "hnitnum")
+        assert [d for _, d in nearest_addr_with_dist(lat, lon)] == [d for _, d in expected]
+    assert 0 < num_covered < 200
+
+    (lat, lon) = OLDUGATA_4_COORDS
+    addr_dist = grid.grid_nearest(lat, lon)[0]
+    (addr, _) = grid.grid_nearest(lat, lon, post_process=postprocess_addr)[0]
+    assert (addr["heiti_nf"], addr["husnr"], addr["stadur_nf"]) == ("Öldugata", 4, "Reykjavík")
+    assert grid.grid_nearest(lat + 0.0005, lon, max_dist=0.001) == []
+    assert grid.grid_nearest(66.0, -16.0) is None  # Not covered
+
+    # Without commit, the new grid can be rolled back with other changes
+    build_grid(conn, cell_size=0.002, max_dist=0.3, commit=False)
+    conn.rollback()
+    value = conn.execute("SELECT value FROM metadata WHERE key='grid_cell_size'").fetchone()[0]
+    assert float(value) == 0.001
+    assert grid.grid_nearest(lat, lon) == [addr_dist]
+
+    # Addresses deleted since the grid was built are looked up without it
+    conn.execute("DELETE FROM stadfong WHERE hnitnum=?", (addr["hnitnum"],))
+    conn.execute("DELETE FROM stadfong_rtree WHERE id=?", (addr["hnitnum"],))
+    assert grid.grid_nearest(lat, lon) is None
+    assert nearest_addr(lat, lon)[0]["hnitnum"] != addr["hnitnum"]
+
+
+def test_snapshot(tmp_path: Path):
+    """Test lookups served from a binary snapshot of the database."""
+    path = tmp_path / "iceaddr.snapshot"
+    stats = write_snapshot(shared_db.connection(), path)
+    assert stats["addresses"] > 0 and stats["placenames"] > 0
+    assert path.stat().st_size == stats["bytes"]
+
+    snap = open_snapshot(path)
+    try:
+        assert snap.metadata()["date_created"] == iceaddr_metadata()["date_created"].isoformat()
+
+        # Same results as from the database
+        for args in (
+            ("Öldugata", 4, None, None, "Reykjavík"),
+            ("öldugötu", 12, None, None, "hafnarfirði"),
+            ("Brattagata", 4, "B", None, None),
+            ("Tómasarhaga", 12, None, 107, None),
+            ("Öldugata", None, None, None, None),
+            ("Blergh", None, None, None, None),
+        ):
+            assert snap.iceaddr_lookup(*args, limit=1000) == iceaddr_lookup(*args, limit=1000)
+
+        for pn in ("Meðalfellsvatn", "Hellisheiði", "Blergh"):
+            assert snap.placename_lookup(pn) == placename_lookup(pn)
+        for pn in ("egilssta", "fell"):
+            assert snap.placename_lookup(pn, partial=True) == placename_lookup(pn, partial=True)
+
+        rnd = random.Random(1)
+        for _ in range(200):
+            (lat, lon) = (rnd.uniform(63.3, 66.5), rnd.uniform(-24.0, -13.5))
+            (limit, max_dist) = (rnd.choice([1, 3, 10]), rnd.choice([0.0, 2.0]))
+            expected = nearest_addr_with_dist(lat, lon, limit=limit, max_dist=max_dist)
+            res = snap.nearest_addr_with_dist(lat, lon, limit=limit, max_dist=max_dist)
+            assert [d for _, d in res] == pytest.approx([d for _, d in expected])
+        assert snap.nearest_addr(*OLDUGATA_4_COORDS) == nearest_addr(*OLDUGATA_4_COORDS)
+
+        with pytest.raises(ValueError):
+            snap.nearest_addr(100.0, 0.0)
+    finally:
+        snap.close()
+
+    path.write_bytes(b"blergh" * 10)
+    with pytest.raises(ValueError):
+        open_snapshot(path)
+
+    # Addresses with a NULL suffix are ordered as if it were empty
+    conn = sqlite3.connect(":memory:")
+    shared_db.connection().backup(conn)
+    conn.execute("UPDATE stadfong SET vidsk=NULL WHERE heiti_nf='Öldugata' AND hnitnum % 2 = 0")
+    conn.execute("UPDATE stadfong SET vidsk='4-6' WHERE heiti_nf='Öldugata' AND hnitnum % 3 = 0")
+    write_snapshot(conn, path)
+    snap = open_snapshot(path)
+    try:
+        res = snap.iceaddr_lookup("Öldugata", limit=1000)
+        suffixes = [bool(a["vidsk"]) for a in res]
+        assert None in [a["vidsk"] for a in res] and True in suffixes
+        assert suffixes == sorted(suffixes)
+    finally:
+        snap.close()
+
+    # Section names that don't fit in the directory are rejected
+    try:
+        conn.execute("ALTER TABLE ornefni ADD COLUMN alternative_spelling TEXT")
+        with pytest.raises(ValueError, match="ornefni.alternative_spelling"):
+            write_snapshot(conn, path)
+    finally:
+        conn.close()
+
+
+def test_nearest_addr_batch():
+    """Test batch nearest address lookup."""
+    coords = [FISKISLOD_31_COORDS, OLDUGATA_4_COORDS, FISKISLOD_31_COORDS]
+    results = nearest_addr_batch(coords, limit=3)
+    assert len(results) == len(coords)
+
+    # Results are in input order and match single lookups
+    for (lat, lon), res in zip(coords, results):
+        assert res == nearest_addr(lat, lon, limit=3)
+    assert results[0][0]["heiti_nf"] == "Fiskislóð"
+    assert results[1][0]["heiti_nf"] == "Öldugata"
+
+    # Results for the same point are independent copies
+    results[0][0]["heiti_nf"] = "Blergh"
+    assert results[2][0]["heiti_nf"] == "Fiskislóð"
+
+    with_dist = nearest_addr_batch_with_dist(coords, max_dist=0.001)
+    assert with_dist == [[], [], []]
+
+    assert nearest_addr_batch([]) == []
+    with pytest.raises(ValueError):
+        nearest_addr_batch([OLDUGATA_4_COORDS, (100.0, 0.0)])
+
+
+def test_nearest_batch_processes(monkeypatch: pytest.MonkeyPatch):
+    """Test batch nearest lookups split between worker processes."""
+    from iceaddr import nearest
+
+    monkeypatch.setattr(nearest, "PROCESS_CHUNK_SIZE", 50)
+    rnd = random.Random(1)
+    coords = [(rnd.uniform(63.5, 66.5), rnd.uniform(-23.5, -14.0)) for _ in range(300)]
+
+    assert nearest_addr_batch(coords, limit=2, processes=2) == nearest_addr_batch(coords, limit=2)
+    assert nearest_placenames_batch_with_dist(coords, processes=2) == [
+        nearest_placenames_with_dist(lat, lon) for lat, lon in coords
+    ]
+    assert nearest_placenames_batch(coords[:2]) == [nearest_placenames(*c) for c in coords[:2]]
+    with pytest.raises(ValueError):
+        nearest_placenames_batch(coords, processes=0)
+
+
 def test_metadata():
     """Test database metadata function."""
     metadata = iceaddr_metadata()
@@ -416,3 +1114,177 @@ def test_metadata():
     assert date_created <= now
     project_start = datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc)
     assert date_created >= project_start
+
+
+# Budget for "import iceaddr", in microseconds. Importing all submodules
+# eagerly took around 50 ms, lazy importing takes less than 10 ms.
+IMPORT_TIME_BUDGET = 30000
+
+
+def test_import_time():
+    """Test that importing the package is fast and doesn't load submodules."""
+    code = """
+import sys
+import iceaddr
+from iceaddr import distance, MUNICIPALITIES
+assert "sqlite3" not in sys.modules, "sqlite3"
+assert "iceaddr.postcodes" not in sys.modules, "iceaddr.postcodes"
+assert "iceaddr.db" not in sys.modules, "iceaddr.db"
+assert isinstance(iceaddr.__version__, str)
+assert iceaddr.postcodes_for_placename("Reykj", partial=True)
+assert "sqlite3" not in sys.modules, "sqlite3 after postcode lookup"
+assert "iceaddr.fuzzy" not in sys.modules, "iceaddr.fuzzy after postcode lookup"
+"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines are "import time: self [us] | cumulative | imported package"
+    times = [
+        int(m.group(1))
+        for m in re.finditer(
+            r"^import time:\s+\d+ \|\s+(\d+) \| iceaddr$", proc.stderr, re.MULTILINE
+        )
+    ]
+    assert len(times) == 1
+    assert times[0] < IMPORT_TIME_BUDGET
+
+
+def test_aio():
+    """Test asyncio versions of lookup functions."""
+
+    async def run() -> None:
+        res = await aio.iceaddr_lookup("Öldugata", number=4, postcode=101)
+        assert res == iceaddr_lookup("Öldugata", number=4, postcode=101)
+
+        res = await aio.nearest_addr(OLDUGATA_4_COORDS[0], OLDUGATA_4_COORDS[1], limit=3)
+        assert res == nearest_addr(OLDUGATA_4_COORDS[0], OLDUGATA_4_COORDS[1], limit=3)
+
+        assert await aio.placename_lookup("Meðalfellsvatn") == placename_lookup("Meðalfellsvatn")
+        assert "date_created" in await aio.iceaddr_metadata()
+        assert await aio.iceaddr_search("ldugöt") == iceaddr_search("ldugöt")
+        assert await aio.placename_search("heiði", limit=5) == placename_search("heiði", limit=5)
+        assert await aio.street_name_suggest("Öldug") == street_name_suggest("Öldug")
+        addrs = ["Öldugata 4, 101", "Xyzzystræti 3", "Öldugata 4", "Öldugata 4, 101"]
+        assert [r async for r in aio.geocode(addrs, chunk_size=3)] == list(geocode(addrs))
+
+        # Many concurrent lookups
+        results = await asyncio.gather(*[aio.iceaddr_suggest("Öldugata 4") for _ in range(200)])
+        assert all(r == results[0] for r in results)
+
+        # Cancelled lookups don't break subsequent ones
+        tasks = [asyncio.create_task(aio.iceaddr_suggest("Öldu")) for _ in range(50)]
+        await asyncio.sleep(0)
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert await aio.iceaddr_suggest("Öldugata 4") == results[0]
+
+        with pytest.raises(ValueError):
+            await aio.nearest_addr(100.0, 0.0)
+
+    aio.configure(max_workers=2, max_concurrency=8)
+    try:
+        asyncio.run(run())
+    finally:
+        aio.configure(
+            max_workers=aio.DEFAULT_MAX_WORKERS, max_concurrency=aio.DEFAULT_MAX_CONCURRENCY
+        )
+        aio.shutdown()
+
+
+def test_data_change():
+    """Test that indexes loaded into memory are rebuilt when the database
+    changes, e.g. its data version after an incremental update."""
+    from iceaddr import fuzzy, grid, memindex, meta, streets
+
+    suggestions = street_name_suggest("Öldug")
+    indexes = (
+        streets.street_index(),
+        fuzzy.fuzzy_index("streets"),
+        memindex.grid_index("stadfong", "hnitnum"),
+    )
+    cell_size = grid.grid_cell_size()
+
+    # Kept as long as the database is the same
+    meta._checked = None
+    assert streets.street_index() is indexes[0]
+    assert grid._cell_size == cell_size
+
+    assert meta._version is not None
+    (date_created, _) = meta._version
+    meta._version = (date_created, "0")
+    meta._checked = None
+    assert street_name_suggest("Öldug") == suggestions
+    assert grid._cell_size is None
+    assert streets.street_index() is not indexes[0]
+    assert fuzzy.fuzzy_index("streets") is not indexes[1]
+    assert memindex.grid_index("stadfong", "hnitnum") is not indexes[2]
+    assert grid.grid_cell_size() == cell_size
+
+
+def test_cache():
+    """Test caching of lookup results."""
+    assert cache_stats() == {}
+    enable_cache(max_entries=2)
+    try:
+        res = iceaddr_lookup("Öldugata", number=4, postcode=101)
+        assert iceaddr_lookup("Öldugata", 4, postcode=101) == res
+        assert iceaddr_lookup("Öldugata", number=4, postcode=101, limit=50) == res
+        assert cache_stats()["hits"] == 2
+        assert cache_stats()["misses"] == 1
+
+        # Arguments are normalized as the functions themselves do
+        assert iceaddr_lookup("öldugata ", number=4, postcode=101) == res
+        assert cache_stats()["hits"] == 3
+        enable_cache(max_entries=2)
+        iceaddr_lookup("Öldugata", placename="Reykjavík")
+        iceaddr_lookup(" öldugata", placename="reykjavik ")
+        iceaddr_search("ÖLDUGÖT")
+        assert iceaddr_search("öldugöt ") == iceaddr_search("ÖLDUGÖT")
+        assert cache_stats()["misses"] == 2
+        # ...but not beyond it, placename_lookup() doesn't strip or ignore case
+        names = ("Bakki", "Bakki ", " Bakki", "bakki")
+        disable_cache()
+        uncached = [placename_lookup(name) for name in names]
+        assert uncached[0] != uncached[1]
+        enable_cache(max_entries=5)
+        assert [placename_lookup(name) for name in names] == uncached
+        enable_cache(max_entries=2)
+
+        # Modifying a returned result doesn't affect the cache
+        iceaddr_lookup("Öldugata", number=4, postcode=101)[0]["postnr"] = 999
+        assert iceaddr_lookup("Öldugata", number=4, postcode=101) == res
+
+        assert placename_lookup("Meðalfellsvatn") == placename_lookup("Meðalfellsvatn")
+        iceaddr_suggest("Öldugata 4")
+        assert cache_stats()["entries"] == 2
+        assert cache_stats()["evictions"] == 1
+
+        clear_cache()
+        assert cache_stats()["entries"] == 0
+        assert iceaddr_lookup("Öldugata", number=4, postcode=101) == res
+
+        # Cache is cleared when the database creation date changes...
+        from iceaddr import meta
+
+        meta.check_data_version()
+        assert meta._version is not None
+        (date_created, data_version) = meta._version
+        meta._version = (datetime.datetime(2000, 1, 1), data_version)
+        meta._checked = None
+        assert iceaddr_lookup("Öldugata", number=4, postcode=101) == res
+        assert cache_stats()["invalidations"] == 1
+        assert cache_stats()["entries"] == 1
+
+        # ...and when the data version changes after an incremental update
+        meta._version = (date_created, "0")
+        meta._checked = None
+        assert iceaddr_lookup("Öldugata", number=4, postcode=101) == res
+        assert cache_stats()["invalidations"] == 2
+    finally:
+        disable_cache()